@@ -0,0 +1,245 @@
+"""
+In-cluster cache for tank snapshots.
+
+    GET /snapshots/<key>/<name>?origin=<url>   a snapshot, fetched from <url> on first request
+    GET /snapshots/<key>/<name>                a snapshot uploaded with `store <key>`
+    GET /stats                                 hit counts and bytes served, as JSON
+
+Each snapshot is fetched from its origin once, however many tanks ask for it at the same time:
+the first request downloads it and concurrent requests wait for that download. Cached snapshots
+are served with sendfile and support single range requests.
+
+    python snapshot-cache.py serve             run the server
+    python snapshot-cache.py store <key>       cache stdin as <key>, e.g. through `kubectl exec -i`
+    python snapshot-cache.py stats             print the running server's stats
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+CACHE_DIR = os.environ.get("CACHE_DIR", "/cache")
+PORT = int(os.environ.get("PORT", "8080"))
+# Seconds to wait for an origin to start responding
+ORIGIN_TIMEOUT = float(os.environ.get("ORIGIN_TIMEOUT", "60"))
+COPY_BUFFER = 1 << 20
+
+KEY_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def origin_key(url):
+    """The key a snapshot fetched from `url` is cached as, shared with warnet deploy"""
+    return hashlib.sha256(url.encode()).hexdigest()[:32]
+
+
+def cache_path(key):
+    return os.path.join(CACHE_DIR, key)
+
+
+def store(key, source):
+    """Write a snapshot into the cache atomically, returning its size"""
+    partial = os.path.join(CACHE_DIR, f".{key}.{os.getpid()}.{threading.get_ident()}.part")
+    try:
+        with open(partial, "wb") as f:
+            shutil.copyfileobj(source, f, COPY_BUFFER)
+        os.replace(partial, cache_path(key))
+    except BaseException:
+        if os.path.exists(partial):
+            os.unlink(partial)
+        raise
+    return os.path.getsize(cache_path(key))
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.snapshots = {}
+
+    def record(self, key, name, **counts):
+        with self.lock:
+            entry = self.snapshots.setdefault(
+                key,
+                {
+                    "name": name,
+                    "requests": 0,
+                    "hits": 0,
+                    "coalesced": 0,
+                    "misses": 0,
+                    "origin_bytes": 0,
+                    "served_bytes": 0,
+                },
+            )
+            for field, n in counts.items():
+                entry[field] += n
+
+    def snapshot(self):
+        with self.lock:
+            snapshots = {key: dict(entry) for key, entry in self.snapshots.items()}
+        totals = {
+            field: sum(entry[field] for entry in snapshots.values())
+            for field in ("requests", "hits", "coalesced", "misses", "origin_bytes", "served_bytes")
+        }
+        served = totals["hits"] + totals["coalesced"]
+        totals["hit_rate"] = served / (served + totals["misses"]) if served else 0.0
+        return {"uptime": time.time() - self.started, **totals, "snapshots": snapshots}
+
+
+class Fetcher:
+    """Download each snapshot from its origin once, however many requests want it"""
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.lock = threading.Lock()
+        self.inflight = {}
+
+    def get(self, key, name, origin):
+        """Make sure `key` is cached, returning "hits", "coalesced" or "misses" """
+        if os.path.exists(cache_path(key)):
+            return "hits"
+        with self.lock:
+            if os.path.exists(cache_path(key)):
+                return "hits"
+            waiter = self.inflight.get(key)
+            if waiter is None:
+                waiter = self.inflight[key] = {"done": threading.Event(), "error": None}
+                fetching = True
+            else:
+                fetching = False
+        if not fetching:
+            waiter["done"].wait()
+            if waiter["error"]:
+                raise RuntimeError(waiter["error"])
+            return "coalesced"
+        try:
+            start = time.monotonic()
+            with urllib.request.urlopen(origin, timeout=ORIGIN_TIMEOUT) as response:
+                size = store(key, response)
+            self.stats.record(key, name, origin_bytes=size)
+            log(f"fetched {name} ({size} bytes) in {time.monotonic() - start:.1f}s from {origin}")
+            return "misses"
+        except Exception as e:
+            waiter["error"] = f"fetching {origin} failed: {e}"
+            raise RuntimeError(waiter["error"]) from e
+        finally:
+            with self.lock:
+                del self.inflight[key]
+            waiter["done"].set()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "warnet-snapshot-cache"
+
+    def do_HEAD(self):
+        self.do_GET(body=False)
+
+    def do_GET(self, body=True):
+        url = urlsplit(self.path)
+        if url.path in ("/live", "/ready"):
+            return self.send_json({"ok": True}, body)
+        if url.path == "/stats":
+            return self.send_json(self.server.stats.snapshot(), body)
+        parts = url.path.strip("/").split("/")
+        if len(parts) != 3 or parts[0] != "snapshots" or not KEY_PATTERN.match(parts[1]):
+            return self.send_error(404)
+        key, name = parts[1], parts[2]
+        origin = parse_qs(url.query).get("origin", [None])[0]
+        if origin is not None and origin_key(origin) != key:
+            return self.send_error(400, "Key does not match origin")
+        if origin is None and not os.path.exists(cache_path(key)):
+            return self.send_error(404, "Not cached and no origin given")
+
+        try:
+            outcome = self.server.fetcher.get(key, name, origin)
+        except Exception as e:
+            log(str(e))
+            return self.send_error(502, str(e))
+        self.server.stats.record(key, name, requests=1, **{outcome: 1})
+        self.send_snapshot(key, name, body)
+
+    def send_snapshot(self, key, name, body):
+        with open(cache_path(key), "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            start, end = 0, size - 1
+            status = 200
+            match = RANGE_PATTERN.match(self.headers.get("Range", "").replace(" ", ""))
+            if match and any(match.groups()):
+                first, last = match.groups()
+                if first:
+                    start, end = int(first), min(int(last), size - 1) if last else size - 1
+                else:
+                    start = max(size - int(last), 0)
+                if start > end or start >= size:
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{size}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                status = 206
+            length = end - start + 1
+            self.send_response(status)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(length))
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("ETag", f'"{key}"')
+            if status == 206:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            self.end_headers()
+            if body and length:
+                self.connection.sendfile(f, start, length)
+                self.server.stats.record(key, name, served_bytes=length)
+
+    def send_json(self, data, body=True):
+        payload = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        if body:
+            self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        # Probes would drown out everything else
+        if not self.path.startswith(("/live", "/ready")):
+            log(f"{self.address_string()} {format % args}")
+
+
+def log(message):
+    print(f"{time.strftime('%Y-%m-%dT%H:%M:%S')} {message}", flush=True)
+
+
+def serve():
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    server = ThreadingHTTPServer(("", PORT), Handler)
+    server.daemon_threads = True
+    server.stats = Stats()
+    server.fetcher = Fetcher(server.stats)
+    log(f"Serving snapshots from {CACHE_DIR} on port {PORT}")
+    server.serve_forever()
+
+
+def main(args):
+    if args[:1] == ["serve"]:
+        serve()
+    elif args[:1] == ["store"] and len(args) == 2 and KEY_PATTERN.match(args[1]):
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        print(store(args[1], sys.stdin.buffer))
+    elif args[:1] == ["stats"]:
+        with urllib.request.urlopen(f"http://127.0.0.1:{PORT}/stats", timeout=10) as response:
+            print(response.read().decode())
+    else:
+        sys.exit(__doc__)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -13,8 +13,8 @@ from warnet.constants import LIGHTNING_MISSION, PLUGIN_ANNEX, AnnexMember, HookV
 from warnet.k8s import (
     download,
     get_default_namespace,
+    get_exec_client,
     get_mission,
-    get_static_client,
     wait_for_init,
     write_file_to_container,
 )
@@ -182,7 +182,7 @@ def _generate_activity_json(activity: Optional[list[dict]]) -> str:
 def _sh(pod, method: str, params: tuple[str, ...]) -> str:
     namespace = get_default_namespace()
 
-    sclient = get_static_client()
+    sclient = get_exec_client()
     if params:
         cmd = [method]
         cmd.extend(params)
@@ -1,6 +1,9 @@
 import argparse
+import asyncio
 import base64
 import configparser
+import decimal
+import http.client
 import json
 import logging
 import os
@@ -10,12 +13,18 @@ import signal
 import sys
 import tempfile
 import threading
+import urllib.parse
 from time import sleep
-from typing import Dict
+from typing import Dict, List, Tuple
 
 from kubernetes import client, config
+from ln_framework.http_pool import ConnectionPool
 from ln_framework.ln import LND
-from test_framework.authproxy import AuthServiceProxy
+from test_framework.authproxy import (
+    AuthServiceProxy,
+    JSONRPCException,
+    serialization_fallback,
+)
 from test_framework.p2p import NetworkThread
 from test_framework.test_framework import (
     TMPDIR_PREFIX,
@@ -29,61 +38,266 @@ from test_framework.util import PortSeed, get_rpc_proxy
 with open("/var/run/secrets/kubernetes.io/serviceaccount/namespace") as f:
     NAMESPACE = f.read().strip()
 
-# Get the in-cluster k8s client to determine what we have access to
-config.load_incluster_config()
-sclient = client.CoreV1Api()
-
-try:
-    # An admin with cluster access can list everything.
-    # A wargames player with namespaced access will get a FORBIDDEN error here
-    pods = sclient.list_pod_for_all_namespaces()
-    cmaps = sclient.list_config_map_for_all_namespaces()
-except Exception:
-    # Just get whatever we have access to in this namespace only
-    pods = sclient.list_namespaced_pod(namespace=NAMESPACE)
-    cmaps = sclient.list_namespaced_config_map(namespace=NAMESPACE)
-
-WARNET = {"tanks": [], "lightning": [], "channels": []}
-for pod in pods.items:
-    if "mission" not in pod.metadata.labels:
-        continue
-
-    if pod.metadata.labels["mission"] == "tank":
-        WARNET["tanks"].append(
-            {
-                "tank": pod.metadata.name,
-                "chain": pod.metadata.labels["chain"],
-                "rpc_host": pod.status.pod_ip,
-                "rpc_port": int(pod.metadata.labels["RPCPort"]),
-                "rpc_user": "user",
-                "rpc_password": pod.metadata.labels["rpcpassword"],
-                "init_peers": pod.metadata.annotations["init_peers"],
-            }
-        )
-
-    if pod.metadata.labels["mission"] == "lightning":
-        WARNET["lightning"].append(pod.metadata.name)
+# Written by `warnet run`: the network as it was when the scenario was started
+TOPOLOGY_FILE = "/topology/topology.json"
+# Only warnet's own pods and ConfigMaps are listed, not everything in the cluster
+MISSION_SELECTOR = "mission in (tank,lightning)"
+CHANNELS_SELECTOR = "channels=true"
+
+_warnet = None
+_warnet_lock = threading.Lock()
+
+
+def get_warnet() -> dict:
+    """
+    The tanks, lightning nodes and channels this commander can reach, found on first use: read
+    from the topology `warnet run` passed in, or else listed from the cluster
+    """
+    global _warnet
+    with _warnet_lock:
+        if _warnet is None:
+            if os.path.exists(TOPOLOGY_FILE):
+                with open(TOPOLOGY_FILE) as f:
+                    _warnet = json.load(f)
+            else:
+                _warnet = discover_warnet()
+        return _warnet
+
+
+def discover_warnet() -> dict:
+    # Get the in-cluster k8s client to determine what we have access to
+    config.load_incluster_config()
+    sclient = client.CoreV1Api()
+
+    try:
+        # An admin with cluster access can list everything.
+        # A wargames player with namespaced access will get a FORBIDDEN error here
+        pods = sclient.list_pod_for_all_namespaces(label_selector=MISSION_SELECTOR)
+        cmaps = sclient.list_config_map_for_all_namespaces(label_selector=CHANNELS_SELECTOR)
+    except Exception:
+        # Just get whatever we have access to in this namespace only
+        pods = sclient.list_namespaced_pod(NAMESPACE, label_selector=MISSION_SELECTOR)
+        cmaps = sclient.list_namespaced_config_map(NAMESPACE, label_selector=CHANNELS_SELECTOR)
+
+    warnet = {"tanks": [], "lightning": [], "channels": []}
+    for pod in pods.items:
+        if pod.metadata.labels["mission"] == "tank":
+            warnet["tanks"].append(
+                {
+                    "tank": pod.metadata.name,
+                    "chain": pod.metadata.labels["chain"],
+                    "rpc_host": pod.status.pod_ip,
+                    "rpc_port": int(pod.metadata.labels["RPCPort"]),
+                    "rpc_user": "user",
+                    "rpc_password": pod.metadata.labels["rpcpassword"],
+                    "init_peers": pod.metadata.annotations["init_peers"],
+                }
+            )
 
-for cm in cmaps.items:
-    if not cm.metadata.labels or "channels" not in cm.metadata.labels:
-        continue
-    channel_jsons = json.loads(cm.data["channels"])
-    for channel_json in channel_jsons:
-        channel_json["source"] = cm.data["source"]
-        WARNET["channels"].append(channel_json)
+        if pod.metadata.labels["mission"] == "lightning":
+            warnet["lightning"].append(pod.metadata.name)
+
+    for cm in cmaps.items:
+        channel_jsons = json.loads(cm.data["channels"])
+        for channel_json in channel_jsons:
+            channel_json["source"] = cm.data["source"]
+            warnet["channels"].append(channel_json)
+    return warnet
+
+
+# Idle keep-alive connections kept per tank, and how long one may sit idle before it is closed.
+# bitcoind drops connections idle for longer than -rpcservertimeout (30s by default).
+RPC_POOL_SIZE = 8
+RPC_POOL_IDLE_TIMEOUT = 15
+# Attempts to send a request to a tank, e.g. while it can't be connected to, and the first
+# pause between them
+RPC_CONNECT_ATTEMPTS = 3
+RPC_CONNECT_BACKOFF = 0.5
+
+_rpc_pools: Dict[Tuple[str, str, int], ConnectionPool] = {}
+_rpc_pools_lock = threading.Lock()
+
+
+def get_rpc_pool(url: urllib.parse.ParseResult) -> ConnectionPool:
+    key = (url.scheme, url.hostname, url.port or (443 if url.scheme == "https" else 80))
+    with _rpc_pools_lock:
+        if key not in _rpc_pools:
+            _rpc_pools[key] = ConnectionPool(*key, RPC_POOL_SIZE, RPC_POOL_IDLE_TIMEOUT)
+        return _rpc_pools[key]
+
+
+def pooled_request(self, method, path, postdata):
+    """
+    AuthServiceProxy's single connection isn't thread-safe, so each request borrows one from the
+    tank's pool instead. Scenarios call tanks from many threads at once.
+    """
+    pool = get_rpc_pool(self._AuthServiceProxy__url)
+    for attempt in range(RPC_CONNECT_ATTEMPTS):
+        conn = pool.acquire(self.timeout)
+        # A copy of the proxy that uses the borrowed connection, so threads sharing the proxy
+        # don't share a connection
+        call = object.__new__(AuthServiceProxy)
+        call.__dict__.update(self.__dict__)
+        call._AuthServiceProxy__conn = conn
+        try:
+            response = AuthServiceProxy.oldrequest(call, method, path, postdata)
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            # Once the request is sent bitcoind may have run it, even if the connection then
+            # fails, and a call like sendtoaddress mustn't run twice. Only a request that
+            # didn't get out, e.g. because the tank can't be connected to, is sent again.
+            if conn.sent or attempt == RPC_CONNECT_ATTEMPTS - 1:
+                raise
+            sleep(RPC_CONNECT_BACKOFF * 2**attempt)
+            continue
+        except BaseException:
+            conn.close()
+            raise
+        pool.release(conn)
+        return response
 
 
-# Ensure that all RPC calls are made with brand new http connections
-def auth_proxy_request(self, method, path, postdata):
-    self._set_conn()  # creates new http client connection
-    return self.oldrequest(method, path, postdata)
+AuthServiceProxy.oldrequest = AuthServiceProxy._request
+AuthServiceProxy._request = pooled_request
+
+
+# Requests the async API keeps in flight to one tank at a time. bitcoind serves RPCs with
+# -rpcthreads workers (4 by default) and queues at most -rpcworkqueue more.
+ASYNC_RPC_CONCURRENCY = 4
+
+
+class AsyncRPC:
+    """
+    RPC client for one tank on an asyncio event loop, usually the NetworkThread's:
+    `await anode.getblockcount()`, or several calls in one JSON-RPC batch with
+    `await anode.batch([("getblockcount",), ("getblockhash", 0)])`. At most
+    ASYNC_RPC_CONCURRENCY requests are in flight at once, each on a keep-alive connection.
+    """
+
+    def __init__(self, url: str, timeout: float = 60, path: str = "/", _shared=None):
+        self.url = urllib.parse.urlparse(url)
+        self.timeout = timeout
+        self.path = path
+        auth = f"{self.url.username}:{self.url.password}".encode()
+        self.auth_header = "Basic " + base64.b64encode(auth).decode()
+        # Wallet clients share the tank's connections and limit
+        self._shared = _shared or {"idle": [], "limit": None, "id": 0}
+
+    def __getattr__(self, name):
+        if name.startswith("__") and name.endswith("__"):
+            raise AttributeError(name)
+
+        async def call(*params):
+            return await self.call(name, *params)
+
+        return call
+
+    def wallet(self, name: str) -> "AsyncRPC":
+        path = f"/wallet/{urllib.parse.quote(name)}"
+        return AsyncRPC(self.url.geturl(), self.timeout, path, self._shared)
+
+    async def call(self, method: str, *params):
+        response = await self._post(self._request(method, params))
+        return self._result(response)
+
+    async def batch(self, calls: List[tuple]) -> list:
+        """Results of `(method, *params)` calls, in order, sent as one request"""
+        requests = [self._request(method, params) for method, *params in calls]
+        responses = {response["id"]: response for response in await self._post(requests)}
+        return [self._result(responses[request["id"]]) for request in requests]
+
+    def _request(self, method: str, params) -> dict:
+        self._shared["id"] += 1
+        return {
+            "version": "1.1",
+            "method": method,
+            "params": list(params),
+            "id": self._shared["id"],
+        }
 
+    @staticmethod
+    def _result(response: dict):
+        if response.get("error") is not None:
+            raise JSONRPCException(response["error"])
+        if "result" not in response:
+            raise JSONRPCException({"code": -343, "message": "missing JSON-RPC result"})
+        return response["result"]
+
+    async def _post(self, payload):
+        body = json.dumps(payload, default=serialization_fallback).encode()
+        head = (
+            f"POST {self.path} HTTP/1.1\r\nHost: {self.url.hostname}\r\n"
+            f"Authorization: {self.auth_header}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n"
+        ).encode()
+        if self._shared["limit"] is None:
+            self._shared["limit"] = asyncio.Semaphore(ASYNC_RPC_CONCURRENCY)
+        async with self._shared["limit"]:
+            reader, writer = None, None
+            while self._shared["idle"] and writer is None:
+                reader, writer = self._shared["idle"].pop()
+                # The event loop has already seen bitcoind close a connection that sat idle
+                if reader.at_eof() or writer.is_closing():
+                    writer.close()
+                    reader, writer = None, None
+            if writer is None:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.url.hostname, self.url.port or 80),
+                    self.timeout,
+                )
+            try:
+                writer.write(head + body)
+                await writer.drain()
+                # Once sent, bitcoind may have run the request, so a failure isn't retried
+                status_line = await asyncio.wait_for(reader.readline(), self.timeout)
+                if not status_line:
+                    raise ConnectionResetError(f"{self.url.hostname} closed the connection")
+                status, data, keep_alive = await asyncio.wait_for(
+                    self._read_response(reader, status_line), self.timeout
+                )
+            except BaseException:
+                writer.close()
+                raise
+            if keep_alive:
+                self._shared["idle"].append((reader, writer))
+            else:
+                writer.close()
+        if status == 401:
+            raise JSONRPCException({"code": -342, "message": "RPC authentication failed"}, status)
+        try:
+            return json.loads(data, parse_float=decimal.Decimal)
+        except ValueError as e:
+            raise JSONRPCException(
+                {"code": -342, "message": f"non-JSON HTTP response with status {status}"}, status
+            ) from e
 
-AuthServiceProxy.oldrequest = AuthServiceProxy._request
-AuthServiceProxy._request = auth_proxy_request
+    @staticmethod
+    async def _read_response(
+        reader: asyncio.StreamReader, status_line: bytes
+    ) -> Tuple[int, bytes, bool]:
+        status = int(status_line.split()[1])
+        headers = {}
+        while (line := await reader.readuntil(b"\r\n")) != b"\r\n":
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while size := int((await reader.readuntil(b"\r\n")).split(b";")[0], 16):
+                chunks.append(await reader.readexactly(size + 2))
+            await reader.readuntil(b"\r\n")
+            data = b"".join(chunk[:-2] for chunk in chunks)
+        else:
+            data = await reader.readexactly(int(headers.get("content-length", 0)))
+        return status, data, headers.get("connection", "").lower() != "close"
 
 
 class Commander(BitcoinTestFramework):
+    # Tanks and lightning nodes are set up on first use, see get_warnet()
+    _tanks = None
+    _lns = None
+    _set_up = False
+    _load_lock = threading.Lock()
+
     # required by subclasses of BitcoinTestFramework
     def set_test_params(self):
         pass
@@ -91,6 +305,106 @@ class Commander(BitcoinTestFramework):
     def run_test(self):
         pass
 
+    @property
+    def tanks(self) -> Dict[str, TestNode]:
+        """Tanks by pod name"""
+        self._load_tanks()
+        return self._tanks if self._tanks is not None else {}
+
+    @property
+    def nodes(self) -> List[TestNode]:
+        self._load_tanks()
+        return self._nodes
+
+    @nodes.setter
+    def nodes(self, nodes: List[TestNode]):
+        self._nodes = nodes
+
+    @property
+    def num_nodes(self) -> int:
+        # Once the scenario is set up it is however many tanks there are
+        return len(self.nodes) if self._set_up else self._num_nodes
+
+    @num_nodes.setter
+    def num_nodes(self, num_nodes: int):
+        self._num_nodes = num_nodes
+
+    @property
+    def anodes(self) -> List[AsyncRPC]:
+        """Async RPC clients for self.nodes, in the same order, see run_async()"""
+        return [node.arpc for node in self.nodes]
+
+    def run_async(self, coroutine):
+        """
+        Run a coroutine on the NetworkThread's event loop and wait for its result, e.g.
+        `self.run_async(self.gather_rpc("getblockcount"))`
+        """
+        return asyncio.run_coroutine_threadsafe(
+            coroutine, NetworkThread.network_event_loop
+        ).result()
+
+    async def gather_rpc(
+        self, method: str, params: tuple = (), nodes=None, return_exceptions=False
+    ) -> list:
+        """
+        Call `method` with `params` on every node (all of them by default) at once, returning
+        the results in the same order. Nodes can be TestNodes or their AsyncRPC clients.
+        """
+        clients = [getattr(node, "arpc", node) for node in (self.nodes if nodes is None else nodes)]
+        return await asyncio.gather(
+            *(client.call(method, *params) for client in clients),
+            return_exceptions=return_exceptions,
+        )
+
+    @property
+    def lns(self) -> Dict[str, LND]:
+        with self._load_lock:
+            if self._lns is None:
+                self._lns = {ln: LND(ln) for ln in get_warnet()["lightning"]}
+        return self._lns
+
+    @property
+    def channels(self) -> list:
+        return get_warnet()["channels"]
+
+    def _load_tanks(self):
+        with self._load_lock:
+            if self._tanks is not None or not self._set_up:
+                return
+            self._tanks = {}
+            for i, tank in enumerate(get_warnet()["tanks"]):
+                self.log.info(
+                    f"Adding TestNode #{i} from pod {tank['tank']} with IP {tank['rpc_host']}"
+                )
+                node = TestNode(
+                    i,
+                    pathlib.Path(),  # datadir path
+                    chain=tank["chain"],
+                    rpchost=tank["rpc_host"],
+                    timewait=60,
+                    timeout_factor=self.options.timeout_factor,
+                    bitcoind=None,
+                    bitcoin_cli=None,
+                    cwd=self.options.tmpdir,
+                    coverage_dir=self.options.coveragedir,
+                )
+                node.tank = tank["tank"]
+                node.rpc = get_rpc_proxy(
+                    f"http://{tank['rpc_user']}:{tank['rpc_password']}@{tank['rpc_host']}:{tank['rpc_port']}",
+                    i,
+                    timeout=60,
+                    coveragedir=self.options.coveragedir,
+                )
+                node.rpc_connected = True
+                node.arpc = AsyncRPC(
+                    f"http://{tank['rpc_user']}:{tank['rpc_password']}@{tank['rpc_host']}:{tank['rpc_port']}",
+                    timeout=60,
+                )
+                node.init_peers = int(tank["init_peers"])
+
+                self._nodes.append(node)
+                self._tanks[tank["tank"]] = node
+
     # Utility functions for Warnet scenarios
     @staticmethod
     def ensure_miner(node):
@@ -111,9 +425,9 @@ class Commander(BitcoinTestFramework):
             return base64.b64decode(b64).hex()
 
     def wait_for_tanks_connected(self):
-        def tank_connected(self, tank):
+        async def tank_connected(tank):
             while True:
-                peers = tank.getpeerinfo()
+                peers = await tank.arpc.getpeerinfo()
                 count = sum(
                     1
                     for peer in peers
@@ -123,15 +437,12 @@ class Commander(BitcoinTestFramework):
                 if count >= tank.init_peers:
                     break
                 else:
-                    sleep(1)
+                    await asyncio.sleep(1)
 
-        conn_threads = [
-            threading.Thread(target=tank_connected, args=(self, tank)) for tank in self.nodes
-        ]
-        for thread in conn_threads:
-            thread.start()
+        async def all_connected():
+            await asyncio.gather(*(tank_connected(tank) for tank in self.nodes))
 
-        all(thread.join() is None for thread in conn_threads)
+        self.run_async(all_connected())
         self.log.info("Network connected")
 
     def handle_sigterm(self, signum, frame):
@@ -159,45 +470,6 @@ class Commander(BitcoinTestFramework):
         ch.setFormatter(formatter)
         self.log.addHandler(ch)
 
-        # Keep a separate index of tanks by pod name
-        self.tanks: Dict[str, TestNode] = {}
-        self.lns: Dict[str, LND] = {}
-        self.channels = WARNET["channels"]
-
-        for i, tank in enumerate(WARNET["tanks"]):
-            self.log.info(
-                f"Adding TestNode #{i} from pod {tank['tank']} with IP {tank['rpc_host']}"
-            )
-            node = TestNode(
-                i,
-                pathlib.Path(),  # datadir path
-                chain=tank["chain"],
-                rpchost=tank["rpc_host"],
-                timewait=60,
-                timeout_factor=self.options.timeout_factor,
-                bitcoind=None,
-                bitcoin_cli=None,
-                cwd=self.options.tmpdir,
-                coverage_dir=self.options.coveragedir,
-            )
-            node.tank = tank["tank"]
-            node.rpc = get_rpc_proxy(
-                f"http://{tank['rpc_user']}:{tank['rpc_password']}@{tank['rpc_host']}:{tank['rpc_port']}",
-                i,
-                timeout=60,
-                coveragedir=self.options.coveragedir,
-            )
-            node.rpc_connected = True
-            node.init_peers = int(tank["init_peers"])
-
-            self.nodes.append(node)
-            self.tanks[tank["tank"]] = node
-
-        for ln in WARNET["lightning"]:
-            self.lns[ln] = LND(ln)
-
-        self.num_nodes = len(self.nodes)
-
         # Set up temp directory and start logging
         if self.options.tmpdir:
             self.options.tmpdir = os.path.abspath(self.options.tmpdir)
@@ -218,6 +490,7 @@ class Commander(BitcoinTestFramework):
         self.network_thread.start()
 
         self.success = TestStatus.PASSED
+        self._set_up = True
 
     def parse_args(self):
         # Only print "outer" args from parent class when using --help
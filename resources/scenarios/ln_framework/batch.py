@@ -0,0 +1,178 @@
+"""
+Batch channel opens for ln_init --batch.
+
+Instead of each LND funding and publishing its own channel opens, ordered in blocks by a ladder
+of fee rates, channels are funded from coins the miner pays out in a few transactions with many
+outputs, one coin per channel. Each LND opens its channels with the PSBT funding flow and
+doesn't publish them. The funding transactions go straight into a block built here with
+blocktools, in the order of the channel IDs, so a block holds as many channel opens as fit in it
+and nothing waits for a mempool.
+
+A funding transaction spends its channel's coin into output 0, so channel IDs are
+block:index:0 as `warnet import-network` assigns them. Coins are anyone-can-spend taproot
+outputs, like MiniWallet's, so funding transactions need no signatures.
+"""
+
+import base64
+import os
+import time
+from typing import List, NamedTuple, Optional, Tuple
+
+from test_framework.address import (
+    address_to_scriptpubkey,
+    create_deterministic_address_bcrt1_p2tr_op_true,
+)
+from test_framework.blocktools import add_witness_commitment, create_block, create_coinbase
+from test_framework.messages import (
+    COIN,
+    COutPoint,
+    CTransaction,
+    CTxIn,
+    CTxInWitness,
+    CTxOut,
+)
+from test_framework.psbt import PSBT, PSBT_GLOBAL_UNSIGNED_TX, PSBT_IN_WITNESS_UTXO, PSBTMap
+from test_framework.script import LEAF_VERSION_TAPSCRIPT, OP_TRUE, CScript
+
+# Sats paid to each LND's wallet, which funds no channels but keeps a reserve for fee bumping
+# anchor channels
+BATCH_WALLET_FUNDS = 1_000_000
+# Paid by each funding transaction, on top of its channel's capacity
+BATCH_FUNDING_FEE = 1000
+# Outputs per fanout transaction, which keeps them standard, and their fee rate in sat/vB
+FANOUT_OUTPUTS = 1000
+FANOUT_FEE_RATE = 2
+# Smallest change a fanout transaction keeps
+FANOUT_DUST = 1000
+
+COIN_ADDRESS, COIN_INTERNAL_KEY = create_deterministic_address_bcrt1_p2tr_op_true()
+COIN_SCRIPT = address_to_scriptpubkey(COIN_ADDRESS)
+
+
+class Coin(NamedTuple):
+    txid: str
+    vout: int
+    value: int  # sats
+    script: bytes
+
+
+def fanout(miner, outputs: List[Tuple[bytes, int]]) -> List[Coin]:
+    """
+    Pay each (scriptPubKey, sats) output from the miner wallet's confirmed coins, up to
+    FANOUT_OUTPUTS per transaction. Returns the coins in the order of `outputs`.
+    """
+    change_script = bytes.fromhex(miner.getaddressinfo(miner.getnewaddress())["scriptPubKey"])
+    # Confirmed coins only, so fanouts don't chain on each other's change in the mempool
+    utxos = sorted(miner.listunspent(1), key=lambda utxo: utxo["amount"], reverse=True)
+    coins = []
+    while len(coins) < len(outputs):
+        if not utxos:
+            raise Exception(f"Miner ran out of coins after paying {len(coins)} outputs")
+        utxo = utxos.pop(0)
+        value = int(utxo["amount"] * COIN)
+        tx = CTransaction()
+        tx.vin = [CTxIn(COutPoint(int(utxo["txid"], 16), utxo["vout"]))]
+        paid = 0
+        for script, sats in outputs[len(coins) :]:
+            # A generous estimate of the size, with an input and change of any type
+            fee = FANOUT_FEE_RATE * (200 + 60 * (len(tx.vout) + 2))
+            if len(tx.vout) == FANOUT_OUTPUTS or paid + sats + fee > value:
+                break
+            tx.vout.append(CTxOut(sats, script))
+            paid += sats
+        paying = outputs[len(coins) : len(coins) + len(tx.vout)]
+        if not paying:
+            continue
+        change = value - paid - FANOUT_FEE_RATE * (200 + 60 * (len(tx.vout) + 1))
+        if change >= FANOUT_DUST:
+            tx.vout.append(CTxOut(change, change_script))
+        signed = miner.signrawtransactionwithwallet(tx.serialize().hex())
+        assert signed["complete"], signed
+        txid = miner.sendrawtransaction(signed["hex"])
+        coins.extend(Coin(txid, vout, sats, script) for vout, (script, sats) in enumerate(paying))
+    return coins
+
+
+def channel_coins(miner, capacities: List[int]) -> List[Coin]:
+    """A coin for each channel, enough for its capacity and funding fee"""
+    return fanout(miner, [(COIN_SCRIPT, capacity + BATCH_FUNDING_FEE) for capacity in capacities])
+
+
+def psbt_channel(
+    ln, pk_b64: str, capacity: int, push_amt: int, coin: Coin
+) -> Tuple[dict, Optional[CTransaction]]:
+    """
+    Open a channel from `ln`, funded from `coin` by a transaction LND doesn't publish. Returns
+    the open stream's chan_pending message, as LND.channel does, and the funding transaction,
+    or LND's response and None if the open failed.
+    """
+    pending_chan_id = base64.b64encode(os.urandom(32)).decode()
+    updates = ln.stream(
+        "/v1/channels/stream",
+        data={
+            "local_funding_amount": capacity,
+            "push_sat": push_amt,
+            "node_pubkey": pk_b64,
+            "funding_shim": {"psbt_shim": {"pending_chan_id": pending_chan_id, "no_publish": True}},
+        },
+    )
+    try:
+        res = next(updates, {})
+        fund = res.get("result", {}).get("psbt_fund")
+        if not fund:
+            return res, None
+        tx = CTransaction()
+        tx.vin = [CTxIn(COutPoint(int(coin.txid, 16), coin.vout))]
+        tx.vout = [
+            CTxOut(int(fund["funding_amount"]), address_to_scriptpubkey(fund["funding_address"]))
+        ]
+        psbt = PSBT(
+            g=PSBTMap({PSBT_GLOBAL_UNSIGNED_TX: tx.serialize_without_witness()}),
+            i=[PSBTMap({PSBT_IN_WITNESS_UTXO: CTxOut(coin.value, coin.script).serialize()})],
+            o=[PSBTMap()],
+        )
+        res = ln.funding_step(
+            {"psbt_verify": {"pending_chan_id": pending_chan_id, "funded_psbt": psbt.to_base64()}}
+        )
+        if res:
+            return _cancel(ln, pending_chan_id, res), None
+        # Script path spend of the coin's OP_TRUE leaf
+        tx.wit.vtxinwit = [CTxInWitness()]
+        tx.wit.vtxinwit[0].scriptWitness.stack = [
+            CScript([OP_TRUE]),
+            bytes([LEAF_VERSION_TAPSCRIPT]) + COIN_INTERNAL_KEY,
+        ]
+        tx.rehash()
+        final_raw_tx = base64.b64encode(tx.serialize()).decode()
+        res = ln.funding_step(
+            {"psbt_finalize": {"pending_chan_id": pending_chan_id, "final_raw_tx": final_raw_tx}}
+        )
+        if res:
+            return _cancel(ln, pending_chan_id, res), None
+        return next(updates, {}), tx
+    finally:
+        updates.close()
+
+
+def _cancel(ln, pending_chan_id: str, res: dict) -> dict:
+    ln.funding_step({"shim_cancel": {"pending_chan_id": pending_chan_id}})
+    return res
+
+
+def mine_block(node, txs: List[CTransaction], script_pubkey: bytes) -> str:
+    """Mine the next block on `node` with exactly `txs`, in order, after the coinbase"""
+    tip = node.getbestblockhash()
+    header = node.getblockheader(tip)
+    height = header["height"] + 1
+    block = create_block(
+        int(tip, 16),
+        create_coinbase(height, script_pubkey=script_pubkey),
+        max(int(time.time()), header["mediantime"] + 1),
+        txlist=txs,
+    )
+    add_witness_commitment(block)
+    block.solve()
+    error = node.submitblock(block.serialize().hex())
+    if error is not None:
+        raise Exception(f"Block {height} with {len(txs)} channel opens was rejected: {error}")
+    return block.hash
@@ -0,0 +1,138 @@
+"""
+Tracking LN nodes' graphs as gossip brings them to the channels we expect.
+
+Expected channels are indexed by channel point. Each poll of a node's graph only compares the
+edges whose `last_update`s changed since that node's previous poll, so a large graph that is
+almost there costs one download rather than a policy comparison per edge. Nodes whose graph
+didn't change are polled less and less often, up to GOSSIP_POLL_MAX, and a node that has
+converged isn't polled again. The time each node took to converge is kept for a report, which
+doubles as a measure of gossip propagation.
+"""
+
+import statistics
+import threading
+from dataclasses import dataclass, field
+from time import monotonic
+from typing import Dict, List, Optional, Set, Tuple
+
+from .ln import Policy
+
+# Seconds between polls of a node's graph. The interval doubles while nothing changes.
+GOSSIP_POLL_MIN = 1
+GOSSIP_POLL_MAX = 10
+
+
+@dataclass
+class NodeConvergence:
+    name: str
+    interval: float = GOSSIP_POLL_MIN
+    polls: int = 0
+    compared: int = 0  # Edges compared, over all polls
+    converged: Optional[float] = None  # Seconds from the start of tracking
+    versions: Dict[str, Tuple] = field(default_factory=dict)  # chan_point -> last_updates
+    matching: Set[str] = field(default_factory=set)
+    extra: Set[str] = field(default_factory=set)  # Channels we don't expect
+
+
+class GraphConvergence:
+    """
+    Whether each node's graph has every expected channel, and, if `policies`, whether both ends'
+    policies are the ones in network.yaml. Channels need the "txid" ln_init gives them.
+    """
+
+    def __init__(self, channels: List[dict], policies: bool):
+        self.policies = policies
+        self.start = monotonic()
+        self.lock = threading.Lock()
+        self.nodes: Dict[str, NodeConvergence] = {}
+        # chan_point -> (capacity, expected LND policies, or None if network.yaml has none)
+        self.expected: Dict[str, Tuple[int, Optional[List[dict]]]] = {}
+        for ch in channels:
+            capacity = ch["capacity"]
+            expected = None
+            if policies and "source_policy" in ch and "target_policy" in ch:
+                expected = [
+                    Policy(**ch["source_policy"]).to_lnd_chanpolicy(capacity),
+                    Policy(**ch["target_policy"]).to_lnd_chanpolicy(capacity),
+                ]
+            self.expected[f"{ch['txid']}:0"] = (capacity, expected)
+
+    def poll(self, ln) -> Tuple[bool, float]:
+        """
+        Fetch `ln`'s graph and compare the edges that changed. Returns whether it has converged,
+        and if not, how long to wait before polling it again.
+        """
+        with self.lock:
+            node = self.nodes.setdefault(ln.name, NodeConvergence(ln.name))
+        if node.converged is not None:
+            return True, 0
+        edges = ln.graph()["edges"]
+        node.polls += 1
+        changed = False
+        present = set()
+        for edge in edges:
+            chan_point = edge["chan_point"]
+            present.add(chan_point)
+            version = (
+                edge.get("last_update"),
+                (edge.get("node1_policy") or {}).get("last_update"),
+                (edge.get("node2_policy") or {}).get("last_update"),
+            )
+            if node.versions.get(chan_point) == version:
+                continue
+            node.versions[chan_point] = version
+            node.compared += 1
+            changed = True
+            if chan_point not in self.expected:
+                node.extra.add(chan_point)
+            elif self._matches(edge):
+                node.matching.add(chan_point)
+            else:
+                node.matching.discard(chan_point)
+        # Channels that left the graph, e.g. closed ones
+        for chan_point in set(node.versions) - present:
+            del node.versions[chan_point]
+            node.matching.discard(chan_point)
+            node.extra.discard(chan_point)
+            changed = True
+
+        if len(node.matching) == len(self.expected) and not node.extra:
+            node.converged = monotonic() - self.start
+            return True, 0
+        node.interval = GOSSIP_POLL_MIN if changed else min(node.interval * 2, GOSSIP_POLL_MAX)
+        return False, node.interval
+
+    def _matches(self, edge: dict) -> bool:
+        capacity, expected = self.expected[edge["chan_point"]]
+        # It isn't updated as part of policy. If this fails we have a bigger issue.
+        assert int(edge["capacity"]) == capacity, f"Unexpected capacity:\n{edge}"
+        if expected is None:
+            return True
+        if not edge.get("node1_policy") or not edge.get("node2_policy"):
+            return False
+        actual = [
+            Policy.from_lnd_describegraph(edge["node1_policy"]).to_lnd_chanpolicy(capacity),
+            Policy.from_lnd_describegraph(edge["node2_policy"]).to_lnd_chanpolicy(capacity),
+        ]
+        # Allow policy swap when comparing channels
+        return actual == expected or actual == expected[::-1]
+
+    def report(self) -> str:
+        """Each node's convergence time, slowest last, and their spread"""
+        nodes = sorted(
+            self.nodes.values(),
+            key=lambda n: float("inf") if n.converged is None else n.converged,
+        )
+        lines = [
+            f"{n.name}: "
+            + ("not converged" if n.converged is None else f"{n.converged:.1f}s")
+            + f" ({n.polls} polls, {n.compared} edges compared)"
+            for n in nodes
+        ]
+        times = [n.converged for n in nodes if n.converged is not None]
+        if times:
+            lines.append(
+                f"{len(times)}/{len(nodes)} converged: min {min(times):.1f}s, "
+                f"median {statistics.median(times):.1f}s, max {max(times):.1f}s"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,106 @@
+"""
+Keep-alive HTTP connections to one server, shared by every thread that calls it: a tank's RPC
+server in commander.py, or an LND's REST API in ln.py.
+
+Each request borrows an idle connection, or opens a new one, and gives it back once the
+response has been read. A connection that fails is closed instead, and so is an idle one the
+server has closed, before it is used. Connections record whether their last request went out
+in full. After that the server may have acted on it even if the connection then fails, so only
+the caller can tell whether sending it again is safe.
+"""
+
+import http.client
+import select
+import ssl
+import threading
+from collections import deque
+from time import monotonic
+from typing import Optional, Union
+
+
+class _SendTracking:
+    sent = False  # Whether the last request went out in full
+
+    def request(self, *args, **kwargs):
+        self.sent = False
+        super().request(*args, **kwargs)
+        self.sent = True
+
+
+class TrackedHTTPConnection(_SendTracking, http.client.HTTPConnection):
+    pass
+
+
+class TrackedHTTPSConnection(_SendTracking, http.client.HTTPSConnection):
+    pass
+
+
+TrackedConnection = Union[TrackedHTTPConnection, TrackedHTTPSConnection]
+
+
+class ConnectionPool:
+    def __init__(
+        self,
+        scheme: str,
+        host: str,
+        port: int,
+        size: int,
+        idle_timeout: float,
+        context: Optional[ssl.SSLContext] = None,
+    ):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.size = size  # Idle connections kept
+        self.idle_timeout = idle_timeout  # Seconds one may sit idle before it is closed
+        self.context = context
+        self.lock = threading.Lock()
+        self.idle = deque()  # (connection, when it was given back), most recent on the right
+
+    def acquire(self, timeout: float) -> TrackedConnection:
+        """An idle connection, or a new one that connects when it sends its first request"""
+        while True:
+            now = monotonic()
+            with self.lock:
+                # The oldest are the first to go stale
+                while self.idle and now - self.idle[0][1] > self.idle_timeout:
+                    self.idle.popleft()[0].close()
+                conn = self.idle.pop()[0] if self.idle else None
+            if conn is None:
+                if self.scheme == "https":
+                    return TrackedHTTPSConnection(
+                        self.host, self.port, timeout=timeout, context=self.context
+                    )
+                return TrackedHTTPConnection(self.host, self.port, timeout=timeout)
+            if _dropped(conn):
+                conn.close()
+                continue
+            conn.timeout = timeout
+            conn.sock.settimeout(timeout)
+            return conn
+
+    def release(self, conn: TrackedConnection):
+        # The server may have asked to close it, in which case the socket is already gone
+        if conn.sock is None:
+            return
+        with self.lock:
+            if len(self.idle) < self.size:
+                self.idle.append((conn, monotonic()))
+                return
+        conn.close()
+
+    def close(self):
+        with self.lock:
+            while self.idle:
+                self.idle.pop()[0].close()
+
+
+def _dropped(conn: TrackedConnection) -> bool:
+    """
+    Whether the server has closed an idle connection. Nothing is due on one until it sends a
+    request, so if it can be read from it's at the end of the stream, or broken.
+    """
+    try:
+        return bool(select.select([conn.sock], [], [], 0)[0])
+    except (OSError, ValueError):
+        return True
@@ -1,7 +1,10 @@
 import http.client
 import json
 import ssl
-import time
+from time import monotonic, sleep
+from typing import Iterator, Tuple, Union
+
+from .http_pool import ConnectionPool, TrackedHTTPSConnection
 
 # hard-coded deterministic lnd credentials
 ADMIN_MACAROON_HEX = "0201036c6e6402f801030a1062beabbf2a614b112128afa0c0b4fdd61201301a160a0761646472657373120472656164120577726974651a130a04696e666f120472656164120577726974651a170a08696e766f69636573120472656164120577726974651a210a086d616361726f6f6e120867656e6572617465120472656164120577726974651a160a076d657373616765120472656164120577726974651a170a086f6666636861696e120472656164120577726974651a160a076f6e636861696e120472656164120577726974651a140a057065657273120472656164120577726974651a180a067369676e6572120867656e657261746512047265616400000620b17be53e367290871681055d0de15587f6d1cd47d1248fe2662ae27f62cfbdc6"
@@ -10,6 +13,22 @@ INSECURE_CONTEXT = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
 INSECURE_CONTEXT.check_hostname = False
 INSECURE_CONTEXT.verify_mode = ssl.CERT_NONE
 
+LND_REST_PORT = 8080
+# Seconds to wait on a socket. POSTs get longer, as some only answer once LND has done the work,
+# e.g. connecting to a peer, and so do streamed responses, like a channel open's, for their first
+# message.
+LND_TIMEOUT = 5
+LND_POST_TIMEOUT = 60
+LND_STREAM_TIMEOUT = 60
+# Idle keep-alive connections kept per LND, and how long one may sit idle before it is closed
+LND_POOL_SIZE = 8
+LND_POOL_IDLE_TIMEOUT = 30
+# While LND isn't answering, e.g. because it is still starting, requests are retried after a
+# pause that doubles from LND_BACKOFF up to LND_BACKOFF_MAX, and given up after LND_RETRY_TIMEOUT
+LND_BACKOFF = 0.25
+LND_BACKOFF_MAX = 8
+LND_RETRY_TIMEOUT = 600
+
 
 # https://github.com/lightningcn/lightning-rfc/blob/master/07-routing-gossip.md#the-channel_update-message
 # We use the field names as written in the BOLT as our canonical, internal field names.
@@ -74,79 +93,79 @@ class Policy:
 
 
 class LND:
-    def __init__(self, pod_name):
+    """
+    Client for one LND's REST API. Requests from any number of threads share a pool of
+    keep-alive HTTPS connections, so only the first request on each pays for a TLS handshake.
+    """
+
+    def __init__(self, pod_name, port=LND_REST_PORT):
         self.name = pod_name
-        self.conn = http.client.HTTPSConnection(
-            host=pod_name, port=8080, timeout=5, context=INSECURE_CONTEXT
+        self.port = port
+        self.pool = ConnectionPool(
+            "https", pod_name, port, LND_POOL_SIZE, LND_POOL_IDLE_TIMEOUT, INSECURE_CONTEXT
         )
 
-    def get(self, uri):
-        while True:
-            try:
-                self.conn.request(
-                    method="GET",
-                    url=uri,
-                    headers={"Grpc-Metadata-macaroon": ADMIN_MACAROON_HEX, "Connection": "close"},
-                )
-                return self.conn.getresponse().read().decode("utf8")
-            except Exception:
-                time.sleep(1)
-
-    def post(self, uri, data):
-        body = json.dumps(data)
-        attempt = 0
-        while True:
-            attempt += 1
-            try:
-                self.conn.request(
-                    method="POST",
-                    url=uri,
-                    body=body,
-                    headers={
-                        "Content-Type": "application/json",
-                        "Content-Length": str(len(body)),
-                        "Grpc-Metadata-macaroon": ADMIN_MACAROON_HEX,
-                        "Connection": "close",
-                    },
-                )
-                # Stream output, otherwise we get a timeout error
-                res = self.conn.getresponse()
-                stream = ""
-                while True:
-                    try:
-                        data = res.read(1)
-                        if len(data) == 0:
-                            break
-                        else:
-                            stream += data.decode("utf8")
-                    except Exception:
-                        break
-                return stream
-            except Exception:
-                time.sleep(1)
+    def get(self, uri) -> str:
+        return self.request("GET", uri).decode("utf8")
+
+    def post(self, uri, data) -> str:
+        """For server-streaming endpoints like /v1/channels/stream, use stream() instead"""
+        return self.request("POST", uri, data).decode("utf8")
+
+    def request(self, method, uri, data=None, idempotent=None) -> bytes:
+        """
+        The response body, whatever the status, as LND explains errors in it. A request that
+        may have reached LND is only sent again if it is `idempotent`, which GETs are by default.
+        """
+        if idempotent is None:
+            idempotent = method == "GET"
+        timeout = LND_TIMEOUT if method == "GET" else LND_POST_TIMEOUT
+        conn, response = self._send(method, uri, data, timeout, read=True, idempotent=idempotent)
+        self.pool.release(conn)
+        return response
+
+    def stream(self, uri, data, timeout=LND_STREAM_TIMEOUT) -> Iterator[dict]:
+        """
+        POST to a server-streaming endpoint and yield each message as it arrives. LND sends one
+        JSON object per line, in a chunked response that lasts as long as the stream. The
+        connection is closed, ending the stream, when the generator is.
+        """
+        conn, response = self._send("POST", uri, data, timeout, read=False, idempotent=False)
+        try:
+            # HTTPResponse reads lines across chunk boundaries
+            while line := response.readline():
+                if line.strip():
+                    yield json.loads(line)
+        finally:
+            conn.close()
 
     def newaddress(self):
-        res = self.get("/v1/newaddress")
-        return json.loads(res)
+        return json.loads(self.request("GET", "/v1/newaddress"))
 
     def walletbalance(self):
-        res = self.get("/v1/balance/blockchain")
-        return int(json.loads(res)["confirmed_balance"])
+        return int(json.loads(self.request("GET", "/v1/balance/blockchain"))["confirmed_balance"])
 
     def uri(self):
-        res = self.get("/v1/getinfo")
-        info = json.loads(res)
+        info = json.loads(self.request("GET", "/v1/getinfo"))
         if "uris" not in info or len(info["uris"]) == 0:
             return None
         return info["uris"][0]
 
     def connect(self, target_uri):
         pk, host = target_uri.split("@")
-        res = self.post("/v1/peers", data={"addr": {"pubkey": pk, "host": host}})
-        return json.loads(res)
+        # Connecting again answers "already connected"
+        return json.loads(
+            self.request(
+                "POST",
+                "/v1/peers",
+                data={"addr": {"pubkey": pk, "host": host}},
+                idempotent=True,
+            )
+        )
 
     def channel(self, pk, capacity, push_amt, fee_rate):
-        res = self.post(
+        """The stream's first message, normally chan_pending, or an error"""
+        updates = self.stream(
             "/v1/channels/stream",
             data={
                 "local_funding_amount": capacity,
@@ -155,20 +174,67 @@ class LND:
                 "sat_per_vbyte": fee_rate,
             },
         )
-        return json.loads(res)
+        try:
+            return next(updates, {})
+        finally:
+            updates.close()
+
+    def funding_step(self, step: dict):
+        """The next step of a PSBT funding flow, e.g. {"psbt_verify": {...}}. {} if it worked."""
+        return json.loads(self.request("POST", "/v1/funding/step", data=step))
 
     def update(self, txid_hex: str, policy: dict, capacity: int):
         ln_policy = Policy.from_dict(policy).to_lnd_chanpolicy(capacity)
         data = {"chan_point": {"funding_txid_str": txid_hex, "output_index": 0}, **ln_policy}
-        res = self.post(
+        res = self.request(
+            "POST",
             "/v1/chanpolicy",
             # Policy objects returned by DescribeGraph have
             # completely different labels than policy objects expected
             # by the UpdateChannelPolicy API.
             data=data,
+            # Setting the same policy again changes nothing
+            idempotent=True,
         )
         return json.loads(res)
 
     def graph(self):
-        res = self.get("/v1/graph")
-        return json.loads(res)
+        # Parsed straight from the bytes received, which run to megabytes on large networks
+        return json.loads(self.request("GET", "/v1/graph"))
+
+    def close(self):
+        self.pool.close()
+
+    def _send(
+        self, method, uri, data, timeout, read, idempotent
+    ) -> Tuple[TrackedHTTPSConnection, Union[bytes, http.client.HTTPResponse]]:
+        """
+        Send a request on a pooled connection, retrying while LND can't be reached. Returns the
+        connection and the body, if `read`, or else the response to read from.
+        """
+        body = None if data is None else json.dumps(data).encode()
+        headers = {"Grpc-Metadata-macaroon": ADMIN_MACAROON_HEX}
+        if body is not None:
+            headers["Content-Type"] = "application/json"
+        deadline = monotonic() + LND_RETRY_TIMEOUT
+        delay = LND_BACKOFF
+        while True:
+            conn = self.pool.acquire(timeout)
+            try:
+                conn.request(method, uri, body=body, headers=headers)
+                response = conn.getresponse()
+                return conn, response.read() if read else response
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                # Once a request is sent LND may act on it, e.g. open a channel, even if the
+                # connection then fails or times out, so unless repeating it is harmless it is
+                # only sent again if it didn't get out
+                if not idempotent and conn.sent:
+                    raise
+                if monotonic() + delay > deadline:
+                    raise
+                sleep(delay)
+                delay = min(delay * 2, LND_BACKOFF_MAX)
+            except BaseException:
+                conn.close()
+                raise
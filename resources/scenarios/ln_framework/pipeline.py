@@ -0,0 +1,189 @@
+"""
+Staged work over many lightning nodes, as ln_init does it.
+
+Each stage runs one piece of work per item (an LND, a pair to connect, a channel to open) on a
+fixed pool of worker threads, however many items there are, and at most `per_node` items for
+the same LND at once. Work that finds its LND not ready yet raises NotReady, and the item is
+put back and tried again after a pause that doubles up to `retry_max`, while other items go
+ahead. Stages log their progress as they go, and the pipeline reports how long each one took.
+"""
+
+import heapq
+import threading
+from collections import deque
+from dataclasses import dataclass
+from time import monotonic
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, TypeVar
+
+T = TypeVar("T")
+
+# Worker threads per stage, and requests each LND is sent at once
+LN_INIT_WORKERS = 32
+LN_INIT_PER_NODE = 4
+# Pause before an item that wasn't ready is tried again, doubling up to the longest
+LN_INIT_RETRY_DELAY = 1
+LN_INIT_RETRY_MAX = 8
+# Seconds between a stage's progress reports
+LN_INIT_PROGRESS_INTERVAL = 10
+
+
+class NotReady(Exception):
+    """
+    The item's LND isn't ready for it yet, so it should be tried again later: after `delay`
+    seconds if given, or else after the pipeline's backoff
+    """
+
+    def __init__(self, delay: Optional[float] = None):
+        super().__init__(delay)
+        self.delay = delay
+
+
+@dataclass
+class StageStats:
+    name: str
+    items: int
+    done: int = 0
+    failed: int = 0
+    retries: int = 0
+    seconds: float = 0.0
+
+    def __str__(self):
+        failed = f", {self.failed} failed" if self.failed else ""
+        return (
+            f"{self.name}: {self.done}/{self.items} in {self.seconds:.1f}s "
+            f"({self.retries} retries{failed})"
+        )
+
+
+class Pipeline:
+    def __init__(
+        self,
+        log,
+        workers: int = LN_INIT_WORKERS,
+        per_node: int = LN_INIT_PER_NODE,
+        retry_delay: float = LN_INIT_RETRY_DELAY,
+        retry_max: float = LN_INIT_RETRY_MAX,
+    ):
+        self.log = log
+        self.workers = workers
+        self.per_node = per_node
+        self.retry_delay = retry_delay
+        self.retry_max = retry_max
+        self.start = monotonic()
+        self.stages: List[StageStats] = []
+
+    def run(
+        self,
+        name: str,
+        items: Sequence,
+        work: Callable[..., T],
+        node: Callable[..., Hashable],
+        workers: Optional[int] = None,
+        retry_max: Optional[float] = None,
+    ) -> List[T]:
+        """
+        Call `work(item)` for every item and return the results in the same order. `node(item)`
+        names the LND the work is sent to. Raises once the stage is over if any item failed
+        with anything but NotReady.
+        """
+        stats = StageStats(name, len(items))
+        self.stages.append(stats)
+        retry_max = self.retry_max if retry_max is None else retry_max
+        start = monotonic()
+        results: List[Optional[T]] = [None] * len(items)
+        errors: List[BaseException] = []
+
+        lock = threading.Condition()
+        # Items waiting for a worker, by LND, and the LNDs taken in turn
+        waiting: Dict[Hashable, deque] = {}
+        order: deque = deque()
+        for i, item in enumerate(items):
+            key = node(item)
+            if key not in waiting:
+                waiting[key] = deque()
+                order.append(key)
+            waiting[key].append(i)
+        busy: Dict[Hashable, int] = {key: 0 for key in waiting}
+        # Items that weren't ready: (when to try again, index)
+        delayed: List[tuple] = []
+        attempts = [0] * len(items)
+        remaining = len(items)
+        last_report = start
+
+        def take() -> Optional[int]:
+            """The next item a worker may start, waiting for one if need be. None when done."""
+            while True:
+                if remaining == 0:
+                    return None
+                now = monotonic()
+                while delayed and delayed[0][0] <= now:
+                    _, i = heapq.heappop(delayed)
+                    waiting[node(items[i])].append(i)
+                for _ in range(len(order)):
+                    key = order[0]
+                    order.rotate(-1)
+                    if waiting[key] and busy[key] < self.per_node:
+                        busy[key] += 1
+                        return waiting[key].popleft()
+                lock.wait(timeout=delayed[0][0] - now if delayed else None)
+
+        def worker():
+            nonlocal remaining, last_report
+            while True:
+                with lock:
+                    i = take()
+                if i is None:
+                    return
+                item = items[i]
+                retry = failed = False
+                delay = None
+                try:
+                    results[i] = work(item)
+                except NotReady as e:
+                    retry = True
+                    delay = e.delay
+                except Exception as e:
+                    self.log.error(f"{name}: {item} failed", exc_info=True)
+                    failed = True
+                    errors.append(e)
+                with lock:
+                    busy[node(item)] -= 1
+                    if retry:
+                        attempts[i] += 1
+                        stats.retries += 1
+                        if delay is None:
+                            delay = min(self.retry_delay * 2 ** (attempts[i] - 1), retry_max)
+                        heapq.heappush(delayed, (monotonic() + delay, i))
+                    else:
+                        remaining -= 1
+                        if failed:
+                            stats.failed += 1
+                        else:
+                            stats.done += 1
+                    lock.notify_all()
+                    now = monotonic()
+                    if now - last_report >= LN_INIT_PROGRESS_INTERVAL and remaining:
+                        last_report = now
+                        stats.seconds = now - start
+                        self.log.info(f"{stats}, {len(delayed)} waiting to retry")
+
+        threads = [
+            threading.Thread(target=worker, name=f"{name}-{n}", daemon=True)
+            for n in range(min(workers or self.workers, len(items)))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stats.seconds = monotonic() - start
+        self.log.info(str(stats))
+        if errors:
+            raise Exception(f"{name}: {len(errors)} of {len(items)} failed") from errors[0]
+        return results
+
+    def report(self):
+        """How long each stage took, and the whole pipeline"""
+        lines = [str(stats) for stats in self.stages]
+        lines.append(f"Total: {monotonic() - self.start:.1f}s")
+        self.log.info("Stage timings:\n  " + "\n  ".join(lines))
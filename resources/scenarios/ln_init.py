@@ -1,10 +1,20 @@
 #!/usr/bin/env python3
 
-import threading
-from time import sleep
-
 from commander import Commander
-from ln_framework.ln import Policy
+from ln_framework.batch import (
+    BATCH_WALLET_FUNDS,
+    channel_coins,
+    fanout,
+    mine_block,
+    psbt_channel,
+)
+from ln_framework.convergence import GraphConvergence
+from ln_framework.pipeline import LN_INIT_PER_NODE, LN_INIT_WORKERS, NotReady, Pipeline
+from test_framework.address import address_to_scriptpubkey
+
+
+def by_name(ln):
+    return ln.name
 
 
 class LNInit(Commander):
@@ -14,8 +24,30 @@ class LNInit(Commander):
     def add_options(self, parser):
         parser.description = "Fund LN wallets and open channels"
         parser.usage = "warnet run /path/to/ln_init.py"
+        parser.add_argument(
+            "--workers",
+            dest="workers",
+            default=LN_INIT_WORKERS,
+            type=int,
+            help=f"Worker threads for each stage of the setup (default {LN_INIT_WORKERS})",
+        )
+        parser.add_argument(
+            "--per-node",
+            dest="per_node",
+            default=LN_INIT_PER_NODE,
+            type=int,
+            help=f"Requests sent to one LN node at a time (default {LN_INIT_PER_NODE})",
+        )
+        parser.add_argument(
+            "--batch",
+            dest="batch",
+            action="store_true",
+            help="Fund channels with PSBTs and mine their blocks directly, for large networks",
+        )
 
     def run_test(self):
+        pipeline = Pipeline(self.log, self.options.workers, self.options.per_node)
+
         ##
         # L1 P2P
         ##
@@ -28,6 +60,7 @@ class LNInit(Commander):
         self.log.info("Setting up miner...")
         miner = self.ensure_miner(self.nodes[0])
         miner_addr = miner.getnewaddress()
+        miner_script = address_to_scriptpubkey(miner_addr)
 
         def gen(n):
             return self.generatetoaddress(self.nodes[0], n, miner_addr, sync_fun=self.no_op)
@@ -39,29 +72,19 @@ class LNInit(Commander):
         # WALLET ADDRESSES
         ##
         self.log.info("Getting LN wallet addresses...")
-        ln_addrs = []
-
-        def get_ln_addr(self, ln):
-            while True:
-                res = ln.newaddress()
-                if "address" in res:
-                    addr = res["address"]
-                    ln_addrs.append(addr)
-                    self.log.info(f"Got wallet address {addr} from {ln.name}")
-                    break
-                else:
-                    self.log.info(
-                        f"Couldn't get wallet address from {ln.name}:\n  {res}\n  wait and retry..."
-                    )
-                    sleep(1)
-
-        addr_threads = [
-            threading.Thread(target=get_ln_addr, args=(self, ln)) for ln in self.lns.values()
-        ]
-        for thread in addr_threads:
-            thread.start()
-
-        all(thread.join() is None for thread in addr_threads)
+        lns = list(self.lns.values())
+
+        def get_ln_addr(ln):
+            res = ln.newaddress()
+            if "address" not in res:
+                self.log.info(
+                    f"Couldn't get wallet address from {ln.name}:\n  {res}\n  wait and retry..."
+                )
+                raise NotReady
+            self.log.info(f"Got wallet address {res['address']} from {ln.name}")
+            return res["address"]
+
+        ln_addrs = pipeline.run("wallet addresses", lns, get_ln_addr, node=by_name)
         self.log.info(f"Got {len(ln_addrs)} addresses from {len(self.lns)} LN nodes")
 
         ##
@@ -70,62 +93,57 @@ class LNInit(Commander):
         self.log.info("Funding LN wallets...")
         # 298 block base for miner wallet
         gen(297)
-        # divvy up the goods, except fee.
-        # 10 UTXOs per node means 10 channel opens per node per block
-        split = (miner.getbalance() - 1) // len(ln_addrs) // 10
-        sends = {}
-        for _ in range(10):
-            for addr in ln_addrs:
-                sends[addr] = split
-            miner.sendmany("", sends)
+        if self.options.batch:
+            # A coin for each LND's wallet, and one for each channel, which pays for its opening
+            fanout(
+                miner, [(address_to_scriptpubkey(addr), BATCH_WALLET_FUNDS) for addr in ln_addrs]
+            )
+            by_id = sorted(self.channels, key=lambda ch: (ch["id"]["block"], ch["id"]["index"]))
+            coins = channel_coins(miner, [ch["capacity"] for ch in by_id])
+            ch_coins = {
+                (ch["id"]["block"], ch["id"]["index"]): coin for ch, coin in zip(by_id, coins)
+            }
+            min_balance = BATCH_WALLET_FUNDS
+            self.log.info(f"Paid coins for {len(coins)} channels")
+        else:
+            # divvy up the goods, except fee.
+            # 10 UTXOs per node means 10 channel opens per node per block
+            split = (miner.getbalance() - 1) // len(ln_addrs) // 10
+            sends = {}
+            for _ in range(10):
+                for addr in ln_addrs:
+                    sends[addr] = split
+                miner.sendmany("", sends)
+            min_balance = split * 100000000
         # confirm funds in block 299
         gen(1)
 
         self.log.info(
-            f"Waiting for funds to be spendable: 10x{split} BTC UTXOs each for {len(ln_addrs)} LN nodes"
+            f"Waiting for funds to be spendable: {min_balance} sats each for {len(ln_addrs)} LN nodes"
         )
 
-        def confirm_ln_balance(self, ln):
-            bal = 0
-            while True:
-                bal = ln.walletbalance()
-                if bal >= (split * 100000000):
-                    self.log.info(f"LN node {ln.name} confirmed funds")
-                    break
-                sleep(1)
-
-        fund_threads = [
-            threading.Thread(target=confirm_ln_balance, args=(self, ln)) for ln in self.lns.values()
-        ]
-        for thread in fund_threads:
-            thread.start()
-
-        all(thread.join() is None for thread in fund_threads)
+        def confirm_ln_balance(ln):
+            if ln.walletbalance() < min_balance:
+                raise NotReady
+            self.log.info(f"LN node {ln.name} confirmed funds")
+
+        pipeline.run("funding", lns, confirm_ln_balance, node=by_name)
         self.log.info("All LN nodes are funded")
 
         ##
         # URIs
         ##
         self.log.info("Getting URIs for all LN nodes...")
-        ln_uris = {}
-
-        def get_ln_uri(self, ln):
-            uri = None
-            while True:
-                uri = ln.uri()
-                if uri:
-                    ln_uris[ln.name] = uri
-                    self.log.info(f"LN node {ln.name} has URI {uri}")
-                    break
-                sleep(1)
-
-        uri_threads = [
-            threading.Thread(target=get_ln_uri, args=(self, ln)) for ln in self.lns.values()
-        ]
-        for thread in uri_threads:
-            thread.start()
-
-        all(thread.join() is None for thread in uri_threads)
+
+        def get_ln_uri(ln):
+            uri = ln.uri()
+            if not uri:
+                raise NotReady
+            self.log.info(f"LN node {ln.name} has URI {uri}")
+            return uri
+
+        uris = pipeline.run("URIs", lns, get_ln_uri, node=by_name)
+        ln_uris = {ln.name: uri for ln, uri in zip(lns, uris)}
         self.log.info("Got URIs from all LN nodes")
 
         ##
@@ -135,49 +153,38 @@ class LNInit(Commander):
         # (source: LND, target_uri: str) tuples of LND instances
         connections = []
         # Cycle graph through all LN nodes
-        nodes = list(self.lns.values())
-        prev_node = nodes[-1]
-        for node in nodes:
+        prev_node = lns[-1]
+        for node in lns:
             connections.append((node, prev_node))
             prev_node = node
         # Explicit connections between every pair of channel partners
+        known = set(connections)
         for ch in self.channels:
             src = self.lns[ch["source"]]
             tgt = self.lns[ch["target"]]
             # Avoid duplicates and reciprocals
-            if (src, tgt) not in connections and (tgt, src) not in connections:
+            if (src, tgt) not in known and (tgt, src) not in known:
                 connections.append((src, tgt))
+                known.add((src, tgt))
+
+        def connect_ln(pair):
+            res = pair[0].connect(ln_uris[pair[1].name])
+            if res == {}:
+                self.log.info(f"Connected LN nodes {pair[0].name} -> {pair[1].name}")
+                return
+            if "message" not in res:
+                raise NotReady
+            if "already connected" in res["message"]:
+                self.log.info(f"Already connected LN nodes {pair[0].name} -> {pair[1].name}")
+                return
+            if "process of starting" in res["message"]:
+                self.log.info(f"{pair[0].name} not ready for connections yet, wait and retry...")
+                raise NotReady
+            self.log.info(
+                f"Unexpected response attempting to connect {pair[0].name} -> {pair[1].name}:\n  {res}\n  ABORTING"
+            )
 
-        def connect_ln(self, pair):
-            while True:
-                res = pair[0].connect(ln_uris[pair[1].name])
-                if res == {}:
-                    self.log.info(f"Connected LN nodes {pair[0].name} -> {pair[1].name}")
-                    break
-                if "message" in res:
-                    if "already connected" in res["message"]:
-                        self.log.info(
-                            f"Already connected LN nodes {pair[0].name} -> {pair[1].name}"
-                        )
-                        break
-                    if "process of starting" in res["message"]:
-                        self.log.info(
-                            f"{pair[0].name} not ready for connections yet, wait and retry..."
-                        )
-                        sleep(1)
-                    else:
-                        self.log.info(
-                            f"Unexpected response attempting to connect {pair[0].name} -> {pair[1].name}:\n  {res}\n  ABORTING"
-                        )
-                        break
-
-        p2p_threads = [
-            threading.Thread(target=connect_ln, args=(self, pair)) for pair in connections
-        ]
-        for thread in p2p_threads:
-            thread.start()
-
-        all(thread.join() is None for thread in p2p_threads)
+        pipeline.run("p2p connections", connections, connect_ln, node=lambda pair: pair[0].name)
         self.log.info("Established all LN p2p connections")
 
         ##
@@ -197,6 +204,55 @@ class LNInit(Commander):
         blocks = list(ch_by_block.keys())
         blocks = sorted(blocks)
 
+        def opened(ch, res, note):
+            if "result" not in res:
+                self.log.info(
+                    "Unexpected channel open response:\n  "
+                    + f"From {ch['source']} -> {ch['target']} {note}\n  "
+                    + f"{res}"
+                )
+                return False
+            txid = self.b64_to_hex(res["result"]["chan_pending"]["txid"], reverse=True)
+            ch["txid"] = txid
+            self.log.info(
+                f"Channel open {ch['source']} -> {ch['target']}\n  "
+                + f"outpoint={txid}:{res['result']['chan_pending']['output_index']}\n  "
+                + f"expected channel id: {ch['id']}"
+            )
+            return True
+
+        def open_channel(item):
+            ch, fee_rate = item
+            src = self.lns[ch["source"]]
+            tgt_uri = ln_uris[ch["target"]]
+            tgt_pk, _ = tgt_uri.split("@")
+            self.log.info(
+                f"Sending channel open from {ch['source']} -> {ch['target']} with fee_rate={fee_rate}"
+            )
+            res = src.channel(
+                pk=self.hex_to_b64(tgt_pk),
+                capacity=ch["capacity"],
+                push_amt=ch["push_amt"],
+                fee_rate=fee_rate,
+            )
+            opened(ch, res, f"fee_rate={fee_rate}")
+
+        def open_psbt_channel(ch):
+            coin = ch_coins[(ch["id"]["block"], ch["id"]["index"])]
+            tgt_pk, _ = ln_uris[ch["target"]].split("@")
+            self.log.info(f"Sending PSBT channel open from {ch['source']} -> {ch['target']}")
+            res, tx = psbt_channel(
+                self.lns[ch["source"]],
+                self.hex_to_b64(tgt_pk),
+                ch["capacity"],
+                ch["push_amt"],
+                coin,
+            )
+            if tx is None or not opened(ch, res, f"coin={coin.txid}:{coin.vout}"):
+                raise Exception(f"Channel open {ch['source']} -> {ch['target']} failed: {res}")
+            assert ch["txid"] == tx.hash, f"LND funded {ch['txid']}, not {tx.hash}"
+            return tx
+
         for target_block in blocks:
             # First make sure the target block is the next block
             current_height = self.nodes[0].getblockcount()
@@ -206,54 +262,40 @@ class LNInit(Commander):
             if need > 1:
                 gen(need - 1)
 
-            def open_channel(self, ch, fee_rate):
-                src = self.lns[ch["source"]]
-                tgt_uri = ln_uris[ch["target"]]
-                tgt_pk, _ = tgt_uri.split("@")
-                self.log.info(
-                    f"Sending channel open from {ch['source']} -> {ch['target']} with fee_rate={fee_rate}"
-                )
-                res = src.channel(
-                    pk=self.hex_to_b64(tgt_pk),
-                    capacity=ch["capacity"],
-                    push_amt=ch["push_amt"],
-                    fee_rate=fee_rate,
-                )
-                if "result" not in res:
-                    self.log.info(
-                        "Unexpected channel open response:\n  "
-                        + f"From {ch['source']} -> {ch['target']} fee_rate={fee_rate}\n  "
-                        + f"{res}"
-                    )
-                else:
-                    txid = self.b64_to_hex(res["result"]["chan_pending"]["txid"], reverse=True)
-                    ch["txid"] = txid
-                    self.log.info(
-                        f"Channel open {ch['source']} -> {ch['target']}\n  "
-                        + f"outpoint={txid}:{res['result']['chan_pending']['output_index']}\n  "
-                        + f"expected channel id: {ch['id']}"
-                    )
-
             channels = sorted(ch_by_block[target_block], key=lambda ch: ch["id"]["index"])
-            index = 0
-            fee_rate = 5006  # s/vB, decreases by 5 per tx for up to 1000 txs per block
-            ch_threads = []
-            for ch in channels:
-                index += 1  # noqa
-                fee_rate -= 5
+            for index, ch in enumerate(channels, start=1):
                 assert index == ch["id"]["index"], "Channel ID indexes are not consecutive"
-                assert fee_rate >= 1, "Too many TXs in block, out of fee range"
-                t = threading.Thread(target=open_channel, args=(self, ch, fee_rate))
-                t.start()
-                ch_threads.append(t)
-
-            all(thread.join() is None for thread in ch_threads)
-            self.log.info(f"Waiting for {len(channels)} channel opens in mempool...")
-            self.wait_until(
-                lambda channels=channels: self.nodes[0].getmempoolinfo()["size"] >= len(channels),
-                timeout=500,
-            )
-            block_hash = gen(1)[0]
+
+            if self.options.batch:
+                txs = pipeline.run(
+                    f"PSBT channel opens for block {target_block}",
+                    channels,
+                    open_psbt_channel,
+                    node=lambda ch: ch["source"],
+                )
+                # The funding transactions, in channel ID order, are the whole block
+                block_hash = mine_block(self.nodes[0], txs, miner_script)
+            else:
+                fee_rate = 5006  # s/vB, decreases by 5 per tx for up to 1000 txs per block
+                opens = []
+                for ch in channels:
+                    fee_rate -= 5
+                    assert fee_rate >= 1, "Too many TXs in block, out of fee range"
+                    opens.append((ch, fee_rate))
+
+                pipeline.run(
+                    f"channel opens for block {target_block}",
+                    opens,
+                    open_channel,
+                    node=lambda item: item[0]["source"],
+                )
+                self.log.info(f"Waiting for {len(channels)} channel opens in mempool...")
+                self.wait_until(
+                    lambda channels=channels: self.nodes[0].getmempoolinfo()["size"]
+                    >= len(channels),
+                    timeout=500,
+                )
+                block_hash = gen(1)[0]
             self.log.info(f"Confirmed {len(channels)} channel opens in block {target_block}")
             self.log.info("Checking deterministic channel IDs in block...")
             block = self.nodes[0].getblock(block_hash)
@@ -271,119 +313,56 @@ class LNInit(Commander):
 
         self.log.info("Waiting for channel announcement gossip...")
 
-        def ln_all_chs(self, ln):
-            expected = len(self.channels)
-            while len(ln.graph()["edges"]) != expected:
-                sleep(1)
-            self.log.info(f"LN {ln.name} has graph with all {expected} channels")
+        announcements = GraphConvergence(self.channels, policies=False)
 
-        ch_ann_threads = [
-            threading.Thread(target=ln_all_chs, args=(self, ln)) for ln in self.lns.values()
-        ]
-        for thread in ch_ann_threads:
-            thread.start()
+        def ln_all_chs(ln):
+            converged, delay = announcements.poll(ln)
+            if not converged:
+                raise NotReady(delay)
+            self.log.info(f"LN {ln.name} has graph with all {len(self.channels)} channels")
 
-        all(thread.join() is None for thread in ch_ann_threads)
+        pipeline.run("channel announcements", lns, ln_all_chs, node=by_name)
         self.log.info("All LN nodes have complete graph")
+        self.log.info(f"Channel announcement convergence:\n{announcements.report()}")
 
         ##
         # UPDATE CHANNEL POLICIES
         ##
         self.log.info("Updating channel policies...")
 
-        def update_policy(self, ln, txid_hex, policy, capacity):
+        def update_policy(item):
+            ln, ch, policy = item
+            txid_hex = ch["txid"]
             self.log.info(f"Sending update from {ln.name} for channel with outpoint: {txid_hex}:0")
-            res = ln.update(txid_hex, policy, capacity)
+            res = ln.update(txid_hex, policy, ch["capacity"])
             assert (
                 len(res["failed_updates"]) == 0
             ), f" Failed updates: {res["failed_updates"]}\n txid: {txid_hex}\n policy:{policy}"
 
-        update_threads = []
+        updates = []
         for ch in self.channels:
             if "source_policy" in ch:
-                ts = threading.Thread(
-                    target=update_policy,
-                    args=(
-                        self,
-                        self.lns[ch["source"]],
-                        ch["txid"],
-                        ch["source_policy"],
-                        ch["capacity"],
-                    ),
-                )
-                ts.start()
-                update_threads.append(ts)
+                updates.append((self.lns[ch["source"]], ch, ch["source_policy"]))
             if "target_policy" in ch:
-                tt = threading.Thread(
-                    target=update_policy,
-                    args=(
-                        self,
-                        self.lns[ch["target"]],
-                        ch["txid"],
-                        ch["target_policy"],
-                        ch["capacity"],
-                    ),
-                )
-                tt.start()
-                update_threads.append(tt)
-        count = len(update_threads)
+                updates.append((self.lns[ch["target"]], ch, ch["target_policy"]))
 
-        all(thread.join() is None for thread in update_threads)
-        self.log.info(f"Sent {count} channel policy updates")
+        pipeline.run("policy updates", updates, update_policy, node=lambda item: item[0].name)
+        self.log.info(f"Sent {len(updates)} channel policy updates")
 
         self.log.info("Waiting for all channel policy gossip to synchronize...")
 
-        def policy_equal(pol1, pol2, capacity):
-            return pol1.to_lnd_chanpolicy(capacity) == pol2.to_lnd_chanpolicy(capacity)
-
-        def matching_graph(self, expected, ln):
-            while True:
-                actual = ln.graph()["edges"]
-                assert len(expected) == len(actual)
-                done = True
-                for i, actual_ch in enumerate(actual):
-                    expected_ch = expected[i]
-                    capacity = expected_ch["capacity"]
-                    # We assert this because it isn't updated as part of policy.
-                    # If this fails we have a bigger issue
-                    assert int(actual_ch["capacity"]) == capacity
-
-                    # Policies were not defined in network.yaml
-                    if "source_policy" not in expected_ch or "target_policy" not in expected_ch:
-                        continue
-
-                    # policy actual/expected source/target
-                    polas = Policy.from_lnd_describegraph(actual_ch["node1_policy"])
-                    polat = Policy.from_lnd_describegraph(actual_ch["node2_policy"])
-                    poles = Policy(**expected_ch["source_policy"])
-                    polet = Policy(**expected_ch["target_policy"])
-                    # Allow policy swap when comparing channels
-                    if policy_equal(polas, poles, capacity) and policy_equal(
-                        polat, polet, capacity
-                    ):
-                        continue
-                    if policy_equal(polas, polet, capacity) and policy_equal(
-                        polat, poles, capacity
-                    ):
-                        continue
-                    done = False
-                    break
-                if done:
-                    self.log.info(f"LN {ln.name} graph channel policies all match expected source")
-                    break
-                else:
-                    sleep(1)
-
-        expected = sorted(self.channels, key=lambda ch: (ch["id"]["block"], ch["id"]["index"]))
-        policy_threads = [
-            threading.Thread(target=matching_graph, args=(self, expected, ln))
-            for ln in self.lns.values()
-        ]
-        for thread in policy_threads:
-            thread.start()
-
-        all(thread.join() is None for thread in policy_threads)
+        policies = GraphConvergence(self.channels, policies=True)
+
+        def matching_graph(ln):
+            converged, delay = policies.poll(ln)
+            if not converged:
+                raise NotReady(delay)
+            self.log.info(f"LN {ln.name} graph channel policies all match expected source")
+
+        pipeline.run("policy gossip", lns, matching_graph, node=by_name)
         self.log.info("All LN nodes have matching graph!")
+        self.log.info(f"Channel policy convergence:\n{policies.report()}")
+        pipeline.report()
 
 
 def main():
@@ -72,10 +72,94 @@ NAMESPACES_CHART_LOCATION = CHARTS_DIR.joinpath("namespaces")
 FORK_OBSERVER_CHART = str(files("resources.charts").joinpath("fork-observer"))
 CADDY_CHART = str(files("resources.charts").joinpath("caddy"))
 CADDY_INGRESS_NAME = "caddy-ingress"
+SNAPSHOT_CACHE_CHART = str(CHARTS_DIR.joinpath("snapshot-cache"))
 
 DEFAULT_NETWORK = Path("6_node_bitcoin")
 DEFAULT_NAMESPACES = Path("two_namespaces_two_users")
 
+# Local cache for data pulled out of the cluster
+CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))) / "warnet"
+MESSAGE_CAPTURE_CACHE_DIR = CACHE_DIR / "message_capture"
+SCENARIO_ARCHIVE_CACHE_DIR = CACHE_DIR / "scenarios"
+
+# Shared scheduler for parallel deploy/teardown work, see scheduler.py
+MAX_PARALLEL = int(os.environ.get("WARNET_MAX_PARALLEL", "16"))
+API_QPS = float(os.environ.get("WARNET_API_QPS", "20"))
+API_BURST = float(os.environ.get("WARNET_API_BURST", "40"))
+PROGRESS_FORMAT = os.environ.get("WARNET_PROGRESS", "")
+
+# Server-side apply, used by bulk deploys
+FIELD_MANAGER = "warnet"
+APPLY_RETRIES = 5
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+# `helm template` release name, replaced by each tank's name in a shared render
+BULK_RELEASE_PLACEHOLDER = "warnet-bulk-release-placeholder"
+BULK_MANAGED_BY = "warnet"
+
+# Tank pod annotation holding a hash of the node's merged values, so a redeploy can skip
+# tanks whose configuration hasn't changed
+CONFIG_HASH_ANNOTATION = "warnet.dev/config-hash"
+
+# `warnet down` deletes tanks with a few deletecollection requests per namespace instead of a
+# `helm uninstall` each. Services and ConfigMaps carry no mission label, so their chart is used.
+HELM_RELEASE_SELECTOR = "owner=helm"
+MISSION_SELECTOR = "mission"
+TANK_CHART_SELECTOR = "app.kubernetes.io/name in (bitcoincore,lnd)"
+TANK_METRICS_SELECTOR = "app.kubernetes.io/name=bitcoind-metrics"
+# Release names per helm release secret deletecollection, to keep the request URL short
+RELEASE_DELETE_BATCH = 100
+# Seconds `warnet down` waits for a namespace's pods to be gone
+TEARDOWN_TIMEOUT = 5 * 60
+
+# `warnet snapshot` streams tar out of each tank and compresses it locally
+SNAPSHOT_COMPRESSIONS = ["gzip", "zstd", "none"]
+SNAPSHOT_SUFFIXES = {"gzip": ".tar.gz", "zstd": ".tar.zst", "none": ".tar"}
+# Exit status of the in-pod snapshot script when the filters match nothing
+SNAPSHOT_NO_FILES_EXIT = 3
+# `warnet snapshot --store` splits files into chunks of this size, stored once by sha256
+SNAPSHOT_STORE_CHUNK_SIZE = 4 << 20
+# Paths are passed to the store's in-pod scripts in batches of about this many bytes, as each
+# script is one argument and Linux caps an argument at 128 KiB
+SNAPSHOT_STORE_SCRIPT_LIMIT = 32 << 10
+
+# In-cluster cache that tanks load their snapshots through, deployed in each network's namespace
+SNAPSHOT_CACHE_NAME = "snapshot-cache"
+SNAPSHOT_CACHE_MISSION = "snapshot-cache"
+SNAPSHOT_CACHE_PORT = 8080
+SNAPSHOT_CACHE_SCRIPT = "/snapshot-cache.py"
+# The cache's image, with curl and tar built in, is also the init image of tanks that load
+# through it. Its tag is the snapshot-cache chart's appVersion, as it is for the cache pod.
+SNAPSHOT_CACHE_IMAGE = {
+    "repository": "bitcoindevproject/snapshot-cache",
+    "pullPolicy": "IfNotPresent",
+}
+
+# `warnet run` stores each scenario archive once per namespace, in an immutable ConfigMap that
+# commander pods mount at COMMANDER_ARCHIVE. ConfigMaps hold at most 1 MiB, so larger archives
+# are uploaded to each commander instead.
+SCENARIO_ARCHIVE_NAME = "scenario-archive"
+SCENARIO_ARCHIVE_SELECTOR = f"app.kubernetes.io/name={SCENARIO_ARCHIVE_NAME}"
+SCENARIO_ARCHIVE_CONFIGMAP_LIMIT = 1000 << 10
+COMMANDER_ARCHIVE = "/shared/archive.pyz"
+# Python version of the commander image. Archives only carry bytecode built by the same version.
+COMMANDER_PYTHON = (3, 12)
+# `warnet run` passes commanders the pods they would otherwise list themselves on startup
+TOPOLOGY_MISSIONS = "mission in (tank,lightning)"
+# The topology goes in a ConfigMap too, so commanders of larger networks discover them instead
+TOPOLOGY_CONFIGMAP_LIMIT = SCENARIO_ARCHIVE_CONFIGMAP_LIMIT
+
+# Downloads, uploads and snapshots stream over the exec websocket in chunks of this size, are
+# checksummed in the pod, and are retried this many times
+EXEC_TRANSFER_CHUNK_SIZE = 1 << 20
+EXEC_TRANSFER_RETRIES = 3
+# Seconds an exec transfer may go without receiving anything before it is abandoned
+EXEC_TRANSFER_IDLE_TIMEOUT = 120
+
+# Seconds before the API server closes a pod watch, which is then resumed
+POD_WATCH_TIMEOUT = 300
+# Seconds `warnet deploy --wait` waits for all tanks to be ready
+TANK_READY_TIMEOUT = 20 * 60
+
 # Kubeconfig related stuffs
 KUBECONFIG = os.environ.get("KUBECONFIG", os.path.expanduser("~/.kube/config"))
 
@@ -1,12 +1,10 @@
-import io
 import json
 import os
 import subprocess
 import sys
+import tempfile
 import time
-import zipapp
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from multiprocessing import Pool
+from concurrent.futures import as_completed
 from pathlib import Path
 from typing import Optional
 
@@ -16,25 +14,47 @@ from inquirer.themes import GreenPassion
 from kubernetes.client.models import V1Pod
 from rich import print
 from rich.console import Console
+from rich.progress import (
+    DownloadColumn,
+    Progress,
+    TextColumn,
+    TimeElapsedColumn,
+    TransferSpeedColumn,
+)
 from rich.prompt import Confirm, Prompt
 from rich.table import Table
 
 from .constants import (
     BITCOINCORE_CONTAINER,
+    COMMANDER_ARCHIVE,
     COMMANDER_CHART,
     COMMANDER_CONTAINER,
     COMMANDER_MISSION,
+    HELM_RELEASE_SELECTOR,
+    MISSION_SELECTOR,
+    RELEASE_DELETE_BATCH,
+    SCENARIO_ARCHIVE_SELECTOR,
+    SNAPSHOT_COMPRESSIONS,
+    SNAPSHOT_SUFFIXES,
+    TANK_CHART_SELECTOR,
+    TANK_METRICS_SELECTOR,
     TANK_MISSION,
+    TEARDOWN_TIMEOUT,
+    TOPOLOGY_CONFIGMAP_LIMIT,
 )
 from .k8s import (
     can_delete_pods,
+    delete_collection,
     delete_pod,
     get_default_namespace,
     get_default_namespace_or,
+    get_helm_releases,
     get_mission,
     get_namespaces,
+    get_network_topology,
     get_pod,
-    get_pods,
+    get_pod_informer,
+    list_pods,
     pod_log,
     snapshot_bitcoin_datadir,
     wait_for_init,
@@ -42,6 +62,9 @@ from .k8s import (
     write_file_to_container,
 )
 from .process import run_command, stream_command
+from .scenario_archive import scenario_archive, store_archive
+from .scheduler import Priority, get_scheduler
+from .snapshot_store import SnapshotStore, load_manifest, snapshot_tanks_to_store
 
 console = Console()
 
@@ -128,7 +151,7 @@ def _stop_single(scenario: str) -> str:
 
 def stop_all_scenarios(scenarios) -> None:
     """
-    Stop all active scenarios in parallel using multiprocessing
+    Stop all active scenarios in parallel on the shared scheduler
 
     Args:
         scenarios: List of scenario names to stop
@@ -137,8 +160,8 @@ def stop_all_scenarios(scenarios) -> None:
         None
     """
 
-    with console.status("[bold yellow]Stopping all scenarios...[/bold yellow]"), Pool() as pool:
-        results = pool.map(_stop_single, scenarios)
+    with console.status("[bold yellow]Stopping all scenarios...[/bold yellow]"):
+        results = get_scheduler().run_all([(_stop_single, (scenario,)) for scenario in scenarios])
 
     for result in results:
         console.print(f"[bold green]{result}[/bold green]")
@@ -156,33 +179,22 @@ def stop_all_scenarios(scenarios) -> None:
 def down(force):
     """Bring down a running warnet quickly"""
 
-    def uninstall_release(namespace, release_name):
-        cmd = f"helm uninstall {release_name} --namespace {namespace} --wait=false"
-        subprocess.Popen(cmd, shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        return f"Initiated uninstall for: {release_name} in namespace {namespace}"
-
-    def delete_pod(pod_name, namespace):
-        cmd = f"kubectl delete pod --ignore-not-found=true {pod_name} -n {namespace} --grace-period=0 --force"
-        subprocess.Popen(cmd, shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        return f"Initiated deletion of pod: {pod_name} in namespace {namespace}"
-
     if not can_delete_pods():
         click.secho("You do not have permission to bring down the network.", fg="red")
         return
 
-    namespaces = get_namespaces()
-    release_list: list[dict[str, str]] = []
-    for v1namespace in namespaces:
-        namespace = v1namespace.metadata.name
-        command = f"helm list --namespace {namespace} -o json"
-        result = run_command(command)
-        if result:
-            releases = json.loads(result)
-            for release in releases:
-                release_list.append({"namespace": namespace, "name": release["name"]})
+    scheduler = get_scheduler()
+    namespaces = [namespace.metadata.name for namespace in get_namespaces()]
+    # get_helm_releases is rate limited per request, not per task
+    release_lists = scheduler.run_all(
+        [(get_helm_releases, (namespace,)) for namespace in namespaces], cost=0
+    )
+    releases = {ns: names for ns, names in zip(namespaces, release_lists) if names}
+    # Tanks deployed with `deploy --bulk` have no helm release
+    mission_namespaces = {pod.metadata.namespace for pod in list_pods(MISSION_SELECTOR)}
+    affected_namespaces = sorted(set(releases) | mission_namespaces)
 
     if not force:
-        affected_namespaces = set([entry["namespace"] for entry in release_list])
         namespace_listing = "\n  ".join(affected_namespaces)
         confirmed = "confirmed"
         click.secho("Preparing to bring down the running Warnet...", fg="yellow")
@@ -209,27 +221,116 @@ def down(force):
             click.secho("Operation cancelled by user", fg="yellow")
             sys.exit(0)
 
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        futures = []
+    futures = {
+        scheduler.submit(
+            teardown_namespace,
+            namespace,
+            releases.get(namespace, []),
+            name=f"teardown {namespace}",
+            priority=Priority.NETWORK,
+            cost=0,
+        ): namespace
+        for namespace in affected_namespaces
+    }
+    complete = True
+    for future in as_completed(futures):
+        try:
+            finished, summary = future.result()
+        except Exception as e:
+            finished, summary = False, f"Failed to tear down namespace {futures[future]}: {e}"
+        complete = complete and finished
+        console.print(f"[yellow]{summary}[/yellow]")
 
-        # Uninstall Helm releases
-        for release in release_list:
-            futures.append(
-                executor.submit(uninstall_release, release["namespace"], release["name"])
-            )
+    if complete:
+        console.print("[bold green]Warnet teardown process completed.[/bold green]")
+    else:
+        console.print("[bold red]Warnet teardown did not complete, see above.[/bold red]")
 
-        # Delete remaining pods
-        pods = get_pods()
-        for pod in pods:
-            futures.append(executor.submit(delete_pod, pod.metadata.name, pod.metadata.namespace))
 
-        # Wait for all tasks to complete and print results
-        for future in as_completed(futures):
-            console.print(f"[yellow]{future.result()}[/yellow]")
+def teardown_namespace(namespace: str, releases: list[str]) -> tuple[bool, str]:
+    """
+    Delete everything warnet deployed in `namespace` and wait until its pods are really gone.
 
-    console.print("[bold yellow]Teardown process initiated for all components.[/bold yellow]")
-    console.print("[bold yellow]Note: Some processes may continue in the background.[/bold yellow]")
-    console.print("[bold green]Warnet teardown process completed.[/bold green]")
+    Tanks, whether helm releases or `deploy --bulk` objects, and stored scenario archives are
+    removed with one deletecollection request per kind, and their release secrets in batches,
+    rather than a `helm uninstall` each. Other releases (commanders, logging, ingress...) are
+    uninstalled by helm, which waits for their resources to be deleted. Returns whether the
+    teardown finished, and a summary.
+    """
+    start = time.monotonic()
+    scheduler = get_scheduler()
+    tank_releases = set()
+    for pod in get_mission(TANK_MISSION, namespace):
+        labels = pod.metadata.labels or {}
+        if labels.get("app.kubernetes.io/managed-by") == "Helm":
+            tank_releases.add(labels.get("app.kubernetes.io/instance", pod.metadata.name))
+    other_releases = [release for release in releases if release not in tank_releases]
+
+    deletes = [
+        ("v1", "Pod", MISSION_SELECTOR, 0),
+        ("v1", "Service", TANK_CHART_SELECTOR, None),
+        ("v1", "ConfigMap", TANK_CHART_SELECTOR, None),
+        ("monitoring.coreos.com/v1", "ServiceMonitor", TANK_METRICS_SELECTOR, None),
+        ("v1", "ConfigMap", SCENARIO_ARCHIVE_SELECTOR, None),
+    ]
+    batches = sorted(tank_releases)
+    for i in range(0, len(batches), RELEASE_DELETE_BATCH):
+        batch = ",".join(batches[i : i + RELEASE_DELETE_BATCH])
+        deletes.append(("v1", "Secret", f"{HELM_RELEASE_SELECTOR},name in ({batch})", None))
+
+    futures = [
+        scheduler.submit(
+            delete_collection,
+            api_version,
+            kind,
+            namespace,
+            selector,
+            grace,
+            name=f"delete {kind}s in {namespace}",
+            priority=Priority.NETWORK,
+            cost=0,
+        )
+        for api_version, kind, selector, grace in deletes
+    ]
+    uninstalls = [
+        scheduler.submit(
+            uninstall_release,
+            namespace,
+            release,
+            name=f"uninstall {release} in {namespace}",
+            priority=Priority.NETWORK,
+        )
+        for release in other_releases
+    ]
+    scheduler.wait(futures + uninstalls)
+    deleted = [future.result() for future in futures]
+    failed = [release for release, f in zip(other_releases, uninstalls) if not f.result()]
+
+    # deletecollection returns as soon as the pods are marked for deletion, so watch them go
+    informer = get_pod_informer(namespace, label_selector=MISSION_SELECTOR)
+    gone = informer.wait_for(lambda pods: not pods, TEARDOWN_TIMEOUT)
+
+    summary = (
+        f"Namespace {namespace}: deleted {deleted[0]} pods, {deleted[1]} services, "
+        f"{deleted[2] + deleted[4]} configmaps and {len(tank_releases)} tank releases, "
+        f"uninstalled {len(other_releases) - len(failed)} releases "
+        f"in {time.monotonic() - start:.1f}s"
+    )
+    if failed:
+        summary += f"; failed to uninstall {', '.join(failed)}"
+    if not gone:
+        summary += f"; {len(informer.pods())} pods still terminating"
+    return gone and not failed, summary
+
+
+def uninstall_release(namespace: str, release: str) -> bool:
+    cmd = f"helm uninstall {release} --namespace {namespace} --wait --timeout {TEARDOWN_TIMEOUT}s"
+    try:
+        run_command(cmd)
+        return True
+    except Exception as e:
+        click.echo(f"Failed to uninstall {release} in namespace {namespace}: {e}")
+        return False
 
 
 def get_active_network(namespace):
@@ -260,6 +361,12 @@ def get_active_network(namespace):
 @click.argument("additional_args", nargs=-1, type=click.UNPROCESSED)
 @click.option("--admin", is_flag=True, default=False, show_default=False)
 @click.option("--namespace", default=None, show_default=True)
+@click.option(
+    "--discover",
+    is_flag=True,
+    default=False,
+    help="Have the commander list the network itself instead of passing it the current one",
+)
 def run(
     scenario_file: str,
     debug: bool,
@@ -267,12 +374,13 @@ def run(
     additional_args: tuple[str],
     admin: bool,
     namespace: Optional[str],
+    discover: bool,
 ):
     """
     Run a scenario from a file.
     Pass `-- --help` to get individual scenario help
     """
-    return _run(scenario_file, debug, source_dir, additional_args, admin, namespace)
+    return _run(scenario_file, debug, source_dir, additional_args, admin, namespace, discover)
 
 
 def _run(
@@ -282,6 +390,7 @@ def _run(
     additional_args: tuple[str],
     admin: bool,
     namespace: Optional[str],
+    discover: bool = False,
 ) -> str:
     namespace = get_default_namespace_or(namespace)
 
@@ -294,47 +403,21 @@ def _run(
 
     name = f"commander-{scenario_name.replace('_', '')}-{int(time.time())}"
 
-    # Create in-memory buffer to store python archive instead of writing to disk
-    archive_buffer = io.BytesIO()
-
-    # No need to copy the entire scenarios/ directory into the archive
-    def filter(path):
-        if any(needle in str(path) for needle in [".pyc", ".csv", ".DS_Store"]):
-            return False
-        if any(
-            needle in str(path)
-            for needle in [
-                "__init__.py",
-                "commander.py",
-                "test_framework",
-                "ln_framework",
-                scenario_path.name,
-            ]
+    archive = scenario_archive(scenario_path, scenario_dir)
+    # Commanders mount an archive stored in the namespace, otherwise it is uploaded to each one
+    stored = store_archive(archive, namespace)
+
+    # Saves every commander listing the network from the cluster when it starts
+    topology = None
+    if not discover:
+        network = get_network_topology(namespace, cluster_wide=admin)
+        topology = json.dumps(network)
+        # Tanks that aren't scheduled yet have no IP, so the commander has to look for them, as
+        # it does when the topology is too large for its ConfigMap, e.g. thousands of channels
+        if any(tank["rpc_host"] is None for tank in network["tanks"]) or (
+            len(topology.encode()) > TOPOLOGY_CONFIGMAP_LIMIT
         ):
-            print(f"Including: {path}")
-            return True
-        return False
-
-    # In case the scenario file is not in the root of the archive directory,
-    # we need to specify its relative path as a submodule
-    # First get the path of the file relative to the source directory
-    relative_path = scenario_path.relative_to(scenario_dir)
-    # Remove the '.py' extension
-    relative_name = relative_path.with_suffix("")
-    # Replace path separators with dots and pray the user included __init__.py
-    module_name = ".".join(relative_name.parts)
-    # Compile python archive
-    zipapp.create_archive(
-        source=scenario_dir,
-        target=archive_buffer,
-        main=f"{module_name}:main",
-        compressed=True,
-        filter=filter,
-    )
-
-    # Encode the binary data as Base64
-    archive_buffer.seek(0)
-    archive_data = archive_buffer.read()
+            topology = None
 
     # Start the commander pod with python and init containers
     try:
@@ -352,13 +435,20 @@ def _run(
         # Add additional arguments
         if admin:
             helm_command.extend(["--set", "admin=true"])
+        if stored:
+            helm_command.extend(["--set", f"archiveConfigMap={archive.config_map}"])
         if additional_args:
             helm_command.extend(["--set", f"args={' '.join(additional_args)}"])
 
         helm_command.extend([name, COMMANDER_CHART])
 
         # Execute Helm command
-        result = subprocess.run(helm_command, check=True, capture_output=True, text=True)
+        with tempfile.NamedTemporaryFile("w", prefix="warnet-topology-", suffix=".json") as f:
+            if topology is not None:
+                f.write(topology)
+                f.flush()
+                helm_command.extend(["--set-file", f"topology={f.name}"])
+            result = subprocess.run(helm_command, check=True, capture_output=True, text=True)
 
         if result.returncode == 0:
             print(f"Successfully deployed scenario commander: {scenario_name}")
@@ -373,11 +463,12 @@ def _run(
         return None
 
     # upload scenario files and network data to the init container
-    wait_for_init(name, namespace=namespace)
-    if write_file_to_container(
-        name, "init", "/shared/archive.pyz", archive_data, namespace=namespace
-    ):
-        print(f"Successfully uploaded scenario data to commander: {scenario_name}")
+    if not stored:
+        wait_for_init(name, namespace=namespace)
+        if write_file_to_container(
+            name, "init", COMMANDER_ARCHIVE, archive.path, namespace=namespace
+        ):
+            print(f"Successfully uploaded scenario data to commander: {scenario_name}")
 
     if debug:
         print("Waiting for commander pod to start...")
@@ -481,8 +572,41 @@ def _logs(pod_name: str, follow: bool, namespace: Optional[str] = None):
     type=str,
     help="Comma-separated list of directories and/or files to include in the snapshot",
 )
-def snapshot(tank_name, snapshot_all, output, filter):
+@click.option(
+    "--compression",
+    "-c",
+    type=click.Choice(SNAPSHOT_COMPRESSIONS),
+    default="gzip",
+    show_default=True,
+    help="Compress snapshots locally as they stream out of the tanks",
+)
+@click.option("--level", type=int, help="Compression level (default: 6 for gzip, 3 for zstd)")
+@click.option(
+    "--store",
+    "-s",
+    type=click.Path(file_okay=False),
+    help="Snapshot into a deduplicating snapshot store instead of writing tarballs",
+)
+@click.option(
+    "--restore",
+    "-r",
+    is_flag=True,
+    help="Write tarballs of tanks' snapshots from --store to --output, without a cluster",
+)
+@click.option("--manifest", "-m", type=str, help="Snapshot to restore (default: the latest)")
+def snapshot(tank_name, snapshot_all, output, filter, compression, level, store, restore, manifest):
     """Create a snapshot of a tank's Bitcoin data or snapshot all tanks"""
+    if restore:
+        if not store:
+            raise click.UsageError("--restore needs --store")
+        if not (tank_name or snapshot_all):
+            raise click.UsageError("Name a tank to restore, or use --all")
+        os.makedirs(output, exist_ok=True)
+        restore_from_store(
+            SnapshotStore(Path(store)), tank_name, manifest, output, compression, level
+        )
+        return
+
     tanks = get_mission("tank")
 
     if not tanks:
@@ -493,12 +617,13 @@ def snapshot(tank_name, snapshot_all, output, filter):
     os.makedirs(output, exist_ok=True)
 
     filter_list = [f.strip() for f in filter.split(",")] if filter else None
+    options = (compression, level, store)
     if snapshot_all:
-        snapshot_all_tanks(tanks, output, filter_list)
+        snapshot_all_tanks(tanks, output, filter_list, *options)
     elif tank_name:
-        snapshot_single_tank(tank_name, tanks, output, filter_list)
+        snapshot_single_tank(tank_name, tanks, output, filter_list, *options)
     else:
-        select_and_snapshot_tank(tanks, output, filter_list)
+        select_and_snapshot_tank(tanks, output, filter_list, *options)
 
 
 def find_tank_by_name(tanks, tank_name):
@@ -508,25 +633,24 @@ def find_tank_by_name(tanks, tank_name):
     return None
 
 
-def snapshot_all_tanks(tanks, output_dir, filter_list):
-    with console.status("[bold yellow]Snapshotting all tanks...[/bold yellow]"):
-        for tank in tanks:
-            tank_name = tank.metadata.name
-            chain = tank.metadata.labels["chain"]
-            snapshot_tank(tank_name, chain, output_dir, filter_list)
+def snapshot_all_tanks(tanks, output_dir, filter_list, compression="gzip", level=None, store=None):
+    snapshot_tanks(tanks, output_dir, filter_list, compression, level, store)
     console.print("[bold green]All tank snapshots completed.[/bold green]")
 
 
-def snapshot_single_tank(tank_name, tanks, output_dir, filter_list):
+def snapshot_single_tank(
+    tank_name, tanks, output_dir, filter_list, compression="gzip", level=None, store=None
+):
     tank = find_tank_by_name(tanks, tank_name)
     if tank:
-        chain = tank.metadata.labels["chain"]
-        snapshot_tank(tank_name, chain, output_dir, filter_list)
+        snapshot_tanks([tank], output_dir, filter_list, compression, level, store)
     else:
         console.print(f"[bold red]No active tank found with name: {tank_name}[/bold red]")
 
 
-def select_and_snapshot_tank(tanks, output_dir, filter_list):
+def select_and_snapshot_tank(
+    tanks, output_dir, filter_list, compression="gzip", level=None, store=None
+):
     table = Table(title="Active Tanks", show_header=True, header_style="bold magenta")
     table.add_column("Number", style="cyan", justify="right")
     table.add_column("Tank Name", style="green")
@@ -548,19 +672,190 @@ def select_and_snapshot_tank(tanks, output_dir, filter_list):
         return
 
     selected_tank = tanks[int(choice) - 1]
-    tank_name = selected_tank.metadata.name
-    chain = selected_tank.metadata.labels["chain"]
-    snapshot_tank(tank_name, chain, output_dir, filter_list)
+    snapshot_tanks([selected_tank], output_dir, filter_list, compression, level, store)
 
 
-def snapshot_tank(tank_name, chain, output_dir, filter_list):
-    try:
-        output_path = Path(output_dir).resolve()
-        snapshot_bitcoin_datadir(tank_name, chain, str(output_path), filter_list)
+def snapshot_tanks(tanks, output_dir, filter_list, compression="gzip", level=None, store=None):
+    """
+    Snapshot tanks concurrently on the shared scheduler, showing each running snapshot's
+    progress and throughput and reporting every tank as it finishes.
+    """
+    if store:
+        snapshot_tanks_into_store(tanks, SnapshotStore(Path(store)), filter_list)
+        return
+    output_path = Path(output_dir).resolve()
+    scheduler = get_scheduler()
+    columns = (
+        TextColumn("{task.description}"),
+        DownloadColumn(),
+        TransferSpeedColumn(),
+        TimeElapsedColumn(),
+    )
+    done = read = written = 0
+    start = time.monotonic()
+    with Progress(*columns, console=console, transient=True) as progress:
+
+        def run(tank_name, chain, namespace):
+            task = progress.add_task(tank_name, total=None)
+            try:
+                return snapshot_bitcoin_datadir(
+                    tank_name,
+                    chain,
+                    str(output_path),
+                    filter_list,
+                    namespace=namespace,
+                    compression=compression,
+                    level=level,
+                    progress=lambda n: progress.update(task, advance=n),
+                )
+            except Exception as e:
+                # Reported below along with the other results
+                return e
+            finally:
+                progress.remove_task(task)
+
+        futures = {
+            scheduler.submit(
+                run,
+                tank.metadata.name,
+                tank.metadata.labels["chain"],
+                tank.metadata.namespace,
+                name=f"snapshot {tank.metadata.name}",
+            ): tank.metadata.name
+            for tank in tanks
+        }
+        for future in as_completed(futures):
+            tank_name = futures[future]
+            result = future.result()
+            if isinstance(result, Exception):
+                console.print(
+                    f"[bold red]Failed to create snapshot for tank {tank_name}: {result}[/bold red]"
+                )
+                continue
+            if result is None:
+                console.print(f"[bold yellow]No matching files found in {tank_name}[/bold yellow]")
+                continue
+            done += 1
+            read += result.read
+            written += result.written
+            rate = result.read / max(result.seconds, 1e-3)
+            console.print(
+                f"[bold green]Successfully created snapshot for tank: {tank_name}[/bold green] "
+                f"{_mib(result.read)} MiB in {result.seconds:.1f}s ({_mib(rate)} MiB/s), "
+                f"{_mib(result.written)} MiB written to {result.path.name}"
+            )
+
+    if not done:
+        return
+    if len(tanks) > 1:
+        elapsed = time.monotonic() - start
         console.print(
-            f"[bold green]Successfully created snapshot for tank: {tank_name}[/bold green]"
+            f"Snapshotted {done} of {len(tanks)} tanks: {_mib(read)} MiB read, {_mib(written)} MiB written "
+            f"in {elapsed:.1f}s ({_mib(read / max(elapsed, 1e-3))} MiB/s)"
         )
-    except Exception as e:
+    suffix = SNAPSHOT_SUFFIXES[compression]
+    flags = {"gzip": "-xzf", "zstd": "--zstd -xf", "none": "-xf"}[compression]
+    console.print("To untar and repopulate the directory, use the following command:")
+    console.print(
+        f"tar {flags} <tank>_bitcoin_data{suffix} -C /path/to/destination/.bitcoin/<chain>"
+    )
+
+
+def snapshot_tanks_into_store(tanks, store: SnapshotStore, filter_list):
+    chunks_before, size_before = store.usage()
+    columns = (TextColumn("{task.description}"), DownloadColumn(), TransferSpeedColumn())
+    start = time.monotonic()
+    with Progress(*columns, console=console, transient=True) as progress:
+        task = progress.add_task("Fetching new chunks", total=None)
+        results = snapshot_tanks_to_store(
+            store,
+            [
+                (tank.metadata.namespace, tank.metadata.name, tank.metadata.labels["chain"])
+                for tank in tanks
+            ],
+            filter_list,
+            progress=lambda n: progress.update(task, advance=n),
+        )
+    elapsed = time.monotonic() - start
+
+    for result in results:
+        if result.error:
+            console.print(
+                f"[bold red]Failed to snapshot tank {result.tank}: {result.error}[/bold red]"
+            )
+        elif result.manifest is None:
+            console.print(f"[bold yellow]No matching files found in {result.tank}[/bold yellow]")
+        else:
+            console.print(
+                f"[bold green]Snapshotted tank {result.tank}[/bold green] as "
+                f"{result.manifest.stem}: {result.files} files, {_mib(result.size)} MiB, "
+                f"{_mib(result.hashed)} MiB hashed, {_mib(result.fetched)} MiB fetched"
+            )
+
+    if not any(r.manifest for r in results):
+        return
+    chunks, size = store.usage()
+    total = sum(r.size for r in results if r.manifest)
+    console.print(
+        f"Snapshot store {store.root}: {chunks} chunks, {_mib(size)} MiB "
+        f"({_mib(size - size_before)} MiB new in {elapsed:.1f}s) for {_mib(total)} MiB of tank data"
+    )
+    console.print("To write a snapshot out as a tarball for loadSnapshot, use:")
+    console.print(f"warnet snapshot <tank> --store {store.root} --restore --output <directory>")
+
+
+def restore_from_store(
+    store: SnapshotStore,
+    tank_name: Optional[str],
+    manifest_id: Optional[str],
+    output_dir: str,
+    compression: str = "gzip",
+    level: Optional[int] = None,
+):
+    """
+    Write tarballs of the latest (or `manifest_id`) snapshots in the store for one tank,
+    given as `tank` or `namespace/tank`, or for every tank when `tank_name` is None
+    """
+    tanks = store.tanks()
+    if tank_name:
+        namespace, _, name = tank_name.rpartition("/")
+        tanks = [(ns, t) for ns, t in tanks if t == name and namespace in ("", ns)]
+        if not tanks:
+            console.print(f"[bold red]No snapshots of {tank_name} in {store.root}[/bold red]")
+            return
+        if len(tanks) > 1:
+            console.print(
+                f"[bold red]{tank_name} has snapshots in several namespaces, "
+                f"use namespace/{name}[/bold red]"
+            )
+            return
+    if not tanks:
+        console.print(f"[bold red]No snapshots in {store.root}[/bold red]")
+        return
+
+    suffix = SNAPSHOT_SUFFIXES[compression]
+    # Tanks from several namespaces may share names, so keep their tarballs apart
+    per_namespace = len({ns for ns, _ in tanks}) > 1
+    for ns, tank in tanks:
+        if manifest_id:
+            path = store.manifest_dir(ns, tank) / f"{manifest_id}.json"
+            if not path.exists():
+                console.print(f"[bold red]No snapshot {manifest_id} of {tank}[/bold red]")
+                continue
+        else:
+            path = store.manifests(ns, tank)[-1]
+        out_dir = Path(output_dir) / ns if per_namespace else Path(output_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        out_path = out_dir / f"{tank}_bitcoin_data{suffix}"
+        try:
+            store.restore(load_manifest(path), out_path, compression, level)
+        except Exception as e:
+            console.print(f"[bold red]Failed to restore {tank} from {path.stem}: {e}[/bold red]")
+            continue
         console.print(
-            f"[bold red]Failed to create snapshot for tank {tank_name}: {str(e)}[/bold red]"
+            f"[bold green]Restored {tank} snapshot {path.stem} to {out_path}[/bold green]"
         )
+
+
+def _mib(n: float) -> str:
+    return f"{n / (1 << 20):.1f}"
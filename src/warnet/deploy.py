@@ -1,17 +1,21 @@
+import hashlib
 import json
 import subprocess
 import sys
 import tempfile
-from multiprocessing import Process
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional
+from typing import NamedTuple, Optional
 
 import click
 import yaml
 
 from .constants import (
     BITCOIN_CHART_LOCATION,
+    BULK_MANAGED_BY,
+    BULK_RELEASE_PLACEHOLDER,
     CADDY_CHART,
+    CONFIG_HASH_ANNOTATION,
     DEFAULTS_FILE,
     DEFAULTS_NAMESPACE_FILE,
     FORK_OBSERVER_CHART,
@@ -25,6 +29,8 @@ from .constants import (
     NETWORK_FILE,
     PLUGIN_ANNEX,
     SCENARIOS_DIR,
+    TANK_MISSION,
+    TANK_READY_TIMEOUT,
     WARGAMES_NAMESPACE_PREFIX,
     AnnexMember,
     HookValue,
@@ -32,15 +38,26 @@ from .constants import (
 )
 from .control import _logs, _run
 from .k8s import (
+    annotate_pod,
     get_default_namespace,
     get_default_namespace_or,
     get_mission,
     get_namespaces_by_type,
+    server_side_apply,
     wait_for_ingress_controller,
     wait_for_pod,
     wait_for_pod_ready,
+    wait_for_pods_ready,
 )
 from .process import run_command, stream_command
+from .scheduler import Priority, get_scheduler
+from .snapshot_cache import (
+    SnapshotSource,
+    deploy_snapshot_cache,
+    format_cache_stats,
+    route_snapshots,
+    snapshot_cache_stats,
+)
 
 HINT = "\nAre you trying to run a scenario? See `warnet run --help`"
 
@@ -65,67 +82,129 @@ def validate_directory(ctx, param, value):
 @click.option("--debug", is_flag=True)
 @click.option("--namespace", type=str, help="Specify a namespace in which to deploy the network")
 @click.option("--to-all-users", is_flag=True, help="Deploy network to all user namespaces")
+@click.option("--wait", is_flag=True, help="Wait for tanks to be ready, reporting each one")
+@click.option(
+    "--bulk",
+    is_flag=True,
+    help="Render all tanks with helm template and apply them server-side, for large networks",
+)
+@click.option(
+    "--plan",
+    is_flag=True,
+    help="Show which tanks would be added, changed or removed without deploying anything",
+)
 @click.argument("unknown_args", nargs=-1)
-def deploy(directory, debug, namespace, to_all_users, unknown_args):
+def deploy(directory, debug, namespace, to_all_users, wait, bulk, plan, unknown_args):
     """Deploy a warnet with topology loaded from <directory>"""
     if unknown_args:
         raise click.BadParameter(f"Unknown args: {unknown_args}{HINT}")
 
-    _deploy(directory, debug, namespace, to_all_users)
+    _deploy(directory, debug, namespace, to_all_users, wait, bulk, plan)
 
 
-def _deploy(directory, debug, namespace, to_all_users):
+def _deploy(directory, debug, namespace, to_all_users, wait=False, bulk=False, plan=False):
     """Deploy a warnet with topology loaded from <directory>"""
     directory = Path(directory)
 
+    if plan and not to_all_users:
+        if not (directory / NETWORK_FILE).exists():
+            click.echo("Error: --plan needs a network.yaml in the specified directory.")
+            return
+        namespace = get_default_namespace_or(namespace)
+        network_file, _ = load_network(directory, namespace)
+        print_plan(plan_network(network_file, directory, namespace), namespace)
+        return
+
+    scheduler = get_scheduler()
+
     if to_all_users:
         namespaces = get_namespaces_by_type(WARGAMES_NAMESPACE_PREFIX)
-        processes = []
-        for namespace in namespaces:
-            p = Process(target=_deploy, args=(directory, debug, namespace.metadata.name, False))
-            p.start()
-            processes.append(p)
-        for p in processes:
-            p.join()
+        futures = [
+            scheduler.submit(
+                _deploy,
+                directory,
+                debug,
+                namespace.metadata.name,
+                False,
+                wait,
+                bulk,
+                plan,
+                name=f"deploy to {namespace.metadata.name}",
+                priority=Priority.NETWORK,
+                cost=0,
+            )
+            for namespace in namespaces
+        ]
+        if any(f.exception() is not None for f in scheduler.wait(futures)):
+            sys.exit(1)
         return
 
     if (directory / NETWORK_FILE).exists():
         run_plugins(directory, HookValue.PRE_DEPLOY, namespace)
 
-        processes = []
         # Deploy logging CRD first to avoid synchronisation issues
-        deploy_logging_crd(directory, debug)
+        scheduler.wait(
+            [
+                scheduler.submit(
+                    deploy_logging_crd, directory, debug, name="logging CRDs", priority=Priority.CRD
+                )
+            ]
+        )
 
-        logging_process = Process(target=deploy_logging_stack, args=(directory, debug))
-        logging_process.start()
-        processes.append(logging_process)
+        futures = [
+            scheduler.submit(
+                deploy_logging_stack,
+                directory,
+                debug,
+                name="logging stack",
+                priority=Priority.INFRA,
+            )
+        ]
 
         run_plugins(directory, HookValue.PRE_NETWORK, namespace)
 
-        network_process = Process(target=deploy_network, args=(directory, debug, namespace))
-        network_process.start()
-
-        ingress_process = Process(target=deploy_ingress, args=(directory, debug))
-        ingress_process.start()
-        processes.append(ingress_process)
-
-        caddy_process = Process(target=deploy_caddy, args=(directory, debug))
-        caddy_process.start()
-        processes.append(caddy_process)
+        network = scheduler.submit(
+            deploy_network,
+            directory,
+            debug,
+            namespace,
+            wait,
+            bulk,
+            name="network",
+            priority=Priority.NETWORK,
+            cost=0,
+        )
+        futures.append(
+            scheduler.submit(
+                deploy_ingress, directory, debug, name="ingress", priority=Priority.INFRA
+            )
+        )
+        futures.append(
+            scheduler.submit(deploy_caddy, directory, debug, name="caddy", priority=Priority.INFRA)
+        )
 
-        # Wait for the network process to complete
-        network_process.join()
+        # Wait for the network to complete
+        scheduler.wait([network])
+        if network.exception() is not None:
+            # The scheduler has reported the error. Let the other tasks finish, then fail.
+            scheduler.wait(futures)
+            sys.exit(1)
 
         run_plugins(directory, HookValue.POST_NETWORK, namespace)
 
-        # Start the fork observer process immediately after network process completes
-        fork_observer_process = Process(target=deploy_fork_observer, args=(directory, debug))
-        fork_observer_process.start()
-        processes.append(fork_observer_process)
+        # Start the fork observer immediately after the network completes
+        futures.append(
+            scheduler.submit(
+                deploy_fork_observer,
+                directory,
+                debug,
+                name="fork observer",
+                priority=Priority.INFRA,
+            )
+        )
 
-        # Wait for all other processes to complete
-        for p in processes:
-            p.join()
+        # Wait for everything else to complete
+        scheduler.wait(futures)
 
         run_plugins(directory, HookValue.POST_DEPLOY, namespace)
 
@@ -147,7 +226,7 @@ def run_plugins(directory, hook_value: HookValue, namespace, annex: Optional[dic
         if not isinstance(network_file, dict):
             raise ValueError(f"Invalid network file structure: {network_file_path}")
 
-    processes = []
+    commands = []
 
     plugins_section = network_file.get("plugins", {})
     hook_section = plugins_section.get(hook_value.value, {})
@@ -173,8 +252,7 @@ def run_plugins(directory, hook_value: HookValue, namespace, annex: Optional[dic
                     f"Queuing {hook_value.value} plugin command: {plugin_name} with {plugin_content}"
                 )
 
-                process = Process(target=run_command, args=(cmd,))
-                processes.append(process)
+                commands.append((plugin_name, cmd))
 
             case _:
                 print(
@@ -182,14 +260,21 @@ def run_plugins(directory, hook_value: HookValue, namespace, annex: Optional[dic
                 )
                 sys.exit(1)
 
-    if processes:
+    if commands:
         print(f"Starting {hook_value.value} plugins")
 
-        for process in processes:
-            process.start()
-
-        for process in processes:
-            process.join()
+        scheduler = get_scheduler()
+        scheduler.wait(
+            [
+                scheduler.submit(
+                    run_command,
+                    cmd,
+                    name=f"{hook_value.value} plugin {plugin_name}",
+                    priority=Priority.NETWORK,
+                )
+                for plugin_name, cmd in commands
+            ]
+        )
 
         print(f"Completed {hook_value.value} plugins")
 
@@ -357,12 +442,15 @@ rpc_password = "tabconf2024"
     return True
 
 
-def deploy_network(directory: Path, debug: bool = False, namespace: Optional[str] = None):
-    network_file_path = directory / NETWORK_FILE
+def deploy_network(
+    directory: Path,
+    debug: bool = False,
+    namespace: Optional[str] = None,
+    wait: bool = False,
+    bulk: bool = False,
+):
     namespace = get_default_namespace_or(namespace)
-
-    with network_file_path.open() as f:
-        network_file = yaml.safe_load(f)
+    network_file, snapshots = load_network(directory, namespace)
 
     needs_ln_init = False
     for node in network_file["nodes"]:
@@ -370,21 +458,72 @@ def deploy_network(directory: Path, debug: bool = False, namespace: Optional[str
             needs_ln_init = True
             break
 
-    processes = []
-    for node in network_file["nodes"]:
-        p = Process(target=deploy_single_node, args=(node, directory, debug, namespace))
-        p.start()
-        processes.append(p)
+    plan = plan_network(network_file, directory, namespace)
+    print_plan(plan, namespace, summary_only=True)
+    updates = set(plan.added) | set(plan.changed)
+    nodes = [node for node in network_file["nodes"] if node["name"] in updates]
+
+    scheduler = get_scheduler()
+    # A running bitcoind won't pick up a new config, so changed tanks are recreated
+    scheduler.run_all(
+        [(remove_node, (name, managed_by, namespace)) for name, managed_by in plan.removed.items()]
+        + [(delete_node_pods, (name, namespace)) for name in plan.changed]
+        + [
+            (annotate_pod, (name, namespace, {CONFIG_HASH_ANNOTATION: plan.hashes[name]}))
+            for name in plan.unknown
+        ],
+        priority=Priority.NETWORK,
+    )
+    # Tanks booting from a snapshot load it through the cache, so start it first
+    cache = bool(nodes) and deploy_snapshot_cache(snapshots, namespace, debug)
+    if nodes and snapshots and not cache:
+        click.echo("The snapshot cache is not up, so tanks will download snapshots themselves")
+        network_file, _ = load_network(directory, namespace, cache=False)
+        plan = plan._replace(hashes=network_hashes(network_file, directory))
+        nodes = [node for node in network_file["nodes"] if node["name"] in updates]
+
+    if bulk:
+        deploy_nodes_bulk(network_file, nodes, plan.hashes, directory, debug, namespace)
+    else:
+        scheduler.wait(
+            [
+                scheduler.submit(
+                    deploy_single_node,
+                    node,
+                    directory,
+                    debug,
+                    namespace,
+                    plan.hashes[node["name"]],
+                    name=f"node {node.get('name')}",
+                    priority=Priority.NETWORK,
+                )
+                for node in nodes
+            ]
+        )
+
+    if wait:
+        names = [node["name"] for node in network_file["nodes"]]
+        ready = []
 
-    for p in processes:
-        p.join()
+        def report(pod):
+            ready.append(pod.metadata.name)
+            click.echo(f"Tank {pod.metadata.name} is ready ({len(ready)}/{len(names)})")
 
-    if needs_ln_init:
+        wait_for_pods_ready(names, namespace, timeout=TANK_READY_TIMEOUT, on_ready=report)
+        if cache:
+            try:
+                click.echo(f"Snapshot cache: {format_cache_stats(snapshot_cache_stats(namespace))}")
+            except Exception as e:
+                click.echo(f"Could not read snapshot cache stats: {e}")
+
+    # Channels are only opened when there are new or recreated nodes to open them on
+    if needs_ln_init and updates:
+        ln_init = network_file.get("ln_init") or {}
         name = _run(
             scenario_file=SCENARIOS_DIR / "ln_init.py",
             debug=False,
             source_dir=SCENARIOS_DIR,
-            additional_args=None,
+            additional_args=("--batch",) if ln_init.get("batch") else None,
             admin=False,
             namespace=namespace,
         )
@@ -392,13 +531,144 @@ def deploy_network(directory: Path, debug: bool = False, namespace: Optional[str
         _logs(pod_name=name, follow=True, namespace=namespace)
 
 
-def deploy_single_node(node, directory: Path, debug: bool, namespace: str):
+def load_network(
+    directory: Path, namespace: str, cache: bool = True
+) -> tuple[dict, dict[str, SnapshotSource]]:
+    """
+    Read network.yaml, with tanks that load snapshots pointed at the namespace's snapshot cache
+    (unless `cache` is false) so their config hashes change if the cache is turned off. Returns
+    the snapshots the cache serves as well.
+    """
+    with (directory / NETWORK_FILE).open() as f:
+        network_file = yaml.safe_load(f)
+    with (directory / DEFAULTS_FILE).open() as f:
+        defaults = yaml.safe_load(f) or {}
+    nodes, snapshots = route_snapshots(network_file, defaults, directory, namespace, cache)
+    return {**network_file, "nodes": nodes}, snapshots
+
+
+class NetworkPlan(NamedTuple):
+    """How a network.yaml differs from the tanks already running in a namespace"""
+
+    hashes: dict[str, str]  # Config hash of every node in network.yaml
+    added: list[str]
+    changed: list[str]
+    unchanged: list[str]
+    removed: dict[str, str]  # Running tanks not in network.yaml, and who manages them
+    # Tanks deployed by a warnet without config hashes. Their config can't be compared, so they
+    # are taken to match network.yaml and annotated with its hash rather than recreated.
+    unknown: list[str]
+
+
+@lru_cache(maxsize=None)
+def chart_digest(chart: str) -> str:
+    """Hash of every file in a chart, so that upgrading warnet redeploys tanks"""
+    root = Path(chart)
+    digest = hashlib.sha256()
+    for path in sorted(p for p in root.rglob("*") if p.is_file()):
+        digest.update(path.relative_to(root).as_posix().encode() + b"\0")
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def node_config_hash(defaults: dict, node: dict) -> str:
+    """Hash of everything that determines how a node is deployed, except its name"""
+    values = {
+        "chart": chart_digest(BITCOIN_CHART_LOCATION),
+        "defaults": defaults,
+        "node": {k: v for k, v in node.items() if k != "name"},
+    }
+    return hashlib.sha256(json.dumps(values, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def node_values(node: dict, config_hash: Optional[str]) -> dict:
+    """A node's network.yaml entry as chart values, with its config hash as a pod annotation"""
+    values = {k: v for k, v in node.items() if k != "name"}
+    if config_hash:
+        annotations = values.get("podAnnotations") or {}
+        values["podAnnotations"] = {**annotations, CONFIG_HASH_ANNOTATION: config_hash}
+    return values
+
+
+def network_hashes(network_file: dict, directory: Path) -> dict[str, str]:
+    with (directory / DEFAULTS_FILE).open() as f:
+        defaults = yaml.safe_load(f) or {}
+    return {node["name"]: node_config_hash(defaults, node) for node in network_file["nodes"]}
+
+
+def plan_network(network_file: dict, directory: Path, namespace: str) -> NetworkPlan:
+    """Compare each node's config hash with the annotation on its running tank"""
+    hashes = network_hashes(network_file, directory)
+    live = {pod.metadata.name: pod for pod in get_mission(TANK_MISSION, namespace)}
+
+    added, changed, unchanged, unknown = [], [], [], []
+    for name, config_hash in hashes.items():
+        pod = live.get(name)
+        if pod is None:
+            added.append(name)
+            continue
+        live_hash = (pod.metadata.annotations or {}).get(CONFIG_HASH_ANNOTATION)
+        if live_hash is None:
+            unknown.append(name)
+        elif live_hash == config_hash:
+            unchanged.append(name)
+        else:
+            changed.append(name)
+    removed = {
+        name: (pod.metadata.labels or {}).get("app.kubernetes.io/managed-by", "")
+        for name, pod in live.items()
+        if name not in hashes
+    }
+    return NetworkPlan(hashes, added, changed, unchanged, removed, unknown)
+
+
+def print_plan(plan: NetworkPlan, namespace: str, summary_only: bool = False):
+    lines = [
+        f"Namespace {namespace}: {len(plan.added)} to add, {len(plan.changed)} to change, "
+        f"{len(plan.removed)} to remove, {len(plan.unchanged)} unchanged"
+    ]
+    if plan.unknown:
+        lines[0] += f", {len(plan.unknown)} without a config hash (annotated, not recreated)"
+    if not summary_only:
+        lines += [f"  + {name}" for name in plan.added]
+        lines += [f"  ~ {name}" for name in plan.changed]
+        lines += [f"  - {name}" for name in plan.removed]
+        lines += [f"  ? {name}" for name in plan.unknown]
+    # One write, so plans for several namespaces don't interleave
+    click.echo("\n".join(lines))
+
+
+def remove_node(name: str, managed_by: str, namespace: str):
+    click.echo(f"Removing node: {name}")
+    if managed_by == BULK_MANAGED_BY:
+        cmd = (
+            f"kubectl delete configmap,service,pod --namespace {namespace} --ignore-not-found "
+            f"-l app.kubernetes.io/instance={name},app.kubernetes.io/managed-by={BULK_MANAGED_BY}"
+        )
+    else:
+        cmd = f"helm uninstall {name} --namespace {namespace}"
+    if not stream_command(cmd):
+        click.echo(f"Failed to remove node {name}: {cmd}")
+
+
+def delete_node_pods(name: str, namespace: str):
+    cmd = (
+        f"kubectl delete pod --namespace {namespace} --ignore-not-found "
+        f"-l app.kubernetes.io/instance={name}"
+    )
+    if not stream_command(cmd):
+        click.echo(f"Failed to delete pods of node {name}: {cmd}")
+
+
+def deploy_single_node(
+    node, directory: Path, debug: bool, namespace: str, config_hash: Optional[str] = None
+):
     defaults_file_path = directory / DEFAULTS_FILE
     click.echo(f"Deploying node: {node.get('name')}")
     temp_override_file_path = ""
     try:
         node_name = node.get("name")
-        node_config_override = {k: v for k, v in node.items() if k != "name"}
+        node_config_override = node_values(node, config_hash)
 
         defaults_file_path = directory / DEFAULTS_FILE
         cmd = f"{HELM_COMMAND} {node_name} {BITCOIN_CHART_LOCATION} --namespace {namespace} -f {defaults_file_path}"
@@ -434,6 +704,118 @@ def deploy_single_node(node, directory: Path, debug: bool, namespace: str):
             Path(temp_override_file_path).unlink()
 
 
+def deploy_nodes_bulk(
+    network_file: dict,
+    nodes: list[dict],
+    hashes: dict[str, str],
+    directory: Path,
+    debug: bool,
+    namespace: str,
+):
+    """
+    Deploy nodes without a helm release each: the bitcoincore chart is rendered with
+    `helm template` once per distinct node configuration (nodes differing only by name share a
+    render) and the manifests are applied server-side, one node per scheduler task.
+    """
+    if not nodes:
+        return
+    configs: dict[str, dict] = {}
+    groups: dict[str, list[str]] = {}
+    for node in nodes:
+        override = node_values(node, hashes.get(node["name"]))
+        key = json.dumps(override, sort_keys=True, default=str)
+        configs[key] = override
+        groups.setdefault(key, []).append(node["name"])
+
+    click.echo(f"Rendering {len(nodes)} nodes from {len(groups)} distinct configurations")
+    scheduler = get_scheduler()
+    # Rendering is local, it doesn't count towards the API rate limit
+    renders = scheduler.run_all(
+        [(render_node, (configs[key], directory, debug, namespace)) for key in groups],
+        priority=Priority.NETWORK,
+        cost=0,
+    )
+    rendered = dict(zip(groups, renders))
+
+    hooks = network_file.get("plugins", {}) or {}
+    node_hooks = [h for h in (HookValue.PRE_NODE, HookValue.POST_NODE) if hooks.get(h.value)]
+    futures = {
+        scheduler.submit(
+            apply_node,
+            name,
+            node_manifests(rendered[key], name, namespace),
+            directory,
+            namespace,
+            node_hooks,
+            name=f"node {name}",
+            priority=Priority.NETWORK,
+            # Each manifest is rate limited as it is applied
+            cost=0,
+        ): name
+        for key, names in groups.items()
+        for name in names
+    }
+    failed = []
+    for future in scheduler.wait(list(futures)):
+        name = futures[future]
+        if future.exception() is None:
+            click.echo(f"Deployed node: {name}")
+        else:
+            click.echo(f"Failed to deploy node {name}: {future.exception()}")
+            failed.append(name)
+    if failed:
+        raise Exception(f"{len(failed)} of {len(nodes)} nodes failed to deploy")
+
+
+def render_node(override: dict, directory: Path, debug: bool, namespace: str) -> str:
+    """Render the bitcoincore chart for one node configuration, named BULK_RELEASE_PLACEHOLDER"""
+    temp_override_file_path = ""
+    try:
+        cmd = (
+            f"helm template {BULK_RELEASE_PLACEHOLDER} {BITCOIN_CHART_LOCATION} "
+            f"--namespace {namespace} -f {directory / DEFAULTS_FILE}"
+        )
+        if debug:
+            cmd += " --debug"
+        if override:
+            with tempfile.NamedTemporaryFile(mode="w", suffix=".yaml", delete=False) as temp_file:
+                yaml.dump(override, temp_file)
+                temp_override_file_path = Path(temp_file.name)
+            cmd = f"{cmd} -f {temp_override_file_path}"
+        return run_command(cmd)
+    finally:
+        if temp_override_file_path:
+            Path(temp_override_file_path).unlink()
+
+
+def node_manifests(rendered: str, name: str, namespace: str) -> list[dict]:
+    """Instantiate a shared render for one node, in the order it should be applied"""
+    manifests = []
+    for manifest in yaml.safe_load_all(rendered.replace(BULK_RELEASE_PLACEHOLDER, name)):
+        if not manifest:
+            continue
+        metadata = manifest.setdefault("metadata", {})
+        metadata["namespace"] = namespace
+        # Not owned by a helm release, so `warnet down` finds these by label instead
+        labels = metadata.setdefault("labels", {})
+        labels["app.kubernetes.io/managed-by"] = BULK_MANAGED_BY
+        manifests.append(manifest)
+    # Pods mount their ConfigMap, so create everything else first
+    return sorted(manifests, key=lambda m: m["kind"] == "Pod")
+
+
+def apply_node(
+    name: str, manifests: list[dict], directory: Path, namespace: str, hooks: list[HookValue]
+):
+    annex = {AnnexMember.NODE_NAME.value: name}
+    if HookValue.PRE_NODE in hooks:
+        run_plugins(directory, HookValue.PRE_NODE, namespace, annex=annex)
+    for manifest in manifests:
+        server_side_apply(manifest)
+    if HookValue.POST_NODE in hooks:
+        run_plugins(directory, HookValue.POST_NODE, namespace, annex=annex)
+
+
 def deploy_namespaces(directory: Path):
     namespaces_file_path = directory / NAMESPACES_FILE
     defaults_file_path = directory / DEFAULTS_NAMESPACE_FILE
@@ -450,14 +832,19 @@ def deploy_namespaces(directory: Path):
             )
             return
 
-    processes = []
-    for namespace in namespaces_file["namespaces"]:
-        p = Process(target=deploy_single_namespace, args=(namespace, defaults_file_path))
-        p.start()
-        processes.append(p)
-
-    for p in processes:
-        p.join()
+    scheduler = get_scheduler()
+    scheduler.wait(
+        [
+            scheduler.submit(
+                deploy_single_namespace,
+                namespace,
+                defaults_file_path,
+                name=f"namespace {namespace.get('name')}",
+                priority=Priority.NETWORK,
+            )
+            for namespace in namespaces_file["namespaces"]
+        ]
+    )
 
 
 def deploy_single_namespace(namespace, defaults_file_path: Path):
@@ -0,0 +1,299 @@
+"""
+Binary-safe file transfer over the pod exec websocket.
+
+Data moves on the exec stream's binary channels in bounded chunks: uploads are read and sent a
+chunk at a time, so a blocking websocket send throttles the reader, and downloads are handed to
+a sink as each frame arrives instead of being buffered whole. Both ends checksum the data. An
+upload is written to a temporary file in the pod, compared with the local sha256 and only then
+renamed into place. A download's sha256 is taken in the pod while it streams out and compared
+with the bytes received. Failed or corrupted transfers raise TransferError, which
+`with_retries` retries.
+
+The pod needs a POSIX shell, `head`, `tee`, `mkfifo` and, for checksums, `sha256sum`. Without
+`sha256sum`, only the size of uploads is checked and downloads aren't verified.
+"""
+
+import hashlib
+import secrets
+import shlex
+from pathlib import Path
+from time import monotonic, sleep
+from typing import Callable, Iterator, NamedTuple, Optional, TypeVar, Union
+
+from kubernetes.client import CoreV1Api
+from kubernetes.client.rest import ApiException
+from kubernetes.stream import stream
+from kubernetes.stream.ws_client import STDERR_CHANNEL, STDOUT_CHANNEL, WSClient, _IgnoredIO
+from websocket import WebSocketException
+
+from .constants import (
+    EXEC_TRANSFER_CHUNK_SIZE,
+    EXEC_TRANSFER_IDLE_TIMEOUT,
+    EXEC_TRANSFER_RETRIES,
+)
+
+# Only the end of a chatty command's stderr is kept
+STDERR_LIMIT = 64 << 10
+# Marks the checksum line a download script appends to stderr
+CHECKSUM_MARKER = "warnet-transfer-sha256"
+
+T = TypeVar("T")
+
+
+class TransferError(Exception):
+    """A transfer that failed part way or arrived corrupted, and may succeed if retried"""
+
+
+class ExecResult(NamedTuple):
+    returncode: int
+    size: int  # Bytes of payload moved
+    sha256: str
+    verified: bool  # Whether the pod's checksum was compared
+    seconds: float
+    stderr: str
+
+
+def exec_read(
+    api: CoreV1Api,
+    pod: str,
+    namespace: str,
+    script: str,
+    sink: Callable[[bytes], object],
+    container: Optional[str] = None,
+    progress: Optional[Callable[[int], None]] = None,
+) -> ExecResult:
+    """
+    Run `script` with `sh -c` in the pod, passing its stdout to `sink` a chunk at a time. A
+    non-zero exit status is returned rather than raised, and only a zero exit is verified.
+    """
+    start = monotonic()
+    resp = _connect(api, pod, namespace, ["sh", "-c", _checksummed(script)], container, False)
+    digest = hashlib.sha256()
+    size = 0
+    stderr = bytearray()
+
+    def take(data: bytes):
+        nonlocal size
+        digest.update(data)
+        size += len(data)
+        sink(data)
+        if progress:
+            progress(len(data))
+
+    try:
+        _pump(resp, take, stderr)
+        returncode = _returncode(resp)
+    finally:
+        resp.close()
+
+    text, remote_sha = _split_checksum(stderr)
+    result = ExecResult(returncode, size, digest.hexdigest(), False, monotonic() - start, text)
+    if returncode != 0:
+        return result
+    if remote_sha is None:
+        raise TransferError(f"Download from {pod} ended before its checksum: {text}")
+    if remote_sha and remote_sha != result.sha256:
+        raise TransferError(
+            f"Download from {pod} is corrupt: sent {remote_sha}, received {result.sha256}"
+        )
+    return result._replace(verified=bool(remote_sha))
+
+
+def exec_write(
+    api: CoreV1Api,
+    pod: str,
+    namespace: str,
+    dst_path: str,
+    source: Union[bytes, Path],
+    container: Optional[str] = None,
+    progress: Optional[Callable[[int], None]] = None,
+) -> ExecResult:
+    """
+    Write `source` (bytes, or a local file streamed from disk) to `dst_path` in the pod,
+    replacing it only once the whole file has arrived intact
+    """
+    start = monotonic()
+    size = len(source) if isinstance(source, bytes) else source.stat().st_size
+    digest = hashlib.sha256()
+    if isinstance(source, bytes):
+        digest.update(source)
+    else:
+        with source.open("rb") as f:
+            while chunk := f.read(EXEC_TRANSFER_CHUNK_SIZE):
+                digest.update(chunk)
+    sha = digest.hexdigest()
+
+    tmp = shlex.quote(f"{dst_path}.{secrets.token_hex(4)}.part")
+    dst = shlex.quote(dst_path)
+    script = "\n".join(
+        [
+            # Exactly `size` bytes are read, as the exec stream has no way to close stdin
+            f"head -c {size} > {tmp} || exit 1",
+            "if command -v sha256sum > /dev/null; then",
+            f"  got=$(sha256sum {tmp} | cut -d ' ' -f 1); want={sha}",
+            "else",
+            f"  got=$(wc -c < {tmp} | tr -d ' '); want={size}",
+            "fi",
+            '[ "$got" = "$want" ] || {',
+            f'  rm -f {tmp}; echo "{CHECKSUM_MARKER} mismatch: $got" >&2; exit 2',
+            "}",
+            f"mv {tmp} {dst}",
+        ]
+    )
+    resp = _connect(api, pod, namespace, ["sh", "-c", script], container, True)
+    stderr = bytearray()
+    try:
+        for chunk in _chunks(source):
+            resp.write_stdin(chunk)
+            if progress:
+                progress(len(chunk))
+            # Keep the receive side drained while sending, so the pod never blocks on it
+            while resp.is_open() and resp.peek_stderr():
+                _keep_tail(stderr, resp.read_stderr())
+        _pump(resp, lambda data: None, stderr)
+        returncode = _returncode(resp)
+    finally:
+        resp.close()
+
+    text = stderr.decode(errors="replace").strip()
+    if returncode == 2 and CHECKSUM_MARKER in text:
+        raise TransferError(f"Upload to {pod}:{dst_path} arrived corrupt: {text}")
+    if returncode != 0:
+        raise TransferError(f"Upload to {pod}:{dst_path} failed ({returncode}): {text}")
+    return ExecResult(0, size, sha, True, monotonic() - start, text)
+
+
+def with_retries(
+    attempt: Callable[[], T],
+    description: str,
+    retries: int = EXEC_TRANSFER_RETRIES,
+    on_retry: Optional[Callable[[Exception], None]] = None,
+) -> T:
+    """
+    Call `attempt` until it succeeds, up to `retries` times, backing off between attempts.
+    Connection failures and TransferErrors are retried; anything else is raised at once.
+    """
+    for n in range(1, retries + 1):
+        try:
+            return attempt()
+        except (TransferError, ApiException, WebSocketException, OSError) as e:
+            if isinstance(e, ApiException) and e.status and e.status < 500:
+                raise
+            if n == retries:
+                raise TransferError(f"{description} failed after {n} attempts: {e}") from e
+            if on_retry:
+                on_retry(e)
+            sleep(min(0.5 * 2**n, 10))
+    raise AssertionError("unreachable")
+
+
+def _connect(
+    api: CoreV1Api,
+    pod: str,
+    namespace: str,
+    command: list[str],
+    container: Optional[str],
+    stdin: bool,
+) -> WSClient:
+    kwargs = {"container": container} if container else {}
+    resp = stream(
+        api.connect_get_namespaced_pod_exec,
+        pod,
+        namespace,
+        command=command,
+        stdin=stdin,
+        stdout=True,
+        stderr=True,
+        tty=False,
+        binary=True,
+        _preload_content=False,
+        **kwargs,
+    )
+    # The client otherwise keeps a copy of everything it receives, for read_all()
+    resp._all = _IgnoredIO()
+    return resp
+
+
+def _pump(resp: WSClient, sink: Callable[[bytes], None], stderr: bytearray):
+    """Hand stdout to `sink` and keep the tail of stderr until the command exits"""
+    last = monotonic()
+    while resp.is_open():
+        resp.update(timeout=1)
+        received = False
+        if resp.peek_stdout():
+            sink(resp.read_channel(STDOUT_CHANNEL))
+            received = True
+        if resp.peek_stderr():
+            _keep_tail(stderr, resp.read_channel(STDERR_CHANNEL))
+            received = True
+        now = monotonic()
+        if received:
+            last = now
+        elif now - last > EXEC_TRANSFER_IDLE_TIMEOUT:
+            raise TransferError(f"Nothing received for {EXEC_TRANSFER_IDLE_TIMEOUT}s")
+    # Frames that arrived along with the close
+    if data := resp.read_channel(STDOUT_CHANNEL):
+        sink(data)
+    if data := resp.read_channel(STDERR_CHANNEL):
+        _keep_tail(stderr, data)
+
+
+def _returncode(resp: WSClient) -> int:
+    try:
+        return resp.returncode
+    except Exception as e:
+        # No status on the error channel means the stream was cut, not that the command ended
+        raise TransferError(f"Exec stream closed without an exit status: {e}") from e
+
+
+def _keep_tail(buffer: bytearray, data: Union[bytes, str]):
+    buffer += data.encode() if isinstance(data, str) else data
+    if len(buffer) > STDERR_LIMIT:
+        del buffer[: len(buffer) - STDERR_LIMIT]
+
+
+def _checksummed(script: str) -> str:
+    """
+    Wrap a script so its stdout is hashed in the pod as it streams out, through a fifo, and
+    the sha256 is appended to stderr after the script's own exit status is saved
+    """
+    return "\n".join(
+        [
+            "command -v sha256sum > /dev/null || {",
+            f"  ( {script}\n  ); rc=$?; echo >&2; echo '{CHECKSUM_MARKER} -' >&2; exit $rc",
+            "}",
+            't=$(mktemp -d) && mkfifo "$t/p" || exit 1',
+            'sha256sum < "$t/p" > "$t/sum" &',
+            f'{{ ( {script}\n  ); echo $? > "$t/rc"; }} | tee "$t/p"',
+            "wait",
+            'rc=$(cat "$t/rc")',
+            f'echo >&2; echo "{CHECKSUM_MARKER} $(cut -d \' \' -f 1 "$t/sum")" >&2',
+            'rm -rf "$t"',
+            "exit $rc",
+        ]
+    )
+
+
+def _split_checksum(stderr: bytearray) -> tuple[str, Optional[str]]:
+    """
+    Separate the checksum line from a download's stderr. The sha256 is None if the line is
+    missing and "" if the pod couldn't compute one.
+    """
+    text = stderr.decode(errors="replace")
+    head, marker, tail = text.rpartition(f"\n{CHECKSUM_MARKER} ")
+    if not marker:
+        return text.strip(), None
+    sha = tail.strip()
+    return head.strip(), "" if sha == "-" else sha
+
+
+def _chunks(source: Union[bytes, Path]) -> Iterator[bytes]:
+    """`source`, bytes or a local file, in EXEC_TRANSFER_CHUNK_SIZE pieces"""
+    if isinstance(source, bytes):
+        view = memoryview(source)
+        for i in range(0, len(view), EXEC_TRANSFER_CHUNK_SIZE):
+            yield bytes(view[i : i + EXEC_TRANSFER_CHUNK_SIZE])
+        return
+    with source.open("rb") as f:
+        while chunk := f.read(EXEC_TRANSFER_CHUNK_SIZE):
+            yield chunk
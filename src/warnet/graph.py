@@ -1,17 +1,17 @@
-import json
 import os
 import random
 import sys
 from importlib.resources import files
 from pathlib import Path
+from typing import Optional, Tuple
 
 import click
 import inquirer
 import yaml
 
-from resources.scenarios.ln_framework.ln import Policy
-
 from .constants import DEFAULT_TAG, SUPPORTED_TAGS
+from .graph_import import SAMPLES
+from .graph_import import import_network as _import_network
 
 
 @click.group(name="graph", hidden=True)
@@ -234,68 +234,35 @@ def create():
 @click.command()
 @click.argument("graph_file_path", type=click.Path(exists=True, file_okay=True, dir_okay=False))
 @click.argument("output_path", type=click.Path(exists=False, file_okay=False, dir_okay=True))
-def import_network(graph_file_path: str, output_path: str):
+@click.option(
+    "--sample",
+    type=click.Choice(SAMPLES),
+    help="Import a sample of the graph: the nodes with the most capacity, a breadth-first walk "
+    "from --seed nodes, or a k-core",
+)
+@click.option("--max-nodes", type=int, help="Most nodes to sample")
+@click.option("--seed", multiple=True, help="Pubkey to start a bfs sample from, repeatable")
+@click.option(
+    "--k-core", "k", type=int, help="k for a kcore sample, instead of fitting --max-nodes"
+)
+def import_network(
+    graph_file_path: str,
+    output_path: str,
+    sample: Optional[str],
+    max_nodes: Optional[int],
+    seed: Tuple[str, ...],
+    k: Optional[int],
+):
     """Create a network from an imported lightning network graph JSON"""
-    print(_import_network(graph_file_path, output_path))
-
-
-def _import_network(graph_file_path, output_path):
-    output_path = Path(output_path)
-    graph_file_path = Path(graph_file_path).resolve()
-    with open(graph_file_path) as graph_file:
-        graph = json.loads(graph_file.read())
-
-    tanks = {}
-    pk_to_tank = {}
-    tank_to_pk = {}
-    index = 0
-    for node in graph["nodes"]:
-        tank = f"tank-{index:04d}"
-        pk_to_tank[node["pub_key"]] = tank
-        tank_to_pk[tank] = node["pub_key"]
-        tanks[tank] = {"name": tank, "ln": {"lnd": True}, "lnd": {"channels": []}}
-        index += 1
-    print(f"Imported {index} nodes")
-
-    sorted_edges = sorted(graph["edges"], key=lambda x: int(x["channel_id"]))
-
-    # By default we start including channel open txs in block 300
-    block = 300
-    # Coinbase occupies the 0 position!
-    index = 1
-    count = 0
-    for edge in sorted_edges:
-        source = pk_to_tank[edge["node1_pub"]]
-        channel = {
-            "id": {"block": block, "index": index},
-            "target": pk_to_tank[edge["node2_pub"]] + "-ln",
-            "capacity": int(edge["capacity"]),
-            "push_amt": int(edge["capacity"]) // 2,
-            "source_policy": Policy.from_lnd_describegraph(edge["node1_policy"]).to_dict(),
-            "target_policy": Policy.from_lnd_describegraph(edge["node2_policy"]).to_dict(),
-        }
-        tanks[source]["lnd"]["channels"].append(channel)
-        index += 1
-        if index > 1000:
-            index = 1
-            block += 1
-        count += 1
-
-    print(f"Imported {count} channels")
-
-    network = {"nodes": []}
-    prev_node_name = list(tanks.keys())[-1]
-    for name, obj in tanks.items():
-        obj["name"] = name
-        obj["addnode"] = [prev_node_name]
-        prev_node_name = name
-        network["nodes"].append(obj)
-
-    output_path.mkdir(parents=True, exist_ok=True)
-    # This file must exist and must contain at least one line of valid yaml
-    with open(output_path / "node-defaults.yaml", "w") as f:
-        f.write(f"imported_from: {graph_file_path}\n")
-    # Here's the good stuff
-    with open(output_path / "network.yaml", "w") as f:
-        f.write(yaml.dump(network, sort_keys=False))
-    return f"Network created in {output_path.resolve()}"
+    if sample in ("capacity", "bfs") and not max_nodes:
+        raise click.UsageError(f"--sample {sample} needs --max-nodes")
+    if sample == "kcore" and k is None and not max_nodes:
+        raise click.UsageError("--sample kcore needs --k-core or --max-nodes")
+    try:
+        print(
+            _import_network(
+                Path(graph_file_path).resolve(), Path(output_path), sample, max_nodes, list(seed), k
+            )
+        )
+    except ValueError as e:
+        raise click.ClickException(str(e)) from e
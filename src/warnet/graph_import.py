@@ -0,0 +1,369 @@
+"""
+Importing LND describegraph dumps as networks, at mainnet size.
+
+The dump is read a node or an edge at a time, never as a whole document, and each channel is
+kept as a row of fixed-width arrays rather than a dict. Channel policies are interned, as most
+channels share a handful of them. Channels are sorted by channel ID as indexes into those
+arrays, and network.yaml is written a channel at a time, with each policy dumped by PyYAML (and
+libyaml, when PyYAML has it) just once rather than the whole network going through yaml.dump.
+
+A sample of the graph sized to the cluster can be taken instead of the whole of it: the
+nodes with the most capacity, a breadth-first walk from seed nodes, or a k-core, the largest
+subgraph in which every node has channels to at least k others.
+"""
+
+import heapq
+import json
+from array import array
+from collections import deque
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, TextIO, Tuple
+
+import yaml
+
+from resources.scenarios.ln_framework.ln import Policy
+
+# libyaml's emitter is many times faster than PyYAML's own, and writes the same YAML
+YAML_DUMPER = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+# Characters read from the graph file at a time
+GRAPH_READ_SIZE = 1 << 20
+# Channel opens go in blocks from 300, after the coinbase, at most this many to a block
+FIRST_CHANNEL_BLOCK = 300
+CHANNELS_PER_BLOCK = 1000
+
+SAMPLES = ("capacity", "bfs", "kcore")
+
+
+class GraphReader:
+    """
+    Yields ("nodes", node) and ("edges", edge) from a describegraph dump's top level arrays as
+    they are read. Any other top level values are parsed and dropped.
+    """
+
+    def __init__(self, f: TextIO):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def __iter__(self) -> Iterator[Tuple[str, dict]]:
+        self.expect("{")
+        if self.peek() == "}":
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            if key in ("nodes", "edges"):
+                self.expect("[")
+                if self.peek() == "]":
+                    self.pos += 1
+                else:
+                    while True:
+                        yield key, self.value()
+                        if self.expect(",]") == "]":
+                            break
+            else:
+                self.value()
+            if self.expect(",}") == "}":
+                return
+
+    def fill(self) -> bool:
+        """Read more of the file, dropping what's been parsed. False at the end of the file."""
+        if self.eof:
+            return False
+        data = self.f.read(GRAPH_READ_SIZE)
+        self.buf = self.buf[self.pos :] + data
+        self.pos = 0
+        self.eof = not data
+        return not self.eof
+
+    def peek(self) -> str:
+        """The next character that isn't whitespace"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                raise ValueError("Unexpected end of graph file")
+
+    def expect(self, chars: str) -> str:
+        c = self.peek()
+        if c not in chars:
+            raise ValueError(f"Expected {' or '.join(chars)} in graph file, found {c!r}")
+        self.pos += 1
+        return c
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # A number could go on past the end of what's been read
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+
+class CompactGraph:
+    """
+    Channels as columns: channel ID, both ends as node numbers, capacity and both policies as
+    numbers in `policies`. Nodes are numbered as they are first seen, and `order` lists those
+    that appear in the dump's nodes, in its order.
+    """
+
+    def __init__(self):
+        self.pubkeys: List[str] = []
+        self.numbers: Dict[str, int] = {}
+        self.order = array("I")
+        self.policies: List[tuple] = []
+        self.policy_numbers: Dict[tuple, int] = {}
+        self.channel_id = array("Q")
+        self.node1 = array("I")
+        self.node2 = array("I")
+        self.capacity = array("Q")
+        self.policy1 = array("I")
+        self.policy2 = array("I")
+        self.skipped = 0  # Channels without both policies, or with an end that isn't a node
+
+    @classmethod
+    def read(cls, f: TextIO) -> "CompactGraph":
+        graph = cls()
+        for key, obj in GraphReader(f):
+            if key == "nodes":
+                graph.order.append(graph.number(obj["pub_key"]))
+            else:
+                graph.add_edge(obj)
+        # Channels to pubkeys the dump has no node for can't be given a tank
+        listed = set(graph.order)
+        keep = [
+            i for i in range(len(graph.channel_id)) if {graph.node1[i], graph.node2[i]} <= listed
+        ]
+        if len(keep) < len(graph.channel_id):
+            graph.skipped += len(graph.channel_id) - len(keep)
+            graph.select_channels(keep)
+        return graph
+
+    def number(self, pubkey: str) -> int:
+        n = self.numbers.get(pubkey)
+        if n is None:
+            n = self.numbers[pubkey] = len(self.pubkeys)
+            self.pubkeys.append(pubkey)
+        return n
+
+    def intern(self, policy: dict) -> int:
+        key = tuple(Policy.from_lnd_describegraph(policy).to_dict().items())
+        n = self.policy_numbers.get(key)
+        if n is None:
+            n = self.policy_numbers[key] = len(self.policies)
+            self.policies.append(key)
+        return n
+
+    def add_edge(self, edge: dict):
+        if not edge.get("node1_policy") or not edge.get("node2_policy"):
+            self.skipped += 1
+            return
+        self.channel_id.append(int(edge["channel_id"]))
+        self.node1.append(self.number(edge["node1_pub"]))
+        self.node2.append(self.number(edge["node2_pub"]))
+        self.capacity.append(int(edge["capacity"]))
+        self.policy1.append(self.intern(edge["node1_policy"]))
+        self.policy2.append(self.intern(edge["node2_policy"]))
+
+    def select_channels(self, keep: List[int]):
+        for name in ("channel_id", "node1", "node2", "capacity", "policy1", "policy2"):
+            column = getattr(self, name)
+            setattr(self, name, array(column.typecode, (column[i] for i in keep)))
+
+    def sample(self, nodes: Set[int]):
+        """Keep only `nodes`, and the channels between them"""
+        self.order = array("I", (n for n in self.order if n in nodes))
+        self.select_channels(
+            [
+                i
+                for i in range(len(self.channel_id))
+                if self.node1[i] in nodes and self.node2[i] in nodes
+            ]
+        )
+
+    def neighbours(self) -> Dict[int, Set[int]]:
+        peers: Dict[int, Set[int]] = {n: set() for n in self.order}
+        for a, b in zip(self.node1, self.node2):
+            if a != b:
+                peers[a].add(b)
+                peers[b].add(a)
+        return peers
+
+    def node_capacity(self) -> Dict[int, int]:
+        total = {n: 0 for n in self.order}
+        for a, b, capacity in zip(self.node1, self.node2, self.capacity):
+            total[a] += capacity
+            total[b] += capacity
+        return total
+
+
+def top_capacity(graph: CompactGraph, max_nodes: int) -> Set[int]:
+    """The nodes with the most capacity in their channels"""
+    total = graph.node_capacity()
+    return set(heapq.nlargest(max_nodes, graph.order, key=total.__getitem__))
+
+
+def breadth_first(graph: CompactGraph, max_nodes: int, seeds: List[int]) -> Set[int]:
+    """
+    Nodes in order of their distance from `seeds`, or from the node with the most capacity.
+    Each node's peers are taken largest first.
+    """
+    total = graph.node_capacity()
+    peers = graph.neighbours()
+    if not seeds:
+        seeds = [max(graph.order, key=total.__getitem__)]
+    queue = deque(dict.fromkeys(seeds[:max_nodes]))
+    seen = set(queue)
+    while queue and len(seen) < max_nodes:
+        for peer in sorted(peers[queue.popleft()] - seen, key=total.__getitem__, reverse=True):
+            seen.add(peer)
+            queue.append(peer)
+            if len(seen) == max_nodes:
+                break
+    return seen
+
+
+def k_core(graph: CompactGraph, k: Optional[int], max_nodes: Optional[int]) -> Set[int]:
+    """
+    The k-core, or if `k` isn't given, the core of the smallest k that fits in `max_nodes`.
+    Cores are found by peeling off the nodes with the fewest peers, lowest first.
+    """
+    peers = graph.neighbours()
+    degree = {n: len(p) for n, p in peers.items()}
+    by_degree: Dict[int, Set[int]] = {}
+    for n, d in degree.items():
+        by_degree.setdefault(d, set()).add(n)
+    core: Dict[int, int] = {}
+    level = 0
+    while len(core) < len(degree):
+        while not by_degree.get(level):
+            level += 1
+        n = by_degree[level].pop()
+        core[n] = level
+        for peer in peers[n]:
+            d = degree[peer]
+            if peer not in core and d > level:
+                by_degree[d].discard(peer)
+                degree[peer] = d - 1
+                by_degree.setdefault(d - 1, set()).add(peer)
+
+    if k is None:
+        k = 0
+        remaining = len(core)
+        counts: Dict[int, int] = {}
+        for c in core.values():
+            counts[c] = counts.get(c, 0) + 1
+        while remaining > max_nodes:
+            remaining -= counts.get(k, 0)
+            k += 1
+    return {n for n, c in core.items() if c >= k}
+
+
+# A channel in network.yaml, laid out as yaml.dump lays it out. Only its policies can hold
+# anything that might need quoting, and those are dumped by PyYAML, once for each policy.
+CHANNEL_YAML = """\
+    - id:
+        block: {block}
+        index: {index}
+      target: {target}-ln
+      capacity: {capacity}
+      push_amt: {push_amt}
+      source_policy:
+{source_policy}\
+      target_policy:
+{target_policy}\
+"""
+
+
+def write_network(graph: CompactGraph, f: TextIO):
+    """
+    Write network.yaml's nodes, each node's channels in channel ID order and numbered from
+    FIRST_CHANNEL_BLOCK as ln_init opens them
+    """
+    tanks = {n: i for i, n in enumerate(graph.order)}
+    names = [f"tank-{i:04d}" for i in range(len(graph.order))]
+    # Each tank's channels, as positions in channel ID order
+    ordered = sorted(range(len(graph.channel_id)), key=graph.channel_id.__getitem__)
+    channels = [array("I") for _ in names]
+    for position, i in enumerate(ordered):
+        channels[tanks[graph.node1[i]]].append(position)
+    policies = [
+        "".join(
+            " " * 8 + line
+            for line in yaml.dump(dict(policy), Dumper=YAML_DUMPER, sort_keys=False).splitlines(
+                keepends=True
+            )
+        )
+        for policy in graph.policies
+    ]
+
+    f.write("nodes:\n")
+    for t, name in enumerate(names):
+        f.write(f"- name: {name}\n  ln:\n    lnd: true\n  lnd:\n")
+        f.write("    channels:\n" if channels[t] else "    channels: []\n")
+        for position in channels[t]:
+            i = ordered[position]
+            capacity = graph.capacity[i]
+            f.write(
+                CHANNEL_YAML.format(
+                    block=FIRST_CHANNEL_BLOCK + position // CHANNELS_PER_BLOCK,
+                    # Coinbase occupies the 0 position!
+                    index=position % CHANNELS_PER_BLOCK + 1,
+                    target=names[tanks[graph.node2[i]]],
+                    capacity=capacity,
+                    push_amt=capacity // 2,
+                    source_policy=policies[graph.policy1[i]],
+                    target_policy=policies[graph.policy2[i]],
+                )
+            )
+        f.write(f"  addnode:\n  - {names[t - 1]}\n")
+
+
+def import_network(
+    graph_file_path: Path,
+    output_path: Path,
+    sample: Optional[str] = None,
+    max_nodes: Optional[int] = None,
+    seeds: Optional[List[str]] = None,
+    k: Optional[int] = None,
+) -> str:
+    with open(graph_file_path) as graph_file:
+        graph = CompactGraph.read(graph_file)
+    print(f"Imported {len(graph.order)} nodes")
+    if graph.skipped:
+        print(f"Skipped {graph.skipped} channels without both policies or both nodes")
+
+    if sample:
+        if sample == "capacity":
+            nodes = top_capacity(graph, max_nodes)
+        elif sample == "bfs":
+            listed = set(graph.order)
+            unknown = [pk for pk in seeds or [] if graph.numbers.get(pk) not in listed]
+            if unknown:
+                raise ValueError(f"Seed nodes not in the graph: {', '.join(unknown)}")
+            nodes = breadth_first(graph, max_nodes, [graph.numbers[pk] for pk in seeds or []])
+        else:
+            nodes = k_core(graph, k, max_nodes)
+        graph.sample(nodes)
+        print(f"Sampled {len(graph.order)} nodes by {sample}")
+    print(f"Imported {len(graph.channel_id)} channels")
+
+    output_path.mkdir(parents=True, exist_ok=True)
+    # This file must exist and must contain at least one line of valid yaml
+    with open(output_path / "node-defaults.yaml", "w") as f:
+        f.write(f"imported_from: {graph_file_path}\n")
+    # Here's the good stuff
+    with open(output_path / "network.yaml", "w") as f:
+        write_network(graph, f)
+    return f"Network created in {output_path.resolve()}"
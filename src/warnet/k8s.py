@@ -1,58 +1,219 @@
 import json
 import os
-import sys
+import random
+import shlex
 import tarfile
 import tempfile
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from time import sleep
-from typing import Optional
+from time import monotonic, sleep
+from typing import Callable, NamedTuple, Optional
 
 import yaml
 from kubernetes import client, config, watch
 from kubernetes.client import CoreV1Api
-from kubernetes.client.models import V1Namespace, V1Pod, V1PodList
+from kubernetes.client.models import V1Namespace, V1Pod, V1PodList, V1Service
 from kubernetes.client.rest import ApiException
+from kubernetes.config.config_exception import ConfigException
 from kubernetes.dynamic import DynamicClient
-from kubernetes.stream import stream
+from kubernetes.dynamic.exceptions import ResourceNotFoundError
+from kubernetes.stream import portforward
+from urllib3.exceptions import MaxRetryError, ProtocolError
 
 from .constants import (
+    APPLY_RETRIES,
+    BITCOINCORE_CONTAINER,
     CADDY_INGRESS_NAME,
     DEFAULT_NAMESPACE,
+    FIELD_MANAGER,
+    HELM_RELEASE_SELECTOR,
     INGRESS_NAMESPACE,
     KUBE_INTERNAL_NAMESPACES,
     KUBECONFIG,
     LOGGING_NAMESPACE,
+    POD_WATCH_TIMEOUT,
+    RETRYABLE_STATUSES,
+    SNAPSHOT_NO_FILES_EXIT,
+    SNAPSHOT_SUFFIXES,
+    TOPOLOGY_MISSIONS,
 )
+from .exec_transfer import ExecResult, exec_read, exec_write, with_retries
 from .process import run_command, stream_command
+from .scheduler import get_scheduler
 
 
 class K8sError(Exception):
     pass
 
 
+class KubeSession:
+    """
+    Process-wide kubeconfig, API client and default namespace.
+
+    Parsing the kubeconfig and building a client is surprisingly expensive, so it is done once
+    and shared by every helper in this module. All cached state is dropped when any of the
+    kubeconfig files change on disk (e.g. after `warnet auth` or a context switch).
+    """
+
+    def __init__(self, kubeconfig: str = KUBECONFIG):
+        self.kubeconfig = kubeconfig
+        self._lock = threading.RLock()
+        self._stamp = None
+        self._reset()
+
+    def _reset(self):
+        self._configuration: Optional[client.Configuration] = None
+        self._api_client: Optional[client.ApiClient] = None
+        self._core_v1: Optional[CoreV1Api] = None
+        self._dynamic: Optional[DynamicClient] = None
+        self._namespace: Optional[str] = None
+        # None until we know whether RBAC lets us list pods across all namespaces
+        self.cluster_wide_list: Optional[bool] = None
+
+    def _kubeconfig_stamp(self) -> tuple:
+        # KUBECONFIG may hold several paths, just like kubectl accepts
+        stamp = []
+        for path in self.kubeconfig.split(os.pathsep):
+            try:
+                st = os.stat(os.path.expanduser(path))
+                stamp.append((path, st.st_mtime_ns, st.st_size))
+            except OSError:
+                stamp.append((path, None, None))
+        return tuple(stamp)
+
+    def _refresh(self):
+        stamp = self._kubeconfig_stamp()
+        if stamp != self._stamp:
+            self._reset()
+            self._stamp = stamp
+
+    @property
+    def configuration(self) -> client.Configuration:
+        with self._lock:
+            self._refresh()
+            if self._configuration is None:
+                configuration = client.Configuration()
+                config.load_kube_config(
+                    config_file=self.kubeconfig, client_configuration=configuration
+                )
+                self._configuration = configuration
+            return self._configuration
+
+    @property
+    def api_client(self) -> client.ApiClient:
+        """Pooled (keep-alive) client shared by all regular API requests"""
+        with self._lock:
+            configuration = self.configuration
+            if self._api_client is None:
+                self._api_client = client.ApiClient(configuration)
+            return self._api_client
+
+    @property
+    def core_v1(self) -> CoreV1Api:
+        with self._lock:
+            api_client = self.api_client
+            if self._core_v1 is None:
+                self._core_v1 = client.CoreV1Api(api_client)
+            return self._core_v1
+
+    @property
+    def dynamic(self) -> DynamicClient:
+        with self._lock:
+            api_client = self.api_client
+            if self._dynamic is None:
+                self._dynamic = DynamicClient(api_client)
+            return self._dynamic
+
+    @property
+    def default_namespace(self) -> str:
+        with self._lock:
+            self._refresh()
+            if self._namespace is None:
+                try:
+                    _, active_context = config.list_kube_config_contexts(
+                        config_file=self.kubeconfig
+                    )
+                    namespace = (active_context or {}).get("context", {}).get("namespace")
+                except ConfigException:
+                    namespace = None
+                self._namespace = namespace if namespace else DEFAULT_NAMESPACE
+            return self._namespace
+
+    def exec_client(self) -> CoreV1Api:
+        """
+        `kubernetes.stream.stream()` temporarily replaces the request method of the
+        ApiClient it is given, so exec/attach calls get their own client to avoid
+        interfering with requests made concurrently on the shared one.
+        """
+        return client.CoreV1Api(client.ApiClient(self.configuration))
+
+    def invalidate(self):
+        with self._lock:
+            self._reset()
+            self._stamp = None
+
+
+_session = KubeSession()
+
+
+def get_session() -> KubeSession:
+    return _session
+
+
+def get_api_client() -> client.ApiClient:
+    return _session.api_client
+
+
 def get_static_client() -> CoreV1Api:
-    config.load_kube_config(config_file=KUBECONFIG)
-    return client.CoreV1Api()
+    return _session.core_v1
+
+
+def get_exec_client() -> CoreV1Api:
+    return _session.exec_client()
 
 
 def get_dynamic_client() -> DynamicClient:
-    config.load_kube_config(config_file=KUBECONFIG)
-    return DynamicClient(client.ApiClient())
+    return _session.dynamic
 
 
-def get_pods() -> list[V1Pod]:
+def list_pods(label_selector: Optional[str] = None) -> list[V1Pod]:
+    """
+    List pods in every namespace we can see, optionally filtered server-side by `label_selector`.
+
+    A single cluster-wide request is used when RBAC allows it, otherwise each visible namespace
+    is queried concurrently.
+    """
     sclient = get_static_client()
-    pods: list[V1Pod] = []
-    namespaces = get_namespaces()
-    for ns in namespaces:
-        namespace = ns.metadata.name
+    kwargs = {"label_selector": label_selector} if label_selector else {}
+
+    if _session.cluster_wide_list is not False:
         try:
-            pod_list: V1PodList = sclient.list_namespaced_pod(namespace)
-            for pod in pod_list.items:
-                pods.append(pod)
-        except Exception as e:
-            raise e
-    return pods
+            pod_list: V1PodList = sclient.list_pod_for_all_namespaces(**kwargs)
+            _session.cluster_wide_list = True
+            return [
+                pod
+                for pod in pod_list.items
+                if pod.metadata.namespace not in KUBE_INTERNAL_NAMESPACES
+            ]
+        except ApiException as e:
+            if e.status != 403:
+                raise e
+            _session.cluster_wide_list = False
+
+    namespaces = [ns.metadata.name for ns in get_namespaces()]
+    if not namespaces:
+        return []
+    with ThreadPoolExecutor(max_workers=min(len(namespaces), 16)) as executor:
+        pod_lists = executor.map(
+            lambda namespace: sclient.list_namespaced_pod(namespace, **kwargs).items, namespaces
+        )
+        return [pod for pods in pod_lists for pod in pods]
+
+
+def get_pods() -> list[V1Pod]:
+    return list_pods()
 
 
 def get_pod(name: str, namespace: Optional[str] = None) -> V1Pod:
@@ -61,13 +222,29 @@ def get_pod(name: str, namespace: Optional[str] = None) -> V1Pod:
     return sclient.read_namespaced_pod(name=name, namespace=namespace)
 
 
-def get_mission(mission: str) -> list[V1Pod]:
-    pods = get_pods()
-    crew: list[V1Pod] = []
-    for pod in pods:
-        if "mission" in pod.metadata.labels and pod.metadata.labels["mission"] == mission:
-            crew.append(pod)
-    return crew
+def get_mission(mission: str, namespace: Optional[str] = None) -> list[V1Pod]:
+    if namespace is None:
+        return list_pods(label_selector=f"mission={mission}")
+    sclient = get_static_client()
+    return sclient.list_namespaced_pod(namespace, label_selector=f"mission={mission}").items
+
+
+def get_services(namespace: Optional[str] = None) -> list[V1Service]:
+    namespace = get_default_namespace_or(namespace)
+    sclient = get_static_client()
+    return sclient.list_namespaced_service(namespace).items
+
+
+def get_helm_releases(namespace: str) -> list[str]:
+    """Names of the helm releases in `namespace`, read straight from helm's release secrets"""
+    sclient = get_static_client()
+    get_scheduler().throttle()
+    # Release secrets are large and only their labels are needed, so skip model deserialization
+    response = sclient.list_namespaced_secret(
+        namespace, label_selector=HELM_RELEASE_SELECTOR, _preload_content=False
+    )
+    items = json.loads(response.data)["items"]
+    return sorted({item["metadata"]["labels"]["name"] for item in items})
 
 
 def get_pod_exit_status(pod_name, namespace: Optional[str] = None):
@@ -99,6 +276,70 @@ def get_channels(namespace: Optional[str] = None) -> any:
     return channels
 
 
+def config_map_exists(name: str, namespace: str) -> bool:
+    """Whether a ConfigMap exists, asking only for its metadata rather than all of its data"""
+    try:
+        response = get_api_client().call_api(
+            f"/api/v1/namespaces/{namespace}/configmaps/{name}",
+            "GET",
+            header_params={
+                "Accept": "application/json;as=PartialObjectMetadata;g=meta.k8s.io;v=v1"
+            },
+            auth_settings=["BearerToken"],
+            _preload_content=False,
+        )
+    except ApiException as e:
+        if e.status == 404:
+            return False
+        raise
+    response[0].release_conn()
+    return True
+
+
+def get_network_topology(namespace: str, cluster_wide: bool = False) -> dict:
+    """
+    The tanks, lightning nodes and channels a commander in `namespace` would find, in the form
+    resources/scenarios/commander.py reads. An admin commander sees every namespace.
+    """
+    sclient = get_static_client()
+    pods = cmaps = None
+    if cluster_wide:
+        try:
+            pods = sclient.list_pod_for_all_namespaces(label_selector=TOPOLOGY_MISSIONS).items
+            cmaps = sclient.list_config_map_for_all_namespaces(label_selector="channels=true")
+            cmaps = cmaps.items
+        except ApiException as e:
+            if e.status != 403:
+                raise
+            pods = cmaps = None
+    if pods is None or cmaps is None:
+        pods = sclient.list_namespaced_pod(namespace, label_selector=TOPOLOGY_MISSIONS).items
+        cmaps = sclient.list_namespaced_config_map(namespace, label_selector="channels=true")
+        cmaps = cmaps.items
+
+    topology = {"tanks": [], "lightning": [], "channels": []}
+    for pod in pods:
+        labels = pod.metadata.labels
+        if labels["mission"] == "tank":
+            topology["tanks"].append(
+                {
+                    "tank": pod.metadata.name,
+                    "chain": labels["chain"],
+                    "rpc_host": pod.status.pod_ip,
+                    "rpc_port": int(labels["RPCPort"]),
+                    "rpc_user": "user",
+                    "rpc_password": labels["rpcpassword"],
+                    "init_peers": pod.metadata.annotations["init_peers"],
+                }
+            )
+        else:
+            topology["lightning"].append(pod.metadata.name)
+    for cm in cmaps:
+        for channel in json.loads(cm.data["channels"]):
+            topology["channels"].append({**channel, "source": cm.data["source"]})
+    return topology
+
+
 def create_kubernetes_object(
     kind: str, metadata: dict[str, any], spec: dict[str, any] = None
 ) -> dict[str, any]:
@@ -142,11 +383,99 @@ def apply_kubernetes_yaml_obj(yaml_obj: str) -> None:
         Path(temp_file_path).unlink()
 
 
+def server_side_apply(obj: dict, retries: int = APPLY_RETRIES) -> None:
+    """
+    Server-side apply one manifest as the warnet field manager. Throttling (429) and
+    transient server or connection errors are retried with jittered exponential backoff,
+    honouring Retry-After when the API server sends it.
+    """
+    dynamic = get_dynamic_client()
+    resource = dynamic.resources.get(api_version=obj["apiVersion"], kind=obj["kind"])
+    delay = 0.5
+    for attempt in range(retries + 1):
+        get_scheduler().throttle()
+        try:
+            dynamic.server_side_apply(
+                resource, body=obj, field_manager=FIELD_MANAGER, force_conflicts=True
+            )
+            return
+        except ApiException as e:
+            if e.status not in RETRYABLE_STATUSES or attempt == retries:
+                raise
+            retry_after = (e.headers or {}).get("Retry-After")
+            wait = float(retry_after) if retry_after and retry_after.isdigit() else delay
+        except (MaxRetryError, ProtocolError):
+            if attempt == retries:
+                raise
+            wait = delay
+        sleep(wait * (1 + random.random() / 2))
+        delay = min(delay * 2, 30)
+
+
+def delete_collection(
+    api_version: str,
+    kind: str,
+    namespace: str,
+    label_selector: str,
+    grace_period_seconds: Optional[int] = None,
+) -> int:
+    """
+    Delete every `kind` in `namespace` matching `label_selector` with a single deletecollection
+    request and return how many objects were deleted. Where RBAC only allows plain deletes (as
+    for wargames players) the objects are listed and deleted one at a time instead. Kinds the
+    cluster doesn't serve, e.g. ServiceMonitor without the prometheus CRDs, are skipped.
+    """
+    dynamic = get_dynamic_client()
+    try:
+        resource = dynamic.resources.get(api_version=api_version, kind=kind)
+    except ResourceNotFoundError:
+        return 0
+    scheduler = get_scheduler()
+    scheduler.throttle()
+    try:
+        deleted = dynamic.delete(
+            resource,
+            namespace=namespace,
+            label_selector=label_selector,
+            grace_period_seconds=grace_period_seconds,
+        )
+        return len(deleted.items or [])
+    except ApiException as e:
+        if e.status != 403:
+            raise
+
+    scheduler.throttle()
+    names = [
+        item.metadata.name
+        for item in dynamic.get(resource, namespace=namespace, label_selector=label_selector).items
+    ]
+
+    def delete_one(name: str):
+        try:
+            dynamic.delete(
+                resource, name=name, namespace=namespace, grace_period_seconds=grace_period_seconds
+            )
+        except ApiException as e:
+            if e.status != 404:
+                raise
+
+    scheduler.run_all([(delete_one, (name,)) for name in names], name=f"delete {kind}")
+    return len(names)
+
+
 def delete_namespace(namespace: str) -> bool:
     command = f"kubectl delete namespace {namespace} --ignore-not-found"
     return run_command(command)
 
 
+def annotate_pod(pod_name: str, namespace: str, annotations: dict[str, str]) -> None:
+    """Add `annotations` to a running pod, leaving its other annotations alone"""
+    get_scheduler().throttle()
+    get_static_client().patch_namespaced_pod(
+        pod_name, namespace, {"metadata": {"annotations": annotations}}
+    )
+
+
 def delete_pod(pod_name: str, namespace: Optional[str] = None) -> bool:
     namespace = get_default_namespace_or(namespace)
     command = f"kubectl -n {namespace} delete pod {pod_name}"
@@ -154,172 +483,347 @@ def delete_pod(pod_name: str, namespace: Optional[str] = None) -> bool:
 
 
 def get_default_namespace() -> str:
-    command = "kubectl config view --minify -o jsonpath='{..namespace}'"
-    try:
-        kubectl_namespace = run_command(command)
-    except Exception as e:
-        print(e)
-        if str(e).find("command not found"):
-            print(
-                "It looks like kubectl is not installed. Please install it to continue: "
-                "https://kubernetes.io/docs/tasks/tools/"
-            )
-        sys.exit(1)
-    return kubectl_namespace if kubectl_namespace else DEFAULT_NAMESPACE
+    return _session.default_namespace
 
 
 def get_default_namespace_or(namespace: Optional[str]) -> str:
     return namespace if namespace else get_default_namespace()
 
 
+class Snapshot(NamedTuple):
+    path: Path
+    read: int  # Bytes of tar streamed out of the tank
+    written: int  # Bytes written to `path` after compression
+    seconds: float
+
+
+def datadir_selection(filters: Optional[list[str]]) -> str:
+    """
+    Shell pipeline, run from the chain's datadir, that prints the relative paths to snapshot:
+    everything at the top level, or every file or directory named in `filters`.
+    """
+    # Filter down to the specified list of directories and files
+    # This allows for creating snapshots of only the relevant data, e.g.,
+    # we may want to snapshot the blocks but not snapshot peers.dat or the node
+    # wallets.
+    #
+    # TODO: never snapshot bitcoin.conf, as this is managed by the helm config
+    if not filters:
+        return "ls -A"
+    names = " -o ".join(f"-name {shlex.quote(f)}" for f in filters)
+    return f"find . \\( -type f -o -type d \\) \\( {names} \\) | sed 's|^\\./||'"
+
+
+def snapshot_compressor(compression: str, level: Optional[int] = None):
+    """An object with compress(bytes) and flush() for one of SNAPSHOT_COMPRESSIONS"""
+    if compression == "gzip":
+        # wbits=31 writes a gzip header and trailer, as `tar -czf` does
+        return zlib.compressobj(6 if level is None else level, zlib.DEFLATED, 31)
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError as e:
+            raise K8sError(
+                "zstd snapshots need the zstandard package: pip install 'warnet[zstd]'"
+            ) from e
+        return zstandard.ZstdCompressor(level=3 if level is None else level).compressobj()
+    if compression == "none":
+        return None
+    raise K8sError(f"Unknown snapshot compression: {compression}")
+
+
 def snapshot_bitcoin_datadir(
     pod_name: str,
     chain: str,
     local_path: str = "./",
     filters: list[str] = None,
     namespace: Optional[str] = None,
-) -> None:
+    compression: str = "gzip",
+    level: Optional[int] = None,
+    progress: Optional[Callable[[int], None]] = None,
+) -> Optional[Snapshot]:
+    """
+    Stream a tar of a tank's datadir straight out of the pod into a local file, compressing it
+    locally as it arrives. Nothing is written inside the pod and the file list never touches
+    argv, so big block directories are fine. The tar is checksummed in the pod and the snapshot
+    is retried if it arrives corrupt. `progress(n)` is called with each chunk's size, negative
+    when a failed attempt is rolled back. Returns None if `filters` matched nothing.
+    """
     namespace = get_default_namespace_or(namespace)
-    sclient = get_static_client()
+    snapshot_compressor(compression, level)  # Fail before connecting if it's unavailable
+    script = "\n".join(
+        [
+            f"cd /root/.bitcoin/{chain} || exit 1",
+            f"files=$({datadir_selection(filters)})",
+            f'[ -n "$files" ] || exit {SNAPSHOT_NO_FILES_EXIT}',
+            # printf is a shell builtin, so the list is piped to tar without hitting ARG_MAX
+            "printf '%s\\n' \"$files\" | tar -cf - -T -",
+        ]
+    )
+
+    suffix = SNAPSHOT_SUFFIXES[compression]
+    local_file_path = Path(local_path) / f"{pod_name}_bitcoin_data{suffix}"
+    partial_path = local_file_path.with_name(local_file_path.name + ".part")
+    start = monotonic()
+
+    def attempt() -> tuple[ExecResult, int]:
+        compressor = snapshot_compressor(compression, level)
+        written = reported = 0
+
+        def sink(chunk: bytes):
+            nonlocal written, reported
+            reported += len(chunk)
+            if progress:
+                progress(len(chunk))
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+            f.write(chunk)
+            written += len(chunk)
+
+        try:
+            with partial_path.open("wb") as f:
+                result = exec_read(
+                    get_exec_client(), pod_name, namespace, script, sink, BITCOINCORE_CONTAINER
+                )
+                if compressor is not None:
+                    tail = compressor.flush()
+                    f.write(tail)
+                    written += len(tail)
+        except BaseException:
+            if progress and reported:
+                progress(-reported)
+            raise
+        return result, written
 
     try:
-        sclient.read_namespaced_pod(name=pod_name, namespace=namespace)
-
-        # Filter down to the specified list of directories and files
-        # This allows for creating snapshots of only the relevant data, e.g.,
-        # we may want to snapshot the blocks but not snapshot peers.dat or the node
-        # wallets.
-        #
-        # TODO: never snapshot bitcoin.conf, as this is managed by the helm config
-        if filters:
-            find_command = [
-                "find",
-                f"/root/.bitcoin/{chain}",
-                "(",
-                "-type",
-                "f",
-                "-o",
-                "-type",
-                "d",
-                ")",
-                "(",
-                "-name",
-                filters[0],
-            ]
-            for f in filters[1:]:
-                find_command.extend(["-o", "-name", f])
-            find_command.append(")")
-        else:
-            # If no filters, get everything in the Bitcoin directory (TODO: exclude bitcoin.conf)
-            find_command = ["find", f"/root/.bitcoin/{chain}"]
-
-        resp = stream(
-            sclient.connect_get_namespaced_pod_exec,
-            pod_name,
-            namespace,
-            command=find_command,
-            stderr=True,
-            stdin=False,
-            stdout=True,
-            tty=False,
-            _preload_content=False,
-        )
+        result, written = with_retries(attempt, f"Snapshot of {pod_name}")
+    except BaseException:
+        partial_path.unlink(missing_ok=True)
+        raise
 
-        file_list = []
-        while resp.is_open():
-            resp.update(timeout=1)
-            if resp.peek_stdout():
-                file_list.extend(resp.read_stdout().strip().split("\n"))
-            if resp.peek_stderr():
-                print(f"Error: {resp.read_stderr()}")
-
-        resp.close()
-        if not file_list:
-            print("No matching files or directories found.")
-            return
-        tar_command = ["tar", "-czf", "/tmp/bitcoin_data.tar.gz", "-C", f"/root/.bitcoin/{chain}"]
-        tar_command.extend(
-            [os.path.relpath(f, f"/root/.bitcoin/{chain}") for f in file_list if f.strip()]
-        )
-        resp = stream(
-            sclient.connect_get_namespaced_pod_exec,
-            pod_name,
-            namespace,
-            command=tar_command,
-            stderr=True,
-            stdin=False,
-            stdout=True,
-            tty=False,
-            _preload_content=False,
-        )
-        while resp.is_open():
-            resp.update(timeout=1)
-            if resp.peek_stdout():
-                print(f"Tar output: {resp.read_stdout()}")
-            if resp.peek_stderr():
-                print(f"Error: {resp.read_stderr()}")
-        resp.close()
-        local_file_path = Path(local_path) / f"{pod_name}_bitcoin_data.tar.gz"
-        copy_command = (
-            f"kubectl cp {namespace}/{pod_name}:/tmp/bitcoin_data.tar.gz {local_file_path}"
-        )
-        if not stream_command(copy_command):
-            raise Exception("Failed to copy tar file from pod to local machine")
-
-        print(f"Bitcoin data exported successfully to {local_file_path}")
-        cleanup_command = ["rm", "/tmp/bitcoin_data.tar.gz"]
-        stream(
-            sclient.connect_get_namespaced_pod_exec,
-            pod_name,
-            namespace,
-            command=cleanup_command,
-            stderr=True,
-            stdin=False,
-            stdout=True,
-            tty=False,
-        )
+    if result.returncode == SNAPSHOT_NO_FILES_EXIT:
+        partial_path.unlink(missing_ok=True)
+        return None
+    if result.returncode != 0:
+        partial_path.unlink(missing_ok=True)
+        raise K8sError(f"Snapshot of {pod_name} failed ({result.returncode}): {result.stderr}")
+    os.replace(partial_path, local_file_path)
+    return Snapshot(local_file_path, result.size, written, monotonic() - start)
 
-        print("To untar and repopulate the directory, use the following command:")
-        print(f"tar -xzf {local_file_path} -C /path/to/destination/.bitcoin/{chain}")
 
-    except Exception as e:
-        print(f"An error occurred: {str(e)}")
+class PodInformer:
+    """
+    In-memory cache of pods kept current by a single watch stream.
 
+    The pods of one namespace (or of all namespaces if `namespace` is None) matching the
+    label/field selectors are listed once, then followed through watch events on a background
+    thread. Any number of threads can block in wait_for() until a predicate over the cached
+    pods holds, so waiting on many pods costs one stream instead of a request per pod.
+    """
 
-def wait_for_pod_ready(name, namespace, timeout=300):
-    sclient = get_static_client()
-    w = watch.Watch()
-    for event in w.stream(
-        sclient.list_namespaced_pod, namespace=namespace, timeout_seconds=timeout
+    def __init__(
+        self,
+        namespace: Optional[str] = None,
+        label_selector: Optional[str] = None,
+        field_selector: Optional[str] = None,
     ):
-        pod = event["object"]
-        if pod.metadata.name == name and pod.status.phase == "Running":
-            conditions = pod.status.conditions or []
-            ready_condition = next((c for c in conditions if c.type == "Ready"), None)
-            if ready_condition and ready_condition.status == "True":
-                w.stop()
-                return True
+        self.namespace = namespace
+        self.label_selector = label_selector
+        self.field_selector = field_selector
+        self._pods: dict[tuple[str, str], V1Pod] = {}
+        self._cond = threading.Condition()
+        self._synced = False
+        self._error: Optional[Exception] = None
+        self._stopped = threading.Event()
+        self._watch: Optional[watch.Watch] = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        # The watch holds a connection open for minutes, so don't tie up the shared pool
+        self.configuration = _session.configuration
+        self._sclient = client.CoreV1Api(client.ApiClient(self.configuration))
+        self.pid = os.getpid()
+
+    def start(self) -> "PodInformer":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._watch:
+            self._watch.stop()
+
+    def _list_func(self, sclient: CoreV1Api):
+        if self.namespace is None:
+            return sclient.list_pod_for_all_namespaces, {}
+        return sclient.list_namespaced_pod, {"namespace": self.namespace}
+
+    def _run(self):
+        func, kwargs = self._list_func(self._sclient)
+        if self.label_selector:
+            kwargs["label_selector"] = self.label_selector
+        if self.field_selector:
+            kwargs["field_selector"] = self.field_selector
+        resource_version = None
+        while not self._stopped.is_set():
+            try:
+                if resource_version is None:
+                    pod_list = func(**kwargs)
+                    with self._cond:
+                        self._pods = {
+                            (pod.metadata.namespace, pod.metadata.name): pod
+                            for pod in pod_list.items
+                        }
+                        self._synced = True
+                        self._error = None
+                        self._cond.notify_all()
+                    resource_version = pod_list.metadata.resource_version
+                self._watch = watch.Watch()
+                for event in self._watch.stream(
+                    func,
+                    resource_version=resource_version,
+                    timeout_seconds=POD_WATCH_TIMEOUT,
+                    _request_timeout=POD_WATCH_TIMEOUT + 30,
+                    **kwargs,
+                ):
+                    pod = event["object"]
+                    key = (pod.metadata.namespace, pod.metadata.name)
+                    with self._cond:
+                        if event["type"] == "DELETED":
+                            self._pods.pop(key, None)
+                        else:
+                            self._pods[key] = pod
+                        self._cond.notify_all()
+                # The server closed the watch after its timeout, pick up where it left off
+                resource_version = self._watch.resource_version or resource_version
+            except ApiException as e:
+                # 410 Gone: our resource version is too old to resume from, list again
+                resource_version = None
+                if e.status != 410:
+                    self._fail(e)
+            except Exception as e:
+                resource_version = None
+                self._fail(e)
+
+    def _fail(self, error: Exception):
+        with self._cond:
+            self._error = error
+            self._cond.notify_all()
+        self._stopped.wait(1)
+
+    def pods(self) -> list[V1Pod]:
+        with self._cond:
+            return list(self._pods.values())
+
+    def wait_for(self, predicate: Callable[[list[V1Pod]], bool], timeout: float) -> bool:
+        """
+        Block until predicate(pods) is true for the cached pods, re-checking on every change.
+        Returns False on timeout. Raises K8sError if the pods could not be listed at all.
+        """
+        deadline = monotonic() + timeout
+        with self._cond:
+            while True:
+                if self._synced and predicate(list(self._pods.values())):
+                    return True
+                if not self._synced and self._error is not None:
+                    raise K8sError(f"Could not list pods: {self._error}")
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+
+
+_informers: dict[tuple, PodInformer] = {}
+_informers_lock = threading.Lock()
+
+
+def get_pod_informer(
+    namespace: Optional[str] = None,
+    label_selector: Optional[str] = None,
+    field_selector: Optional[str] = None,
+) -> PodInformer:
+    """
+    Shared, already running PodInformer for this namespace and selectors. Informers are
+    restarted when the kubeconfig changes, just like the rest of the session, and in forked
+    child processes (e.g. deploy's workers), which don't inherit the watch thread.
+    """
+    key = (namespace, label_selector, field_selector)
+    configuration = _session.configuration
+    with _informers_lock:
+        informer = _informers.get(key)
+        if informer is not None and (
+            informer.configuration is not configuration or informer.pid != os.getpid()
+        ):
+            informer.stop()
+            informer = None
+        if informer is None:
+            informer = PodInformer(namespace, label_selector, field_selector).start()
+            _informers[key] = informer
+        return informer
+
+
+def pod_is_ready(pod: V1Pod) -> bool:
+    if pod.status.phase != "Running":
+        return False
+    conditions = pod.status.conditions or []
+    return any(c.type == "Ready" and c.status == "True" for c in conditions)
+
+
+def _find_pod(pods: list[V1Pod], name: str) -> Optional[V1Pod]:
+    return next((pod for pod in pods if pod.metadata.name == name), None)
+
+
+def wait_for_pod_ready(name, namespace, timeout=300):
+    informer = get_pod_informer(namespace)
+
+    def ready(pods: list[V1Pod]) -> bool:
+        pod = _find_pod(pods, name)
+        return pod is not None and pod_is_ready(pod)
+
+    if informer.wait_for(ready, timeout):
+        return True
     print(f"Timeout waiting for pod {name} to be ready.")
     return False
 
 
+def wait_for_pods_ready(
+    names: list[str],
+    namespace: Optional[str] = None,
+    timeout=300,
+    on_ready: Optional[Callable[[V1Pod], None]] = None,
+) -> bool:
+    """Wait for all of `names` to be ready, calling on_ready(pod) as each one becomes ready"""
+    namespace = get_default_namespace_or(namespace)
+    informer = get_pod_informer(namespace)
+    waiting = set(names)
+
+    def all_ready(pods: list[V1Pod]) -> bool:
+        for pod in pods:
+            if pod.metadata.name in waiting and pod_is_ready(pod):
+                waiting.discard(pod.metadata.name)
+                if on_ready:
+                    on_ready(pod)
+        return not waiting
+
+    if informer.wait_for(all_ready, timeout):
+        return True
+    pending = sorted(waiting)
+    more = f" and {len(pending) - 10} more" if len(pending) > 10 else ""
+    print(f"Timeout waiting for pods to be ready: {', '.join(pending[:10])}{more}")
+    return False
+
+
 def wait_for_init(pod_name, timeout=300, namespace: Optional[str] = None, quiet: bool = False):
     namespace = get_default_namespace_or(namespace)
-    sclient = get_static_client()
-    w = watch.Watch()
-    for event in w.stream(
-        sclient.list_namespaced_pod, namespace=namespace, timeout_seconds=timeout
-    ):
-        pod = event["object"]
-        if pod.metadata.name == pod_name:
-            if not pod.status.init_container_statuses:
-                continue
-            for init_container_status in pod.status.init_container_statuses:
-                if init_container_status.state.running:
-                    if not quiet:
-                        print(f"initContainer in pod {pod_name} ({namespace}) is ready")
-                    w.stop()
-                    return True
+    informer = get_pod_informer(namespace)
+
+    def init_running(pods: list[V1Pod]) -> bool:
+        pod = _find_pod(pods, pod_name)
+        statuses = (pod and pod.status.init_container_statuses) or []
+        return any(status.state.running for status in statuses)
+
+    if informer.wait_for(init_running, timeout):
+        if not quiet:
+            print(f"initContainer in pod {pod_name} ({namespace}) is ready")
+        return True
     if not quiet:
         print(f"Timeout waiting for initContainer in {pod_name} ({namespace}) to be ready.")
     return False
@@ -335,8 +839,7 @@ def wait_for_ingress_controller(timeout=300):
 
 
 def get_ingress_ip_or_host():
-    config.load_kube_config()
-    networking_v1 = client.NetworkingV1Api()
+    networking_v1 = client.NetworkingV1Api(get_api_client())
     try:
         ingress = networking_v1.read_namespaced_ingress(CADDY_INGRESS_NAME, LOGGING_NAMESPACE)
         if ingress.status.load_balancer.ingress[0].hostname:
@@ -347,65 +850,65 @@ def get_ingress_ip_or_host():
         return None
 
 
-def pod_log(pod_name, container_name=None, follow=False, namespace: Optional[str] = None):
+def pod_log(
+    pod_name,
+    container_name=None,
+    follow=False,
+    namespace: Optional[str] = None,
+    since_seconds: Optional[int] = None,
+    tail_lines: Optional[int] = None,
+    timestamps: bool = False,
+    sclient: Optional[CoreV1Api] = None,
+):
     namespace = get_default_namespace_or(namespace)
-    sclient = get_static_client()
+    sclient = sclient or get_static_client()
 
+    kwargs = {}
+    if since_seconds is not None:
+        kwargs["since_seconds"] = since_seconds
+    if tail_lines is not None:
+        kwargs["tail_lines"] = tail_lines
     try:
         return sclient.read_namespaced_pod_log(
             name=pod_name,
             namespace=namespace,
             container=container_name,
             follow=follow,
+            timestamps=timestamps,
             _preload_content=False,
+            **kwargs,
         )
     except ApiException as e:
         raise Exception(json.loads(e.body.decode("utf-8"))["message"]) from None
 
 
 def wait_for_pod(pod_name, timeout_seconds=10, namespace: Optional[str] = None):
+    """Wait until the pod has left the Pending phase"""
     namespace = get_default_namespace_or(namespace)
-    sclient = get_static_client()
-    while timeout_seconds > 0:
-        pod = sclient.read_namespaced_pod_status(name=pod_name, namespace=namespace)
-        if pod.status.phase != "Pending":
-            return
-        sleep(1)
-        timeout_seconds -= 1
+    informer = get_pod_informer(namespace)
+
+    def started(pods: list[V1Pod]) -> bool:
+        pod = _find_pod(pods, pod_name)
+        return pod is not None and pod.status.phase != "Pending"
+
+    informer.wait_for(started, timeout_seconds)
 
 
 def write_file_to_container(
     pod_name, container_name, dst_path, data, namespace: Optional[str] = None, quiet: bool = False
 ):
+    """
+    Write `data` (str, bytes, or the Path of a local file) to `dst_path` in a container. The
+    file is streamed in chunks, checksummed in the pod and retried if it arrives corrupt.
+    """
     namespace = get_default_namespace_or(namespace)
-    sclient = get_static_client()
-    exec_command = ["sh", "-c", f"cat > {dst_path}.tmp && sync"]
+    source = data.encode() if isinstance(data, str) else data
     try:
-        res = stream(
-            sclient.connect_get_namespaced_pod_exec,
-            pod_name,
-            namespace,
-            command=exec_command,
-            container=container_name,
-            stdin=True,
-            stderr=True,
-            stdout=True,
-            tty=False,
-            _preload_content=False,
-        )
-        res.write_stdin(data)
-        res.close()
-        rename_command = ["sh", "-c", f"mv {dst_path}.tmp {dst_path}"]
-        stream(
-            sclient.connect_get_namespaced_pod_exec,
-            pod_name,
-            namespace,
-            command=rename_command,
-            container=container_name,
-            stdin=False,
-            stderr=True,
-            stdout=True,
-            tty=False,
+        with_retries(
+            lambda: exec_write(
+                get_exec_client(), pod_name, namespace, dst_path, source, container_name
+            ),
+            f"Copying to {pod_name}({container_name}):{dst_path}",
         )
         if not quiet:
             print(f"Successfully copied data to {pod_name}({container_name}):{dst_path}")
@@ -414,6 +917,25 @@ def write_file_to_container(
         print(f"Failed to copy data to {pod_name}({container_name}):{dst_path}:\n{e}")
 
 
+def port_forward(pod_name: str, port: int, namespace: Optional[str] = None):
+    """
+    Open a port-forward to `port` on a pod through the API server.
+    Returns a PortForward whose `.socket(port)` can be used like a connected TCP socket.
+    """
+    namespace = get_default_namespace_or(namespace)
+    return portforward(
+        get_exec_client().connect_get_namespaced_pod_portforward,
+        pod_name,
+        namespace,
+        ports=str(port),
+    )
+
+
+def in_cluster() -> bool:
+    """True when running inside a pod, where pod IPs are directly reachable"""
+    return "KUBERNETES_SERVICE_HOST" in os.environ
+
+
 def get_kubeconfig_value(jsonpath):
     command = f"kubectl config view --minify --raw -o jsonpath={jsonpath}"
     return run_command(command)
@@ -499,8 +1021,7 @@ def get_service_accounts_in_namespace(namespace):
 def can_delete_pods(namespace: Optional[str] = None) -> bool:
     namespace = get_default_namespace_or(namespace)
 
-    get_static_client()
-    auth_api = client.AuthorizationV1Api()
+    auth_api = client.AuthorizationV1Api(get_api_client())
 
     # Define the SelfSubjectAccessReview request for deleting pods
     access_review = client.V1SelfSubjectAccessReview(
@@ -556,43 +1077,31 @@ def download(
     source_path: Path,
     destination_path: Path = Path("."),
     namespace: Optional[str] = None,
+    container: Optional[str] = None,
 ) -> Path:
     """Download the item from the `source_path` to the `destination_path`"""
 
     namespace = get_default_namespace_or(namespace)
 
-    v1 = get_static_client()
-
     target_folder = destination_path / source_path.stem
     os.makedirs(target_folder, exist_ok=True)
 
-    command = ["tar", "cf", "-", "-C", str(source_path.parent), str(source_path.name)]
-
-    resp = stream(
-        v1.connect_get_namespaced_pod_exec,
-        name=pod_name,
-        namespace=namespace,
-        command=command,
-        stderr=True,
-        stdin=False,
-        stdout=True,
-        tty=False,
-        _preload_content=False,
-    )
-
+    command = shlex.join(["tar", "cf", "-", "-C", str(source_path.parent), str(source_path.name)])
     tar_file = target_folder.with_suffix(".tar")
-    with open(tar_file, "wb") as f:
-        while resp.is_open():
-            resp.update(timeout=1)
-            if resp.peek_stdout():
-                f.write(resp.read_stdout().encode("utf-8"))
-            if resp.peek_stderr():
-                print(resp.read_stderr())
-        resp.close()
-
-    with tarfile.open(tar_file, "r") as tar:
-        tar.extractall(path=destination_path)
-
-    os.remove(tar_file)
+
+    def attempt():
+        with open(tar_file, "wb") as f:
+            result = exec_read(get_exec_client(), pod_name, namespace, command, f.write, container)
+        if result.returncode != 0:
+            raise K8sError(f"Downloading {source_path} from {pod_name} failed: {result.stderr}")
+        if result.stderr:
+            print(result.stderr)
+
+    try:
+        with_retries(attempt, f"Downloading {source_path} from {pod_name}")
+        with tarfile.open(tar_file, "r") as tar:
+            tar.extractall(path=destination_path)
+    finally:
+        tar_file.unlink(missing_ok=True)
 
     return destination_path
@@ -0,0 +1,238 @@
+import base64
+import http.client
+import itertools
+import json
+import threading
+from typing import Any, Optional
+
+from kubernetes.client.models import V1Pod
+
+from .k8s import get_default_namespace_or, get_pod, in_cluster, port_forward
+
+# rpcuser is fixed in the bitcoincore chart's baseConfig
+RPC_USER = "user"
+# Same default as bitcoin-cli -rpcclienttimeout
+RPC_TIMEOUT = 900
+
+# https://github.com/bitcoin/bitcoin/blob/master/src/rpc/protocol.h
+RPC_TYPE_ERROR = -3
+
+
+class RPCError(Exception):
+    """An error returned by bitcoind, formatted the way bitcoin-cli prints it"""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+    def __str__(self):
+        return f"error code: {self.code}\nerror message:\n{self.message}"
+
+
+class RPCTransportError(Exception):
+    """
+    The tank could not be reached over JSON-RPC.
+    `delivered` is False only if bitcoind definitely never saw the request.
+    """
+
+    def __init__(self, message: str, delivered: bool):
+        super().__init__(message)
+        self.delivered = delivered
+
+
+class TankRPC:
+    """
+    Keep-alive JSON-RPC connection to one tank's bitcoind.
+
+    Inside the cluster we talk straight to the pod IP, otherwise the RPC port is reached through
+    an API server port-forward. The connection is reused between calls and re-established once
+    if the server has closed it.
+    """
+
+    def __init__(self, pod: V1Pod, timeout: int = RPC_TIMEOUT):
+        labels = pod.metadata.labels
+        self.name = pod.metadata.name
+        self.namespace = pod.metadata.namespace
+        self.pod_ip = pod.status.pod_ip
+        self.port = int(labels["RPCPort"])
+        self.timeout = timeout
+        credentials = f"{RPC_USER}:{labels['rpcpassword']}".encode()
+        self.headers = {
+            "Authorization": "Basic " + base64.b64encode(credentials).decode(),
+            "Content-Type": "application/json",
+        }
+        self.conn: Optional[http.client.HTTPConnection] = None
+        self.forward = None
+        self.ids = itertools.count()
+        self.lock = threading.Lock()
+
+    def connect(self) -> http.client.HTTPConnection:
+        if in_cluster() and self.pod_ip:
+            self.conn = http.client.HTTPConnection(self.pod_ip, self.port, timeout=self.timeout)
+        else:
+            self.forward = port_forward(self.name, self.port, namespace=self.namespace)
+            self.conn = http.client.HTTPConnection("localhost", self.port, timeout=self.timeout)
+            sock = self.forward.socket(self.port)
+            sock.settimeout(self.timeout)
+            self.conn.sock = sock
+        return self.conn
+
+    def close(self):
+        if self.conn:
+            self.conn.close()
+            self.conn = None
+        if self.forward:
+            self.forward.close()
+            self.forward = None
+
+    def request(self, payload) -> Any:
+        body = json.dumps(payload)
+        with self.lock:
+            for attempt in range(2):
+                reused = self.conn is not None
+                try:
+                    conn = self.conn or self.connect()
+                except Exception as e:
+                    self.close()
+                    raise RPCTransportError(f"Could not connect to {self.name}: {e}", False) from e
+                try:
+                    conn.request("POST", "/", body=body, headers=self.headers)
+                    response = conn.getresponse()
+                    data = response.read()
+                    break
+                except ConnectionError as e:
+                    self.close()
+                    # bitcoind drops idle keep-alive connections, retry those once
+                    if not reused or attempt:
+                        raise RPCTransportError(f"Lost connection to {self.name}: {e}", True) from e
+                except Exception as e:
+                    self.close()
+                    raise RPCTransportError(f"Lost connection to {self.name}: {e}", True) from e
+            if response.status in (401, 403):
+                self.close()
+                raise RPCTransportError(f"RPC authorization failed for {self.name}", False)
+            if response.getheader("Connection", "").lower() == "close":
+                self.close()
+        try:
+            return loads(data)
+        except ValueError as e:
+            raise RPCTransportError(
+                f"Unexpected response from {self.name} ({response.status}): {data[:200]}", True
+            ) from e
+
+    def call(self, method: str, params: Optional[list] = None) -> Any:
+        response = self.request(
+            {"jsonrpc": "1.0", "id": next(self.ids), "method": method, "params": params or []}
+        )
+        if response.get("error"):
+            raise RPCError(response["error"]["code"], response["error"]["message"])
+        return response["result"]
+
+    def batch(self, calls: list[tuple[str, Optional[list]]]) -> list[dict]:
+        """
+        Send several calls in a single JSON-RPC batch request.
+        Returns the raw response objects ({"result", "error", "id"}) in the order of `calls`.
+        """
+        ids = [next(self.ids) for _ in calls]
+        payload = [
+            {"jsonrpc": "1.0", "id": id, "method": method, "params": params or []}
+            for id, (method, params) in zip(ids, calls)
+        ]
+        responses = self.request(payload)
+        if isinstance(responses, dict) and responses.get("error"):
+            raise RPCError(responses["error"]["code"], responses["error"]["message"])
+        by_id = {response["id"]: response for response in responses}
+        return [by_id[id] for id in ids]
+
+
+_tanks: dict[tuple[str, str], TankRPC] = {}
+_tanks_lock = threading.Lock()
+
+
+def get_tank_rpc(tank: str, namespace: Optional[str] = None) -> TankRPC:
+    """Get the pooled RPC connection for a tank, looking up its pod on first use"""
+    namespace = get_default_namespace_or(namespace)
+    key = (namespace, tank)
+    with _tanks_lock:
+        if key not in _tanks:
+            try:
+                pod = get_pod(tank, namespace=namespace)
+            except Exception as e:
+                raise RPCTransportError(
+                    f"Could not find tank {tank} ({namespace}): {e}", False
+                ) from e
+            _tanks[key] = TankRPC(pod)
+        return _tanks[key]
+
+
+def parse_cli_params(params) -> list:
+    """
+    Convert bitcoin-cli style positional arguments to JSON-RPC params.
+    Anything that parses as JSON (numbers, booleans, arrays, objects) is sent as such,
+    everything else is sent as a string.
+    """
+    if not params:
+        return []
+    if isinstance(params, str):
+        params = params.split()
+    parsed = []
+    for param in params:
+        try:
+            parsed.append(loads(param))
+        except ValueError:
+            parsed.append(param)
+    return parsed
+
+
+def format_result(result: Any) -> str:
+    """Print results exactly the way bitcoin-cli does"""
+    if result is None:
+        return ""
+    if isinstance(result, str):
+        return result + "\n"
+    return _univalue_write(result, 1) + "\n"
+
+
+class _Number(float):
+    """A float that remembers the text bitcoind sent, so amounts keep all their digits"""
+
+    def __new__(cls, text: str):
+        number = super().__new__(cls, text)
+        number.text = text
+        return number
+
+
+def loads(data) -> Any:
+    return json.loads(data, parse_float=_Number)
+
+
+# Port of UniValue::write() with prettyIndent=2
+def _univalue_write(value: Any, level: int) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float):
+        return getattr(value, "text", repr(value))
+    if isinstance(value, (int, str)):
+        return json.dumps(value, ensure_ascii=False)
+    if isinstance(value, list):
+        items = [_univalue_write(v, level + 1) for v in value]
+        return _univalue_container("[", items, "]", level)
+    if isinstance(value, dict):
+        items = [
+            f"{json.dumps(k, ensure_ascii=False)}: {_univalue_write(v, level + 1)}"
+            for k, v in value.items()
+        ]
+        return _univalue_container("{", items, "}", level)
+    raise TypeError(f"Cannot format {type(value).__name__}")
+
+
+def _univalue_container(start: str, items: list[str], end: str, level: int) -> str:
+    indent = "  "
+    lines = "".join(indent * level + item + ",\n" for item in items)
+    if items:
+        # no comma after the last item
+        lines = lines[:-2] + "\n"
+    return f"{start}\n{lines}{indent * (level - 1)}{end}"
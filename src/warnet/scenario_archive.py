@@ -0,0 +1,168 @@
+"""
+Scenario archives for `warnet run`.
+
+A scenario runs in its commander pod from a zipapp of the scenario and the frameworks it
+imports. Each archive is built once and kept in the local cache, keyed by a hash of the files
+that go into it, and stored in each namespace once, as an immutable ConfigMap that commander
+pods mount. Running the same scenario again, in the same namespace or another one, neither
+rebuilds nor re-uploads it, and the commander starts without waiting for an upload.
+
+Members are stored uncompressed, and when warnet runs on the commander image's Python each
+module's bytecode goes alongside it, so zipimport neither decompresses nor compiles anything.
+The sources are then only read for tracebacks, and are deflated to keep archives small enough
+for a ConfigMap.
+"""
+
+import base64
+import hashlib
+import importlib.util
+import marshal
+import os
+import struct
+import sys
+import tempfile
+import zipfile
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from kubernetes.client import V1ConfigMap, V1ObjectMeta
+from kubernetes.client.rest import ApiException
+
+from .constants import (
+    COMMANDER_ARCHIVE,
+    COMMANDER_PYTHON,
+    SCENARIO_ARCHIVE_CACHE_DIR,
+    SCENARIO_ARCHIVE_CONFIGMAP_LIMIT,
+    SCENARIO_ARCHIVE_NAME,
+)
+from .k8s import config_map_exists, get_static_client
+
+# Changes the key of every archive when the way they are built changes
+ARCHIVE_FORMAT = 1
+# Everything a scenario needs besides itself
+ARCHIVE_INCLUDES = ["__init__.py", "commander.py", "test_framework", "ln_framework"]
+ARCHIVE_EXCLUDES = [".pyc", ".csv", ".DS_Store"]
+# zip can't store earlier timestamps. A fixed one makes archives of the same files identical.
+ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
+
+
+class ScenarioArchive(NamedTuple):
+    key: str
+    path: Path  # In the local cache
+    size: int
+
+    @property
+    def config_map(self) -> str:
+        return f"{SCENARIO_ARCHIVE_NAME}-{self.key}"
+
+
+def scenario_archive(scenario_path: Path, scenario_dir: Path) -> ScenarioArchive:
+    """The archive for running `scenario_path`, built unless it is already cached"""
+    # In case the scenario file is not in the root of the archive directory,
+    # we need to specify its relative path as a submodule
+    relative_name = scenario_path.relative_to(scenario_dir).with_suffix("")
+    # Replace path separators with dots and pray the user included __init__.py
+    module_name = ".".join(relative_name.parts)
+    files = archive_files(scenario_path, scenario_dir)
+    bytecode = sys.version_info[:2] == COMMANDER_PYTHON
+
+    digest = hashlib.sha256(f"{ARCHIVE_FORMAT}\0{module_name}\0{bytecode}\0".encode())
+    for path in files:
+        data = path.read_bytes()
+        digest.update(f"{path.relative_to(scenario_dir).as_posix()}\0{len(data)}\0".encode())
+        digest.update(data)
+    key = digest.hexdigest()[:32]
+
+    path = SCENARIO_ARCHIVE_CACHE_DIR / f"{key}.pyz"
+    if not path.exists():
+        write_archive(path, scenario_dir, files, module_name, bytecode)
+    return ScenarioArchive(key, path, path.stat().st_size)
+
+
+def archive_files(scenario_path: Path, scenario_dir: Path) -> list[Path]:
+    """The scenario and the framework files it needs. The whole scenarios/ directory isn't."""
+    files = []
+    for path in sorted(scenario_dir.rglob("*")):
+        relative = str(path.relative_to(scenario_dir))
+        if not path.is_file() or any(needle in relative for needle in ARCHIVE_EXCLUDES):
+            continue
+        if any(needle in relative for needle in [*ARCHIVE_INCLUDES, scenario_path.name]):
+            files.append(path)
+    return files
+
+
+def write_archive(
+    path: Path, scenario_dir: Path, files: list[Path], module_name: str, bytecode: bool
+):
+    members = [(file.relative_to(scenario_dir).as_posix(), file.read_bytes()) for file in files]
+    main = f"import {module_name}\n{module_name}.main()\n"
+    members.append(("__main__.py", main.encode()))
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f, zipfile.ZipFile(f, "w") as zf:
+            for name, data in members:
+                print(f"Including: {name}")
+                code = _bytecode(data, name) if bytecode and name.endswith(".py") else None
+                _add(zf, name, data, compressed=code is not None)
+                if code is not None:
+                    _add(zf, f"{name[:-3]}.pyc", code, compressed=False)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def store_archive(archive: ScenarioArchive, namespace: str) -> bool:
+    """
+    Make sure `namespace` has the archive's ConfigMap. Returns False if it can't, because the
+    archive is too large or we may not create ConfigMaps, so the archive has to be uploaded.
+    """
+    if archive.size > SCENARIO_ARCHIVE_CONFIGMAP_LIMIT:
+        return False
+    if config_map_exists(archive.config_map, namespace):
+        return True
+    body = V1ConfigMap(
+        metadata=V1ObjectMeta(
+            name=archive.config_map, labels={"app.kubernetes.io/name": SCENARIO_ARCHIVE_NAME}
+        ),
+        binary_data={
+            Path(COMMANDER_ARCHIVE).name: base64.b64encode(archive.path.read_bytes()).decode()
+        },
+        immutable=True,
+    )
+    try:
+        get_static_client().create_namespaced_config_map(namespace, body)
+    except ApiException as e:
+        # Another run got there first
+        if e.status == 409:
+            return True
+        print(f"Could not store scenario archive in {namespace} ({e.status} {e.reason})")
+        return False
+    return True
+
+
+def _bytecode(source: bytes, name: str) -> Optional[bytes]:
+    """
+    An unchecked hash-based pyc, which zipimport loads without comparing it with the source.
+    None if the source doesn't compile, so the error is raised in the commander as before.
+    """
+    try:
+        code = compile(source, f"{COMMANDER_ARCHIVE}/{name}", "exec", dont_inherit=True)
+    except SyntaxError:
+        return None
+    return (
+        importlib.util.MAGIC_NUMBER
+        + struct.pack("<I", 0b01)
+        + importlib.util.source_hash(source)
+        + marshal.dumps(code)
+    )
+
+
+def _add(zf: zipfile.ZipFile, name: str, data: bytes, compressed: bool):
+    info = zipfile.ZipInfo(name, ZIP_EPOCH)
+    info.compress_type = zipfile.ZIP_DEFLATED if compressed else zipfile.ZIP_STORED
+    info.external_attr = 0o644 << 16
+    zf.writestr(info, data)
@@ -0,0 +1,215 @@
+"""
+Shared scheduler for warnet's parallel deploy and teardown work.
+
+Almost everything warnet does in parallel is waiting on helm, kubectl or the API server, so
+tasks run on one bounded pool of threads instead of a forked interpreter each. Task starts
+(and any API request that calls throttle()) draw from a token bucket so large networks don't
+trip API server rate limits, and queued tasks run in priority order.
+
+Tasks may submit subtasks and wait for them: a waiting thread runs queued tasks itself, so
+nested stages (deploy -> network -> node) can't deadlock the bounded pool.
+"""
+
+import itertools
+import json
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future
+from concurrent.futures import wait as wait_futures
+from enum import IntEnum
+from typing import Any, Callable, NamedTuple, Optional
+
+from .constants import API_BURST, API_QPS, MAX_PARALLEL, PROGRESS_FORMAT
+
+
+class Priority(IntEnum):
+    """Lower values are started first"""
+
+    CRD = 0  # Custom resource definitions that later charts depend on
+    INFRA = 10  # Logging, ingress and other cluster-wide services
+    NETWORK = 20  # Tanks, namespaces and their plugins
+    DEFAULT = 50
+
+
+class TaskEvent(NamedTuple):
+    name: str
+    state: str  # "started", "done" or "failed"
+    done: int
+    total: int
+    elapsed: float
+    error: Optional[str] = None
+
+
+class TokenBucket:
+    """Allow `rate` acquisitions per second on average, in bursts of up to `burst`"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1):
+        if self.rate <= 0 or tokens <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                delay = (tokens - self.tokens) / self.rate
+            time.sleep(delay)
+
+
+class _Task(NamedTuple):
+    fn: Callable
+    args: tuple
+    kwargs: dict
+    name: str
+    cost: float
+    future: Future
+
+
+class Scheduler:
+    def __init__(
+        self,
+        max_workers: int = MAX_PARALLEL,
+        rate: float = API_QPS,
+        burst: float = API_BURST,
+        progress: Optional[Callable[[TaskEvent], None]] = None,
+    ):
+        self.max_workers = max(1, max_workers)
+        self.bucket = TokenBucket(rate, burst)
+        self.progress = progress
+        self._queue: queue.PriorityQueue = queue.PriorityQueue()
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+        self._workers: list[threading.Thread] = []
+        self._idle = 0
+        self._total = 0
+        self._done = 0
+
+    def submit(
+        self,
+        fn: Callable,
+        *args,
+        name: Optional[str] = None,
+        priority: int = Priority.DEFAULT,
+        cost: float = 1,
+        **kwargs,
+    ) -> Future:
+        """
+        Queue fn(*args, **kwargs). `cost` tokens are taken from the rate limit when the task
+        starts; use 0 for tasks that only coordinate others.
+        """
+        future: Future = Future()
+        task = _Task(fn, args, kwargs, name or getattr(fn, "__name__", "task"), cost, future)
+        with self._lock:
+            self._total += 1
+            self._queue.put((priority, next(self._order), task))
+            if self._queue.qsize() > self._idle and len(self._workers) < self.max_workers:
+                worker = threading.Thread(target=self._work, daemon=True)
+                self._workers.append(worker)
+                worker.start()
+        return future
+
+    def throttle(self, tokens: float = 1):
+        """Wait for the API rate limit, for callers making requests inside a task"""
+        self.bucket.acquire(tokens)
+
+    def wait(self, futures: list[Future]) -> list[Future]:
+        """Block until all futures are done, running queued tasks meanwhile"""
+        pending = {f for f in futures if not f.done()}
+        while pending:
+            try:
+                _, _, task = self._queue.get_nowait()
+            except queue.Empty:
+                _, pending = wait_futures(pending, timeout=0.05, return_when=FIRST_COMPLETED)
+                continue
+            self._run(task)
+            pending = {f for f in pending if not f.done()}
+        return futures
+
+    def run_all(self, calls: list[tuple[Callable, tuple]], **submit_kwargs) -> list[Any]:
+        """Run fn(*args) for each (fn, args), wait, and return the results in order"""
+        futures = [self.submit(fn, *args, **submit_kwargs) for fn, args in calls]
+        return [f.result() for f in self.wait(futures)]
+
+    def _work(self):
+        while True:
+            with self._lock:
+                self._idle += 1
+            _, _, task = self._queue.get()
+            with self._lock:
+                self._idle -= 1
+            self._run(task)
+
+    def _run(self, task: _Task):
+        if not task.future.set_running_or_notify_cancel():
+            return
+        self.bucket.acquire(task.cost)
+        start = time.monotonic()
+        self._emit(task.name, "started", start)
+        try:
+            result = task.fn(*task.args, **task.kwargs)
+        except BaseException as e:
+            task.future.set_exception(e)
+            self._finished(task.name, start, e)
+        else:
+            task.future.set_result(result)
+            self._finished(task.name, start)
+
+    def _finished(self, name: str, start: float, error: Optional[BaseException] = None):
+        with self._lock:
+            self._done += 1
+        if error is None:
+            self._emit(name, "done", start)
+            return
+        if isinstance(error, SystemExit) and not error.code:
+            self._emit(name, "done", start)
+            return
+        self._emit(name, "failed", start, f"{type(error).__name__}: {error}")
+        if self.progress is None:
+            # Failures are always worth reporting, as a crashed child process used to be
+            print(f"{name} failed: {error}", file=sys.stderr)
+
+    def _emit(self, name: str, state: str, start: float, error: Optional[str] = None):
+        if self.progress is None:
+            return
+        with self._lock:
+            done, total = self._done, self._total
+        self.progress(TaskEvent(name, state, done, total, time.monotonic() - start, error))
+
+
+def print_progress(event: TaskEvent):
+    if PROGRESS_FORMAT == "json":
+        print(json.dumps(event._asdict()), flush=True)
+        return
+    if event.state == "started":
+        return
+    line = f"[{event.done}/{event.total}] {event.name} {event.state} in {event.elapsed:.1f}s"
+    if event.error:
+        line += f": {event.error}"
+    print(line, flush=True)
+
+
+_scheduler: Optional[Scheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> Scheduler:
+    """
+    The process-wide scheduler, sized by WARNET_MAX_PARALLEL and rate limited by
+    WARNET_API_QPS/WARNET_API_BURST. WARNET_PROGRESS=text|json reports every task.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler(progress=print_progress if PROGRESS_FORMAT else None)
+        return _scheduler
@@ -0,0 +1,165 @@
+"""
+In-cluster snapshot cache for the bitcoincore chart's `loadSnapshot`.
+
+When network.yaml sets `snapshot_cache.enabled`, `warnet deploy` runs one snapshot-cache pod
+in the network's namespace and points every tank's `loadSnapshot.url` at it. The cache fetches
+each snapshot from its origin once and serves it to every tank that boots from it. A
+`loadSnapshot.url` can then also be a local file (a path relative to the network directory, or
+a file:// URL), which deploy uploads to the cache.
+"""
+
+import hashlib
+import json
+import subprocess
+from functools import lru_cache
+from pathlib import Path
+from typing import NamedTuple, Optional
+from urllib.parse import quote, urlsplit
+
+import click
+import yaml
+
+from .constants import (
+    HELM_COMMAND,
+    SNAPSHOT_CACHE_CHART,
+    SNAPSHOT_CACHE_IMAGE,
+    SNAPSHOT_CACHE_NAME,
+    SNAPSHOT_CACHE_PORT,
+    SNAPSHOT_CACHE_SCRIPT,
+)
+from .k8s import wait_for_pod_ready
+from .process import run_command, stream_command
+
+
+class SnapshotSource(NamedTuple):
+    key: str  # Name of the snapshot in the cache
+    name: str  # File name, kept in cache URLs so the chart can tell how it is compressed
+    origin: Optional[str]  # URL the cache fetches the snapshot from
+    path: Optional[Path]  # Local file deploy uploads to the cache instead
+
+
+def snapshot_source(url: str, directory: Path) -> SnapshotSource:
+    parts = urlsplit(url)
+    if parts.scheme in ("", "file"):
+        path = Path(parts.path if parts.scheme else url)
+        if not path.is_absolute():
+            path = (directory / path).resolve()
+        if not path.is_file():
+            raise click.ClickException(f"Snapshot {url} not found at {path}")
+        stat = path.stat()
+        # A changed file is a new snapshot, without hashing its contents on every deploy
+        identity = f"{path}\0{stat.st_size}\0{stat.st_mtime_ns}"
+        key = hashlib.sha256(identity.encode()).hexdigest()[:32]
+        return SnapshotSource(key, path.name, None, path)
+    # The cache checks that an origin matches its key, see snapshot-cache.py
+    key = hashlib.sha256(url.encode()).hexdigest()[:32]
+    return SnapshotSource(key, Path(parts.path).name or "snapshot", url, None)
+
+
+def cache_url(source: SnapshotSource, namespace: str) -> str:
+    url = (
+        f"http://{SNAPSHOT_CACHE_NAME}.{namespace}.svc:{SNAPSHOT_CACHE_PORT}"
+        f"/snapshots/{source.key}/{quote(source.name)}"
+    )
+    if source.origin:
+        url += f"?origin={quote(source.origin, safe='')}"
+    return url
+
+
+@lru_cache(maxsize=None)
+def snapshot_cache_image() -> dict:
+    """The cache's image, tagged with the snapshot-cache chart's appVersion like the cache pod"""
+    with (Path(SNAPSHOT_CACHE_CHART) / "Chart.yaml").open() as f:
+        chart = yaml.safe_load(f)
+    return {**SNAPSHOT_CACHE_IMAGE, "tag": str(chart["appVersion"])}
+
+
+def route_snapshots(
+    network_file: dict, defaults: dict, directory: Path, namespace: str, cache: bool = True
+) -> tuple[list[dict], dict[str, SnapshotSource]]:
+    """
+    Point the network's snapshot loading at the namespace's snapshot cache, if network.yaml
+    enables it and `cache` is true. Returns the network's nodes with their `loadSnapshot.url`
+    rewritten, and the snapshots by key.
+    """
+    nodes = network_file.get("nodes") or []
+    enabled = cache and (network_file.get("snapshot_cache") or {}).get("enabled", False)
+    sources: dict[str, SnapshotSource] = {}
+    routed = []
+    for node in nodes:
+        load = {**(defaults.get("loadSnapshot") or {}), **(node.get("loadSnapshot") or {})}
+        if not load.get("enabled") or not load.get("url"):
+            routed.append(node)
+            continue
+        source = snapshot_source(load["url"], directory)
+        if not enabled:
+            if source.path:
+                raise click.ClickException(
+                    f"Node {node['name']} loads a local snapshot, which needs the snapshot cache "
+                    "(snapshot_cache.enabled in network.yaml)"
+                )
+            routed.append(node)
+            continue
+        sources[source.key] = source
+        load = {**load, "url": cache_url(source, namespace)}
+        if "image" not in load:
+            load.update(image=snapshot_cache_image(), installPackages=False)
+        routed.append({**node, "loadSnapshot": load})
+    return routed, sources
+
+
+def deploy_snapshot_cache(
+    sources: dict[str, SnapshotSource], namespace: str, debug: bool = False
+) -> bool:
+    """Start the namespace's snapshot cache and upload local snapshots it doesn't have yet"""
+    if not sources:
+        return False
+    click.echo(f"Deploying snapshot cache for {len(sources)} snapshots in {namespace}")
+    cmd = f"{HELM_COMMAND} {SNAPSHOT_CACHE_NAME} {SNAPSHOT_CACHE_CHART} --namespace {namespace}"
+    if debug:
+        cmd += " --debug"
+    if not stream_command(cmd):
+        click.echo(f"Failed to run Helm command: {cmd}")
+        return False
+    if not wait_for_pod_ready(SNAPSHOT_CACHE_NAME, namespace):
+        return False
+    for source in sources.values():
+        if source.path and not snapshot_cached(source, namespace):
+            upload_snapshot(source, namespace)
+    return True
+
+
+def snapshot_cached(source: SnapshotSource, namespace: str) -> bool:
+    cmd = ["kubectl", "exec", SNAPSHOT_CACHE_NAME, "--namespace", namespace, "--"]
+    cmd += ["test", "-f", f"/cache/{source.key}"]
+    return subprocess.run(cmd, capture_output=True).returncode == 0
+
+
+def upload_snapshot(source: SnapshotSource, namespace: str):
+    size = source.path.stat().st_size
+    click.echo(f"Uploading {source.path} ({size / (1 << 20):.1f} MiB) to the snapshot cache")
+    cmd = ["kubectl", "exec", "-i", SNAPSHOT_CACHE_NAME, "--namespace", namespace, "--"]
+    cmd += ["python", SNAPSHOT_CACHE_SCRIPT, "store", source.key]
+    with source.path.open("rb") as f:
+        result = subprocess.run(cmd, stdin=f, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise click.ClickException(f"Uploading {source.path} failed: {result.stderr.strip()}")
+
+
+def snapshot_cache_stats(namespace: str) -> dict:
+    """Request and hit counters of the namespace's running snapshot cache"""
+    cmd = (
+        f"kubectl exec {SNAPSHOT_CACHE_NAME} --namespace {namespace} "
+        f"-- python {SNAPSHOT_CACHE_SCRIPT} stats"
+    )
+    return json.loads(run_command(cmd))
+
+
+def format_cache_stats(stats: dict) -> str:
+    requests = stats["requests"]
+    served = stats["hits"] + stats["coalesced"]
+    return (
+        f"{len(stats['snapshots'])} snapshots, {served} of {requests} requests served from cache "
+        f"({stats['hit_rate']:.0%}), {stats['origin_bytes'] / (1 << 20):.1f} MiB fetched, "
+        f"{stats['served_bytes'] / (1 << 20):.1f} MiB served"
+    )
@@ -0,0 +1,699 @@
+"""
+Content-addressed store for tank snapshots.
+
+Every file in a tank's datadir is split into fixed-size chunks named by their sha256, and each
+chunk is stored once no matter how many tanks (or snapshots of one tank) contain it. A snapshot
+is a manifest listing each file's chunks. Tanks that share a chain share their block files, so
+snapshotting a whole network costs about one chain's worth of disk and transfer.
+
+Files are hashed inside the pods, in one pass each, so a file whose sha256 the store already
+has from any tank or snapshot isn't copied at all, and a new one is copied out of just one of
+the tanks that has it. Files whose size and mtime match the tank's previous manifest aren't even
+re-hashed, and a file that grew since then, like the last block file, is copied from its last
+whole chunk on. A manifest can be restored to a tarball that the bitcoincore chart's
+`loadSnapshot` can load.
+
+    <store>/chunks/ab/abcdef...                       chunk contents
+    <store>/manifests/<namespace>/<tank>/<id>.json    one per snapshot
+"""
+
+import hashlib
+import itertools
+import json
+import os
+import secrets
+import tarfile
+import tempfile
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Iterator, NamedTuple, Optional
+
+from .constants import (
+    BITCOINCORE_CONTAINER,
+    SNAPSHOT_NO_FILES_EXIT,
+    SNAPSHOT_STORE_CHUNK_SIZE,
+    SNAPSHOT_STORE_SCRIPT_LIMIT,
+)
+from .exec_transfer import TransferError, exec_read, with_retries
+from .k8s import K8sError, datadir_selection, get_exec_client, snapshot_compressor
+from .scheduler import get_scheduler
+
+
+class FileEntry(NamedTuple):
+    path: str
+    size: int
+    mtime: int
+
+
+class FileRequest(NamedTuple):
+    path: str
+    sha256: str  # As hashed in the pod
+    prefix: list[list]  # Stored chunks the file is expected to start with, which aren't fetched
+
+
+class TankSnapshot(NamedTuple):
+    namespace: str
+    tank: str
+    manifest: Optional[Path]  # None if the tank had nothing to snapshot, or failed
+    files: int
+    size: int  # Bytes of files in the snapshot
+    hashed: int  # Bytes hashed in the pod, the rest were unchanged since the last snapshot
+    fetched: int  # Bytes copied out of this tank
+    error: Optional[str] = None
+
+
+class SnapshotStore:
+    def __init__(self, root: Path, chunk_size: int = SNAPSHOT_STORE_CHUNK_SIZE):
+        self.root = Path(root)
+        self.chunk_size = chunk_size
+        (self.root / "chunks").mkdir(parents=True, exist_ok=True)
+        (self.root / "manifests").mkdir(parents=True, exist_ok=True)
+
+    def chunk_path(self, digest: str) -> Path:
+        return self.root / "chunks" / digest[:2] / digest
+
+    def has_chunk(self, digest: str) -> bool:
+        return self.chunk_path(digest).exists()
+
+    def put_chunk(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.chunk_path(digest)
+        if not path.exists():
+            path.parent.mkdir(exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".chunk-")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        return digest
+
+    def manifest_dir(self, namespace: str, tank: str) -> Path:
+        return self.root / "manifests" / namespace / tank
+
+    def manifests(self, namespace: str, tank: str) -> list[Path]:
+        """A tank's manifests, oldest first"""
+        directory = self.manifest_dir(namespace, tank)
+        if not directory.is_dir():
+            return []
+        return sorted(directory.glob("*.json"), key=_manifest_order)
+
+    def latest_manifest(self, namespace: str, tank: str) -> Optional[dict]:
+        manifests = self.manifests(namespace, tank)
+        return load_manifest(manifests[-1]) if manifests else None
+
+    def tanks(self) -> list[tuple[str, str]]:
+        """(namespace, tank) of every tank with at least one snapshot"""
+        return sorted(
+            (path.parent.name, path.name)
+            for path in (self.root / "manifests").glob("*/*")
+            if any(path.glob("*.json"))
+        )
+
+    def save_manifest(self, manifest: dict) -> Path:
+        directory = self.manifest_dir(manifest["namespace"], manifest["tank"])
+        directory.mkdir(parents=True, exist_ok=True)
+        stamp = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime(manifest["created"]))
+        path = directory / f"{stamp}.json"
+        suffix = 1
+        while path.exists():
+            path = directory / f"{stamp}-{suffix}.json"
+            suffix += 1
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".manifest-")
+        with os.fdopen(fd, "w") as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp, path)
+        return path
+
+    def file_index(self) -> dict[str, list[list]]:
+        """The chunks of every file in any manifest by the file's sha256, if they're all stored"""
+        index = {}
+        for path in (self.root / "manifests").glob("*/*/*.json"):
+            for entry in load_manifest(path)["files"]:
+                sha = entry.get("sha256")
+                if sha and sha not in index and _stored(self, entry["chunks"]):
+                    index[sha] = entry["chunks"]
+        return index
+
+    def usage(self) -> tuple[int, int]:
+        """Number of chunks and their total size in bytes"""
+        sizes = [path.stat().st_size for path in (self.root / "chunks").glob("*/*")]
+        return len(sizes), sum(sizes)
+
+    def restore(
+        self, manifest: dict, out_path: Path, compression: str = "gzip", level: Optional[int] = None
+    ):
+        """
+        Write a manifest out as a tarball with paths relative to the chain's datadir, the layout
+        `warnet snapshot` produces and the chart's `loadSnapshot` expects.
+        """
+        missing = [d for f in manifest["files"] for d, _ in f["chunks"] if not self.has_chunk(d)]
+        if missing:
+            raise K8sError(f"{len(missing)} chunks of this snapshot are missing from the store")
+        partial_path = out_path.with_name(out_path.name + ".part")
+        try:
+            with partial_path.open("wb") as f:
+                writer = _CompressingWriter(f, snapshot_compressor(compression, level))
+                with tarfile.open(fileobj=writer, mode="w|") as tar:
+                    for directory in manifest["dirs"]:
+                        info = tarfile.TarInfo(directory)
+                        info.type = tarfile.DIRTYPE
+                        info.mode = 0o755
+                        info.mtime = manifest["created"]
+                        tar.addfile(info)
+                    for entry in manifest["files"]:
+                        info = tarfile.TarInfo(entry["path"])
+                        info.size = sum(length for _, length in entry["chunks"])
+                        info.mode = 0o644
+                        info.mtime = entry["mtime"]
+                        tar.addfile(info, _ChunkReader(self, entry["chunks"]))
+                writer.close()
+            os.replace(partial_path, out_path)
+        except BaseException:
+            partial_path.unlink(missing_ok=True)
+            raise
+
+
+def load_manifest(path: Path) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+class _CompressingWriter:
+    """Minimal write-only file object that compresses into `f` (or passes through)"""
+
+    def __init__(self, f, compressor):
+        self.f = f
+        self.compressor = compressor
+
+    def write(self, data: bytes) -> int:
+        self.f.write(self.compressor.compress(data) if self.compressor else data)
+        return len(data)
+
+    def close(self):
+        if self.compressor is not None:
+            self.f.write(self.compressor.flush())
+            self.compressor = None
+
+
+class _ChunkReader:
+    """Read-only file object over a list of stored chunks"""
+
+    def __init__(self, store: SnapshotStore, chunks: list[list]):
+        self.store = store
+        self.chunks = iter(chunks)
+        self.chunk = b""
+        self.offset = 0
+
+    def read(self, n: int = -1) -> bytes:
+        parts = []
+        while n != 0:
+            if self.offset == len(self.chunk):
+                digest = next(self.chunks, None)
+                if digest is None:
+                    break
+                self.chunk = self.store.chunk_path(digest[0]).read_bytes()
+                self.offset = 0
+                continue
+            end = len(self.chunk) if n < 0 else min(len(self.chunk), self.offset + n)
+            parts.append(self.chunk[self.offset : end])
+            n -= 0 if n < 0 else end - self.offset
+            self.offset = end
+        return b"".join(parts)
+
+
+class _FileFrames:
+    """
+    Sink for a fetch script's stdout, which frames each file as its length (or "-" if it's
+    gone), its contents and a random trailer, so a file that shrinks mid-transfer can't
+    silently shift every later one. Contents are cut into chunks and stored as they arrive, and
+    hashed along with the stored chunks the file starts with.
+    """
+
+    def __init__(self, pod: str, store: SnapshotStore, requests: list[FileRequest], token: str):
+        self.pod = pod
+        self.store = store
+        self.requests = iter(requests)
+        self.expected = len(requests)
+        self.trailer = f"\n{token}\n".encode()
+        # Per file: None if it was gone, else its sha256, chunks and the bytes received
+        self.results: list[Optional[tuple[str, list[list], int]]] = []
+        self.buffer = bytearray()
+        self.request: Optional[FileRequest] = None
+        self.gone = False
+        self.remaining = 0
+        self.received = 0
+        self.digest = hashlib.sha256()
+        self.chunks: list[list] = []
+        self.chunk = bytearray()
+
+    def __call__(self, data: bytes):
+        self.buffer += data
+        while self.buffer:
+            if self.request is None:
+                end = self.buffer.find(b"\n")
+                if end < 0:
+                    return
+                self._start(bytes(self.buffer[:end]))
+                del self.buffer[: end + 1]
+            elif self.remaining:
+                n = min(self.remaining, len(self.buffer), self.store.chunk_size - len(self.chunk))
+                part = self.buffer[:n]
+                del self.buffer[:n]
+                self.chunk += part
+                self.digest.update(part)
+                self.remaining -= n
+                self.received += n
+                if len(self.chunk) == self.store.chunk_size:
+                    self._store_chunk()
+            else:
+                if len(self.buffer) < len(self.trailer):
+                    return
+                if self.buffer[: len(self.trailer)] != self.trailer:
+                    self._lost_sync()
+                del self.buffer[: len(self.trailer)]
+                self._finish()
+
+    def done(self) -> bool:
+        return self.request is None and not self.buffer and len(self.results) == self.expected
+
+    def _start(self, header: bytes):
+        request = next(self.requests, None)
+        if request is None or not (header == b"-" or header.isdigit()):
+            self._lost_sync()
+        self.request = request
+        self.gone = header == b"-"
+        self.remaining = 0 if self.gone else int(header)
+        self.received = 0
+        self.digest = hashlib.sha256()
+        self.chunks = [list(c) for c in request.prefix]
+        if not self.gone:
+            for digest, _ in request.prefix:
+                self.digest.update(self.store.chunk_path(digest).read_bytes())
+
+    def _store_chunk(self):
+        self.chunks.append([self.store.put_chunk(bytes(self.chunk)), len(self.chunk)])
+        self.chunk = bytearray()
+
+    def _finish(self):
+        if self.chunk:
+            self._store_chunk()
+        self.results.append(
+            None if self.gone else (self.digest.hexdigest(), self.chunks, self.received)
+        )
+        self.request = None
+
+    def _lost_sync(self):
+        at = f" at {self.request.path}" if self.request else ""
+        raise TransferError(f"Snapshot file stream from {self.pod} lost sync{at}")
+
+
+def list_tank_files(
+    pod: str, namespace: str, chain: str, filters: Optional[list[str]]
+) -> tuple[list[str], list[FileEntry]]:
+    """The directories and files (with size and mtime) a snapshot of the tank would contain"""
+    script = "\n".join(
+        [
+            f"tops=$({datadir_selection(filters)})",
+            f'[ -n "$tops" ] || exit {SNAPSHOT_NO_FILES_EXIT}',
+            """printf '%s\\n' "$tops" | while IFS= read -r top; do""",
+            """  find "$top" -type d | sed 's/^/D 0 0 /'""",
+            """  find "$top" -type f -exec stat -c 'F %s %Y %n' {} +""",
+            "done",
+        ]
+    )
+    returncode, output = _read_script(pod, namespace, chain, script, f"Listing files in {pod}")
+    if returncode == SNAPSHOT_NO_FILES_EXIT:
+        return [], []
+    dirs, files = set(), {}
+    for line in output.decode(errors="surrogateescape").splitlines():
+        kind, size, mtime, path = line.split(" ", 3)
+        if kind == "D":
+            dirs.add(path)
+        else:
+            files[path] = FileEntry(path, int(size), int(mtime))
+    return sorted(dirs), sorted(files.values())
+
+
+def hash_tank_files(pod: str, namespace: str, chain: str, paths: list[str]) -> dict[str, str]:
+    """sha256 of every file in `paths` that still exists, computed inside the pod"""
+    hashes = {}
+    for batch in _batches(paths):
+        script = _reading_lines(
+            'while IFS= read -r p; do\n  [ -f "$p" ] && sha256sum "$p" || :\ndone', batch
+        )
+        _, output = _read_script(pod, namespace, chain, script, f"Hashing files in {pod}")
+        for line in output.decode(errors="surrogateescape").splitlines():
+            # "<sha256>  <path>"
+            hashes[line[66:]] = line[:64]
+    return hashes
+
+
+def fetch_tank_files(
+    pod: str,
+    namespace: str,
+    chain: str,
+    requests: list[FileRequest],
+    store: SnapshotStore,
+    progress: Optional[Callable[[int], None]] = None,
+) -> dict[str, Optional[tuple[str, list[list], int]]]:
+    """
+    Copy files out of a tank into the store, skipping the chunks each one is expected to start
+    with. Returns each file's actual sha256, chunks and the bytes copied, or None if it's gone,
+    as a running node may have changed it since it was hashed. A file that doesn't match its
+    hash after skipping its start is fetched again in full, as its start may have changed too.
+    """
+    fetched = {}
+    while requests:
+        refetch = []
+        for batch in _batches(requests, lambda r: f"{len(r.prefix)} {r.path}"):
+            for request, result in zip(
+                batch, _fetch_batch(pod, namespace, chain, batch, store, progress)
+            ):
+                if result is not None and request.prefix and result[0] != request.sha256:
+                    refetch.append(request._replace(prefix=[]))
+                else:
+                    fetched[request.path] = result
+        requests = refetch
+    return fetched
+
+
+def snapshot_tanks_to_store(
+    store: SnapshotStore,
+    tanks: list[tuple[str, str, str]],
+    filters: Optional[list[str]] = None,
+    progress: Optional[Callable[[int], None]] = None,
+) -> list[TankSnapshot]:
+    """
+    Snapshot (namespace, tank, chain) tanks into the store:
+
+    1. list every tank's files, in parallel
+    2. hash, in the pods, the files that changed since each tank's previous manifest
+    3. fetch every file whose hash the store doesn't know from one tank that has it, in
+       parallel, falling back to another tank that has it if that fails. The tank with most of
+       the file stored already is picked, and copies only the rest.
+    4. write a manifest for every tank whose chunks are all in the store
+    """
+    scheduler = get_scheduler()
+    chunk_size = store.chunk_size
+    errors: list[Optional[str]] = [None] * len(tanks)
+
+    listings = _run_per_tank(
+        errors,
+        [(list_tank_files, (tank, ns, chain, filters)) for ns, tank, chain in tanks],
+        default=([], []),
+    )
+
+    # Reuse the previous manifest's entries for files that haven't changed, and the start of
+    # those that have, in case they were only appended to
+    entries: list[dict[str, list]] = []  # path -> [sha256, chunks]
+    prefixes: list[dict[str, list[list]]] = []
+    to_hash: list[list[str]] = []
+    for (ns, tank, _), (_, files) in zip(tanks, listings):
+        previous = store.latest_manifest(ns, tank)
+        old = {}
+        if previous and previous["chunk_size"] == chunk_size:
+            old = {entry["path"]: entry for entry in previous["files"]}
+        tank_entries, tank_prefixes = {}, {}
+        for f in files:
+            entry = old.get(f.path)
+            if entry is None:
+                continue
+            unchanged = (entry["size"], entry["mtime"]) == (f.size, f.mtime)
+            if unchanged and "sha256" in entry and _stored(store, entry["chunks"]):
+                tank_entries[f.path] = [entry["sha256"], entry["chunks"]]
+                continue
+            tank_prefixes[f.path] = _unchanged_prefix(store, entry["chunks"], f.size)
+        entries.append(tank_entries)
+        prefixes.append(tank_prefixes)
+        to_hash.append([f.path for f in files if f.path not in tank_entries])
+
+    hashes = _run_per_tank(
+        errors,
+        [
+            (hash_tank_files, (tank, ns, chain, paths))
+            for (ns, tank, chain), paths in zip(tanks, to_hash)
+        ],
+        default={},
+    )
+
+    # Every tank that could provide each file the store doesn't have yet
+    known = store.file_index()
+    pending: dict[str, list[tuple[int, FileRequest]]] = {}
+    for t, tank_hashes in enumerate(hashes):
+        for path, sha in tank_hashes.items():
+            if sha in known:
+                entries[t][path] = [sha, known[sha]]
+            else:
+                request = FileRequest(path, sha, prefixes[t].get(path, []))
+                pending.setdefault(sha, []).append((t, request))
+    for options in pending.values():
+        options.sort(key=lambda option: -len(option[1].prefix))
+
+    fetched_bytes = [0] * len(tanks)
+    gone: list[set[str]] = [set() for _ in tanks]
+    while pending:
+        assignments: dict[int, list[FileRequest]] = {}
+        for options in pending.values():
+            t, request = options[0]
+            assignments.setdefault(t, []).append(request)
+        futures = {
+            t: scheduler.submit(
+                _attempt,
+                fetch_tank_files,
+                tanks[t][1],
+                tanks[t][0],
+                tanks[t][2],
+                requests,
+                store,
+                progress,
+                name=f"fetch snapshot files from {tanks[t][1]}",
+            )
+            for t, requests in assignments.items()
+        }
+        scheduler.wait(list(futures.values()))
+        for t, future in futures.items():
+            fetched, error = future.result()
+            if error is not None:
+                errors[t] = error
+                continue
+            for request in assignments[t]:
+                result = fetched[request.path]
+                if result is None:
+                    # Files deleted since they were hashed are left out
+                    gone[t].add(request.path)
+                    continue
+                sha, file_chunks, received = result
+                # A running node may have changed the file since it was hashed
+                entries[t][request.path] = [sha, file_chunks]
+                fetched_bytes[t] += received
+                if sha == request.sha256:
+                    known[sha] = file_chunks
+        # Files that still aren't stored are retried from the next tank that has them
+        pending = {
+            sha: [(t, r) for t, r in options[1:] if not errors[t]]
+            for sha, options in pending.items()
+            if sha not in known
+        }
+        pending = {sha: options for sha, options in pending.items() if options}
+
+    # Tanks that have a file another tank fetched share its chunks
+    for t, tank_hashes in enumerate(hashes):
+        for path, sha in tank_hashes.items():
+            if path in entries[t] or path in gone[t]:
+                continue
+            if sha in known:
+                entries[t][path] = [sha, known[sha]]
+            elif not errors[t]:
+                errors[t] = "some files could not be fetched from any tank"
+
+    results = []
+    created = int(time.time())
+    for t, (ns, tank, chain) in enumerate(tanks):
+        dirs, files = listings[t]
+        tank_entries = [
+            {
+                "path": f.path,
+                "size": f.size,
+                "mtime": f.mtime,
+                "sha256": entries[t][f.path][0],
+                "chunks": entries[t][f.path][1],
+            }
+            # Files deleted between listing and hashing are left out
+            for f in files
+            if f.path in entries[t]
+        ]
+        size = sum(length for e in tank_entries for _, length in e["chunks"])
+        rehashed = set(to_hash[t])
+        hashed_size = sum(f.size for f in files if f.path in rehashed)
+        manifest_path = None
+        if tank_entries and not errors[t]:
+            manifest = {
+                "namespace": ns,
+                "tank": tank,
+                "chain": chain,
+                "created": created,
+                "filters": filters,
+                "chunk_size": chunk_size,
+                "dirs": dirs,
+                "files": tank_entries,
+            }
+            manifest_path = store.save_manifest(manifest)
+        results.append(
+            TankSnapshot(
+                ns,
+                tank,
+                manifest_path,
+                len(tank_entries),
+                size,
+                hashed_size,
+                fetched_bytes[t],
+                errors[t],
+            )
+        )
+    return results
+
+
+def _fetch_batch(
+    pod: str,
+    namespace: str,
+    chain: str,
+    batch: list[FileRequest],
+    store: SnapshotStore,
+    progress: Optional[Callable[[int], None]],
+) -> list[Optional[tuple[str, list[list], int]]]:
+    """One exec of fetch_tank_files, retried from the start if the stream breaks"""
+    chunk_size = store.chunk_size
+
+    def attempt():
+        token = secrets.token_hex(16)
+        script = _reading_lines(
+            f"""while IFS=' ' read -r k p; do
+  if size=$(stat -c %s "$p" 2>/dev/null); then
+    n=$((size - k * {chunk_size}))
+    [ "$n" -lt 0 ] && n=0
+    printf '%s\\n' "$n"
+    [ "$n" -gt 0 ] && dd if="$p" bs={chunk_size} skip="$k" 2>/dev/null | head -c "$n"
+  else
+    printf -- '-\\n'
+  fi
+  printf '\\n%s\\n' {token}
+done""",
+            [f"{len(r.prefix)} {r.path}" for r in batch],
+        )
+        frames = _FileFrames(pod, store, batch, token)
+        _run_script(pod, namespace, chain, script, frames, progress)
+        if not frames.done():
+            raise TransferError(f"Snapshot file stream from {pod} ended early")
+        return frames.results
+
+    return with_retries(attempt, f"Fetching snapshot files from {pod}")
+
+
+def _run_script(
+    pod: str,
+    namespace: str,
+    chain: str,
+    script: str,
+    sink: Callable[[bytes], object],
+    progress: Optional[Callable[[int], None]] = None,
+) -> int:
+    """Run `script` from a tank's chain datadir, raising if it failed"""
+    result = exec_read(
+        get_exec_client(),
+        pod,
+        namespace,
+        f"cd /root/.bitcoin/{chain} || exit 1\n{script}",
+        sink,
+        BITCOINCORE_CONTAINER,
+        progress,
+    )
+    if result.returncode not in (0, SNAPSHOT_NO_FILES_EXIT):
+        raise K8sError(f"Snapshot of {pod} failed ({result.returncode}): {result.stderr}")
+    return result.returncode
+
+
+def _read_script(
+    pod: str, namespace: str, chain: str, script: str, description: str
+) -> tuple[int, bytes]:
+    """_run_script's exit status and whole output, retried if the stream breaks"""
+
+    def attempt():
+        output = bytearray()
+        returncode = _run_script(pod, namespace, chain, script, output.extend)
+        return returncode, bytes(output)
+
+    return with_retries(attempt, description)
+
+
+def _reading_lines(loop: str, lines: list[str]) -> str:
+    """`loop`, which reads lines from stdin, fed `lines` by a heredoc as exec_read has no stdin"""
+    token = f"WARNET_{secrets.token_hex(8)}"
+    return f"{loop} <<'{token}'\n" + "".join(f"{line}\n" for line in lines) + token
+
+
+def _batches(items: list, line: Callable[[object], str] = str) -> Iterator[list]:
+    """`items` split so each batch's lines fit in one script"""
+    batch, size = [], 0
+    for item in items:
+        n = len(line(item).encode(errors="surrogateescape")) + 1
+        if batch and size + n > SNAPSHOT_STORE_SCRIPT_LIMIT:
+            yield batch
+            batch, size = [], 0
+        batch.append(item)
+        size += n
+    if batch:
+        yield batch
+
+
+def _unchanged_prefix(store: SnapshotStore, chunks: list[list], size: int) -> list[list]:
+    """
+    The stored chunks a file that has changed probably still starts with, if it was appended to.
+    bitcoind preallocates block and undo files with zeros and writes into them, so the prefix
+    stops before the first zero chunk, and before the chunk the old data ended in.
+    """
+    zero = _zero_chunk(store.chunk_size)
+    prefix = list(
+        itertools.takewhile(
+            lambda c: c[1] == store.chunk_size and c[0] != zero and store.has_chunk(c[0]), chunks
+        )
+    )
+    return prefix[: min(len(prefix) - 1, size // store.chunk_size)] if prefix else []
+
+
+@lru_cache(maxsize=None)
+def _zero_chunk(chunk_size: int) -> str:
+    return hashlib.sha256(bytes(chunk_size)).hexdigest()
+
+
+def _stored(store: SnapshotStore, chunks: list[list]) -> bool:
+    return all(store.has_chunk(digest) for digest, _ in chunks)
+
+
+def _manifest_order(path: Path) -> tuple[str, int]:
+    """Manifests are named <stamp>.json, or <stamp>-<n>.json when taken within the same second"""
+    stamp, _, n = path.stem.partition("-")
+    return stamp, int(n or 0)
+
+
+def _attempt(fn: Callable, *args):
+    """Run fn(*args), returning (result, None) or (None, error message) instead of raising"""
+    try:
+        return fn(*args), None
+    except Exception as e:
+        return None, str(e)
+
+
+def _run_per_tank(errors: list[Optional[str]], calls: list[tuple[Callable, tuple]], default):
+    """Run one call per tank, recording failures in `errors` and skipping tanks already failed"""
+    scheduler = get_scheduler()
+    futures = [
+        None if errors[t] else scheduler.submit(_attempt, fn, *args, name=fn.__name__)
+        for t, (fn, args) in enumerate(calls)
+    ]
+    scheduler.wait([f for f in futures if f is not None])
+    results = []
+    for t, future in enumerate(futures):
+        result, error = future.result() if future is not None else (None, errors[t])
+        errors[t] = error
+        results.append(default if error else result)
+    return results
@@ -1,4 +1,5 @@
 import sys
+from contextlib import suppress
 
 import click
 from kubernetes.config.config_exception import ConfigException
@@ -8,9 +9,10 @@ from rich.table import Table
 from rich.text import Text
 from urllib3.exceptions import MaxRetryError
 
-from .constants import COMMANDER_MISSION, TANK_MISSION
+from .constants import COMMANDER_MISSION, SNAPSHOT_CACHE_MISSION, TANK_MISSION
 from .k8s import get_mission
 from .network import _connected
+from .snapshot_cache import format_cache_stats, snapshot_cache_stats
 
 
 @click.command()
@@ -21,6 +23,7 @@ def status():
     try:
         tanks = _get_tank_status()
         scenarios = _get_deployed_scenarios()
+        caches = _get_snapshot_cache_status()
     except ConfigException as e:
         print(e)
         print(
@@ -52,6 +55,9 @@ def status():
     for tank in tanks:
         table.add_row("Tank", tank["name"], tank["status"], tank["namespace"])
 
+    for cache in caches:
+        table.add_row("Snapshot cache", cache["name"], cache["status"], cache["namespace"])
+
     # Add a separator if there are both tanks and scenarios
     if tanks and scenarios:
         table.add_row("", "", "")
@@ -108,3 +114,17 @@ def _get_deployed_scenarios():
         }
         for c in commanders
     ]
+
+
+def _get_snapshot_cache_status():
+    caches = []
+    for cache in get_mission(SNAPSHOT_CACHE_MISSION):
+        status = cache.status.phase.lower()
+        if status == "running":
+            # The stats are a bonus, the cache's phase is still worth showing without them
+            with suppress(Exception):
+                status = format_cache_stats(snapshot_cache_stats(cache.metadata.namespace))
+        caches.append(
+            {"name": cache.metadata.name, "status": status, "namespace": cache.metadata.namespace}
+        )
+    return caches
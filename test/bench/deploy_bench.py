@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Deploy and teardown wall time vs. node count: one `helm upgrade --install` process per node
+compared with `warnet deploy --bulk`. Needs a real cluster (e.g. minikube) with nothing else
+deployed; each network is a ring, timed until every tank is ready, then timed until `warnet down`
+has removed every tank.
+
+    ./deploy_bench.py [node counts...]    (default: 10 50 100)
+"""
+
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import yaml
+
+from warnet.k8s import get_pod_informer
+
+DEFAULTS = {"image": {"repository": "bitcoindevproject/bitcoin", "tag": "27.0"}}
+
+
+def write_network(directory: Path, count: int):
+    names = [f"tank-{i:04d}" for i in range(count)]
+    nodes = [{"name": name, "addnode": [names[(i + 1) % count]]} for i, name in enumerate(names)]
+    (directory / "network.yaml").write_text(yaml.safe_dump({"nodes": nodes}))
+    (directory / "node-defaults.yaml").write_text(yaml.safe_dump(DEFAULTS))
+
+
+def wait_for_tanks(predicate, timeout=30 * 60):
+    informer = get_pod_informer(label_selector="mission=tank")
+    if not informer.wait_for(predicate, timeout):
+        raise Exception("Timed out waiting for tanks")
+
+
+def deploy(directory: Path, count: int, bulk: bool) -> float:
+    start = time.perf_counter()
+    cmd = ["warnet", "deploy", str(directory), "--wait"] + (["--bulk"] if bulk else [])
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+    # --wait already blocks until the tanks are ready, this just double checks
+    wait_for_tanks(lambda pods: len(pods) == count)
+    return time.perf_counter() - start
+
+
+def teardown() -> float:
+    start = time.perf_counter()
+    subprocess.run(["warnet", "down", "--force"], check=True, stdout=subprocess.DEVNULL)
+    # `down` already waits for the tanks to be deleted, this just double checks
+    wait_for_tanks(lambda pods: not pods)
+    return time.perf_counter() - start
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [10, 50, 100]
+    print(f"{'nodes':>6} {'helm per node':>14} {'bulk':>8} {'down (helm)':>12} {'down (bulk)':>12}")
+    for count in counts:
+        with tempfile.TemporaryDirectory(prefix="warnet-deploy-bench-") as tmp:
+            directory = Path(tmp)
+            write_network(directory, count)
+            deploys, teardowns = [], []
+            for bulk in (False, True):
+                deploys.append(deploy(directory, count, bulk))
+                teardowns.append(teardown())
+        print(
+            f"{count:>6} {deploys[0]:>13.1f}s {deploys[1]:>7.1f}s "
+            f"{teardowns[0]:>11.1f}s {teardowns[1]:>11.1f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Exec transfer throughput: the old text-mode download and single-write upload compared with
+warnet.exec_transfer's binary, chunked and checksummed transfers. Runs against the fake API
+server, whose "pods" are this machine, unless a real pod is given.
+
+    ./exec_transfer_bench.py [megabytes] [--pod NAME [--namespace NS] [--container NAME]]
+    (default: 1024 megabytes)
+"""
+
+import argparse
+import hashlib
+import os
+import tempfile
+import time
+from contextlib import nullcontext
+from pathlib import Path
+
+from fake_apiserver import FakeApiServer, make_pod
+from kubernetes.stream import stream
+
+from warnet import k8s
+from warnet.exec_transfer import exec_read, exec_write
+
+REMOTE_PATH = "/tmp/warnet-exec-bench"
+# The old upload holds several copies of the payload in memory at once, and a 1 GiB one was
+# enough to get the benchmark OOM-killed on a 5 GB machine
+LEGACY_UPLOAD_LIMIT = 256 << 20
+
+
+def legacy_download(api, pod, namespace, container, out) -> int:
+    """k8s.download before exec_transfer: stdout decoded as text, then encoded again"""
+    resp = stream(
+        api.connect_get_namespaced_pod_exec,
+        pod,
+        namespace,
+        command=["cat", REMOTE_PATH],
+        stderr=True,
+        stdin=False,
+        stdout=True,
+        tty=False,
+        _preload_content=False,
+        **({"container": container} if container else {}),
+    )
+    size = 0
+    while resp.is_open():
+        resp.update(timeout=1)
+        if resp.peek_stdout():
+            data = resp.read_stdout().encode("utf-8")
+            out.update(data)
+            size += len(data)
+    resp.close()
+    return size
+
+
+def legacy_upload(api, pod, namespace, container, data: bytes):
+    """write_file_to_container before exec_transfer: one write_stdin, then close"""
+    resp = stream(
+        api.connect_get_namespaced_pod_exec,
+        pod,
+        namespace,
+        command=["sh", "-c", f"cat > {REMOTE_PATH}.up"],
+        stdin=True,
+        stderr=True,
+        stdout=True,
+        tty=False,
+        _preload_content=False,
+        **({"container": container} if container else {}),
+    )
+    resp.write_stdin(data)
+    resp.close()
+
+
+def report(name: str, size: int, seconds: float, note: str = ""):
+    mib = size / (1 << 20)
+    print(f"{name:<28} {mib:>8.0f} MiB {seconds:>7.2f}s {mib / seconds:>8.1f} MiB/s  {note}")
+
+
+def run(megabytes: int, pod: str, namespace: str, container):
+    api = k8s.get_exec_client()
+    size = megabytes << 20
+    print(f"Creating {megabytes} MiB of random data in {pod}")
+    exec_read(api, pod, namespace, f"head -c {size} /dev/urandom > {REMOTE_PATH}", print)
+    with tempfile.NamedTemporaryFile(prefix="warnet-exec-bench-") as local:
+        local.write(os.urandom(size))
+        local.flush()
+        local_path = Path(local.name)
+
+        sent = hashlib.sha256()
+        start = time.perf_counter()
+        result = exec_read(api, pod, namespace, f"cat {REMOTE_PATH}", sent.update, container)
+        report("download (exec_transfer)", result.size, time.perf_counter() - start, "verified")
+
+        received = hashlib.sha256()
+        start = time.perf_counter()
+        received_size = legacy_download(api, pod, namespace, container, received)
+        intact = received.hexdigest() == sent.hexdigest()
+        note = "intact" if intact else f"corrupt, {received_size - size:+d} bytes"
+        report("download (text, before)", size, time.perf_counter() - start, note)
+
+        start = time.perf_counter()
+        exec_write(api, pod, namespace, f"{REMOTE_PATH}.up", local_path, container)
+        report("upload (exec_transfer)", size, time.perf_counter() - start, "verified")
+
+        if size > LEGACY_UPLOAD_LIMIT:
+            print(f"{'upload (one write, before)':<28} skipped, it needs the payload in memory")
+        else:
+            data = local_path.read_bytes()
+            start = time.perf_counter()
+            legacy_upload(api, pod, namespace, container, data)
+            report("upload (one write, before)", size, time.perf_counter() - start, "unverified")
+
+    exec_read(api, pod, namespace, f"rm -f {REMOTE_PATH} {REMOTE_PATH}.up", print)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("megabytes", nargs="?", type=int, default=1024)
+    parser.add_argument("--pod", help="Benchmark against this pod instead of the fake server")
+    parser.add_argument("--namespace", default="default")
+    parser.add_argument("--container")
+    args = parser.parse_args()
+
+    pods = [make_pod("bench", "default", {"mission": "tank"})]
+    with FakeApiServer(pods, ["default"]) if not args.pod else nullcontext() as fake:
+        if fake:
+            k8s._session = k8s.KubeSession(fake.kubeconfig())
+        run(args.megabytes, args.pod or "bench", args.namespace, args.container)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""
+A tiny in-process stand-in for the Kubernetes API server used by the benchmarks in this
+directory. It serves just enough of the core/v1 API for warnet.k8s and counts requests and
+response bytes so different access patterns can be compared without a real cluster.
+
+Pod exec runs the command on this machine, speaking the v4.channel.k8s.io websocket protocol,
+so exec transfers can be measured end to end.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import re
+import socket
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import suppress
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import yaml
+
+
+def make_pod(name: str, namespace: str, labels: dict) -> dict:
+    return {
+        "apiVersion": "v1",
+        "kind": "Pod",
+        "metadata": {
+            "name": name,
+            "namespace": namespace,
+            "labels": labels,
+            "annotations": {"init_peers": "2"},
+            "uid": f"{namespace}-{name}",
+            "resourceVersion": "1",
+        },
+        "spec": {
+            "containers": [
+                {
+                    "name": "bitcoincore",
+                    "image": "bitcoindevproject/bitcoin:27.0",
+                    "ports": [
+                        {"name": "rpc", "containerPort": 18443, "protocol": "TCP"},
+                        {"name": "p2p", "containerPort": 18444, "protocol": "TCP"},
+                    ],
+                }
+            ]
+        },
+        "status": {
+            "phase": "Running",
+            "podIP": "10.0.0.1",
+            "conditions": [{"type": "Ready", "status": "True"}],
+        },
+    }
+
+
+def selector_matches(selector: str, labels: dict) -> bool:
+    for term in filter(None, (t.strip() for t in re.split(r",(?![^()]*\))", selector))):
+        match = re.fullmatch(r"(\S+)\s+in\s+\((.*)\)", term)
+        if match:
+            if labels.get(match.group(1)) not in [v.strip() for v in match.group(2).split(",")]:
+                return False
+        elif "=" in term:
+            key, value = term.split("=", 1)
+            if labels.get(key.rstrip("=")) != value:
+                return False
+        elif term not in labels:
+            return False
+    return True
+
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def exec_command(handler: BaseHTTPRequestHandler, query: dict):
+    """Run an exec request's command locally, bridging its stdio over websocket channels"""
+    key = handler.headers["Sec-WebSocket-Key"]
+    accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+    handler.send_response(101)
+    handler.send_header("Upgrade", "websocket")
+    handler.send_header("Connection", "Upgrade")
+    handler.send_header("Sec-WebSocket-Accept", accept)
+    handler.send_header("Sec-WebSocket-Protocol", "v4.channel.k8s.io")
+    handler.end_headers()
+    handler.wfile.flush()
+    handler.close_connection = True
+    sock = handler.connection
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    send_lock = threading.Lock()
+
+    def send(channel: int, data: bytes, opcode: int = 2):
+        payload = bytes([channel]) + data if opcode == 2 else data
+        n = len(payload)
+        if n < 126:
+            header = struct.pack("!BB", 0x80 | opcode, n)
+        elif n < 1 << 16:
+            header = struct.pack("!BBH", 0x80 | opcode, 126, n)
+        else:
+            header = struct.pack("!BBQ", 0x80 | opcode, 127, n)
+        with send_lock:
+            sock.sendall(header + payload)
+
+    proc = subprocess.Popen(
+        query["command"],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+
+    def forward(pipe, channel):
+        while chunk := pipe.read1(1 << 20):
+            send(channel, chunk)
+
+    def receive():
+        rfile = handler.rfile
+        try:
+            while True:
+                first, second = rfile.read(2)
+                n = second & 0x7F
+                if n == 126:
+                    (n,) = struct.unpack("!H", rfile.read(2))
+                elif n == 127:
+                    (n,) = struct.unpack("!Q", rfile.read(8))
+                mask = rfile.read(4)
+                data = bytearray(rfile.read(n))
+                # Unmask a word at a time, as a byte loop would dominate the benchmark
+                words = n // 8 * 8
+                if words:
+                    masked = int.from_bytes(data[:words], "big") ^ int.from_bytes(
+                        mask * (words // 4), "big"
+                    )
+                    data[:words] = masked.to_bytes(words, "big")
+                for i in range(words, n):
+                    data[i] ^= mask[i % 4]
+                if first & 0x0F == 8:
+                    break
+                if data and data[0] == 0:
+                    proc.stdin.write(data[1:])
+                    proc.stdin.flush()
+        except (ValueError, OSError):
+            pass
+        finally:
+            # Like an API server, a closed connection closes the command's stdin
+            with suppress(OSError):
+                proc.stdin.close()
+
+    threading.Thread(target=receive, daemon=True).start()
+    readers = [
+        threading.Thread(target=forward, args=(proc.stdout, 1)),
+        threading.Thread(target=forward, args=(proc.stderr, 2)),
+    ]
+    for reader in readers:
+        reader.start()
+    for reader in readers:
+        reader.join()
+    returncode = proc.wait()
+    if returncode == 0:
+        status = {"metadata": {}, "status": "Success"}
+    else:
+        cause = {"reason": "ExitCode", "message": str(returncode)}
+        status = {"status": "Failure", "reason": "NonZeroExitCode", "details": {"causes": [cause]}}
+    try:
+        send(3, json.dumps(status).encode())
+        send(0, b"", opcode=8)
+    except OSError:
+        pass
+
+
+class FakeApiServer:
+    def __init__(self, pods: list[dict], namespaces: list[str], cluster_wide: bool = True):
+        self.pods = pods
+        self.namespaces = namespaces
+        self.cluster_wide = cluster_wide
+        self.requests = 0
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+        # Watch events as (resourceVersion, type, pod), appended by update_pod()
+        self.events: list[tuple[int, str, dict]] = []
+        self.resource_version = 1
+        self.changed = threading.Condition(self.lock)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Send headers and body in one write, or Nagle + delayed ACK add ~40ms per request
+            wbufsize = 1 << 16
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                if url.path.endswith("/exec") and self.headers.get("Upgrade") == "websocket":
+                    exec_command(self, query)
+                    return
+                selector = query.get("labelSelector", [""])[0]
+                if query.get("watch", [""])[0].lower() == "true":
+                    self.watch(url.path, selector, query)
+                    return
+                with fake.lock:
+                    status, body = fake.route(url.path, selector)
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+                with fake.lock:
+                    fake.requests += 1
+                    fake.bytes_sent += len(payload)
+
+            def watch(self, path: str, selector: str, query: dict):
+                namespace = fake.namespace_of(path)
+                since = int(query.get("resourceVersion", ["0"])[0] or 0)
+                deadline = time.monotonic() + int(query.get("timeoutSeconds", ["60"])[0])
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                with fake.lock:
+                    fake.requests += 1
+                try:
+                    while True:
+                        with fake.lock:
+                            pending = [e for e in fake.events if e[0] > since]
+                            if not pending:
+                                remaining = deadline - time.monotonic()
+                                if remaining <= 0:
+                                    break
+                                fake.changed.wait(min(remaining, 0.5))
+                                continue
+                        since = pending[-1][0]
+                        lines = b"".join(
+                            json.dumps({"type": kind, "object": pod}).encode() + b"\n"
+                            for _, kind, pod in pending
+                            if (namespace is None or pod["metadata"]["namespace"] == namespace)
+                            and (
+                                not selector
+                                or selector_matches(selector, pod["metadata"]["labels"])
+                            )
+                        )
+                        if lines:
+                            self.wfile.write(b"%x\r\n%s\r\n" % (len(lines), lines))
+                            self.wfile.flush()
+                            with fake.lock:
+                                fake.bytes_sent += len(lines)
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+        return Handler
+
+    def namespace_of(self, path: str):
+        match = re.match(r"/api/v1/namespaces/([^/]+)/pods", path)
+        return match.group(1) if match else None
+
+    def update_pod(self, name: str, namespace: str, status: dict):
+        """Replace a pod's status and publish a MODIFIED watch event"""
+        with self.lock:
+            for pod in self.pods:
+                if (pod["metadata"]["name"], pod["metadata"]["namespace"]) == (name, namespace):
+                    self.resource_version += 1
+                    pod["metadata"]["resourceVersion"] = str(self.resource_version)
+                    pod["status"] = status
+                    self.events.append(
+                        (self.resource_version, "MODIFIED", json.loads(json.dumps(pod)))
+                    )
+                    self.changed.notify_all()
+
+    def route(self, path: str, selector: str) -> tuple[int, dict]:
+        if path == "/api/v1/namespaces":
+            items = [{"metadata": {"name": ns}} for ns in self.namespaces]
+            return 200, {"kind": "NamespaceList", "apiVersion": "v1", "items": items}
+        if path == "/api/v1/pods":
+            if not self.cluster_wide:
+                return 403, {"kind": "Status", "status": "Failure", "code": 403}
+            pods = self.pods
+        else:
+            single = re.fullmatch(r"/api/v1/namespaces/([^/]+)/pods/([^/]+)(/status)?", path)
+            if single:
+                for pod in self.pods:
+                    if (pod["metadata"]["namespace"], pod["metadata"]["name"]) == single.group(
+                        1, 2
+                    ):
+                        return 200, pod
+                return 404, {"kind": "Status", "status": "Failure", "code": 404}
+            match = re.fullmatch(r"/api/v1/namespaces/([^/]+)/pods", path)
+            if not match:
+                return 404, {"kind": "Status", "status": "Failure", "code": 404}
+            pods = [p for p in self.pods if p["metadata"]["namespace"] == match.group(1)]
+        if selector:
+            pods = [p for p in pods if selector_matches(selector, p["metadata"]["labels"])]
+        metadata = {"resourceVersion": str(self.resource_version)}
+        return 200, {"kind": "PodList", "apiVersion": "v1", "metadata": metadata, "items": pods}
+
+    def reset_counters(self):
+        with self.lock:
+            self.requests = 0
+            self.bytes_sent = 0
+
+    def kubeconfig(self) -> str:
+        host, port = self.server.server_address
+        path = os.path.join(tempfile.mkdtemp(prefix="warnet-bench-"), "config")
+        with open(path, "w") as f:
+            yaml.safe_dump(
+                {
+                    "apiVersion": "v1",
+                    "kind": "Config",
+                    "current-context": "bench",
+                    "clusters": [{"name": "bench", "cluster": {"server": f"http://{host}:{port}"}}],
+                    "users": [{"name": "bench", "user": {"token": "bench"}}],
+                    "contexts": [
+                        {"name": "bench", "context": {"cluster": "bench", "user": "bench"}}
+                    ],
+                },
+                f,
+            )
+        return path
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Compare the old get_mission() access pattern (full pod list per namespace, filtered in
+Python) with server-side label selectors, against a fake API server holding 2,000 pods.
+"""
+
+import time
+
+from fake_apiserver import FakeApiServer, make_pod
+
+from warnet import k8s
+
+NAMESPACES = ["default"] + [f"wargames-{i:02d}" for i in range(39)]
+PODS_PER_NAMESPACE = 50
+ROUNDS = 5
+
+
+def build_pods() -> list[dict]:
+    pods = []
+    for ns in NAMESPACES:
+        for i in range(PODS_PER_NAMESPACE):
+            # Mostly non-warnet workloads, as on a shared cluster
+            mission = "tank" if i % 5 == 0 else "other"
+            pods.append(make_pod(f"pod-{i:04d}", ns, {"app": "bench", "mission": mission}))
+    return pods
+
+
+def old_get_mission(mission: str):
+    sclient = k8s.get_static_client()
+    crew = []
+    for ns in k8s.get_namespaces():
+        for pod in sclient.list_namespaced_pod(ns.metadata.name).items:
+            if pod.metadata.labels.get("mission") == mission:
+                crew.append(pod)
+    return crew
+
+
+def measure(name: str, server: FakeApiServer, fn) -> None:
+    server.reset_counters()
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        crew = fn("tank")
+    elapsed = (time.perf_counter() - start) / ROUNDS
+    print(
+        f"{name:<28} tanks={len(crew):<5} requests={server.requests // ROUNDS:<4} "
+        f"bytes={server.bytes_sent // ROUNDS:<10} latency={elapsed * 1000:.1f}ms"
+    )
+
+
+def main():
+    pods = build_pods()
+    print(f"{len(pods)} pods in {len(NAMESPACES)} namespaces, mean of {ROUNDS} rounds")
+    for cluster_wide in (True, False):
+        with FakeApiServer(pods, NAMESPACES, cluster_wide=cluster_wide) as server:
+            k8s._session = k8s.KubeSession(server.kubeconfig())
+            label = "cluster-wide RBAC" if cluster_wide else "namespaced RBAC"
+            measure(f"per-namespace scan ({label})", server, old_get_mission)
+            measure(f"label selector ({label})", server, k8s.get_mission)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+warnet import-network on a describegraph dump about the size of mainnet's: the importer it used
+to have, which loaded the whole dump and wrote network.yaml with one yaml.dump, compared with
+the streaming importer in graph_import.py. Each runs in its own process, to measure its peak
+memory. The dump is made up, with policies drawn from a few common ones, unless one is given.
+
+    ./import_network_bench.py [--nodes 15000] [--channels 60000] [--graph describegraph.json]
+"""
+
+import argparse
+import json
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "src"))
+
+import yaml  # noqa: E402
+
+from resources.scenarios.ln_framework.ln import Policy  # noqa: E402
+from warnet.graph_import import import_network  # noqa: E402
+
+
+def legacy_import(graph_file_path: Path, output_path: Path):
+    """graph._import_network before the streaming importer"""
+    with open(graph_file_path) as graph_file:
+        graph = json.loads(graph_file.read())
+
+    tanks = {}
+    pk_to_tank = {}
+    for index, node in enumerate(graph["nodes"]):
+        tank = f"tank-{index:04d}"
+        pk_to_tank[node["pub_key"]] = tank
+        tanks[tank] = {"name": tank, "ln": {"lnd": True}, "lnd": {"channels": []}}
+
+    block, index = 300, 1
+    for edge in sorted(graph["edges"], key=lambda x: int(x["channel_id"])):
+        tanks[pk_to_tank[edge["node1_pub"]]]["lnd"]["channels"].append(
+            {
+                "id": {"block": block, "index": index},
+                "target": pk_to_tank[edge["node2_pub"]] + "-ln",
+                "capacity": int(edge["capacity"]),
+                "push_amt": int(edge["capacity"]) // 2,
+                "source_policy": Policy.from_lnd_describegraph(edge["node1_policy"]).to_dict(),
+                "target_policy": Policy.from_lnd_describegraph(edge["node2_policy"]).to_dict(),
+            }
+        )
+        index += 1
+        if index > 1000:
+            index = 1
+            block += 1
+
+    network = {"nodes": []}
+    prev_node_name = list(tanks.keys())[-1]
+    for name, obj in tanks.items():
+        obj["addnode"] = [prev_node_name]
+        prev_node_name = name
+        network["nodes"].append(obj)
+    output_path.mkdir(parents=True, exist_ok=True)
+    with open(output_path / "network.yaml", "w") as f:
+        f.write(yaml.dump(network, sort_keys=False))
+
+
+def make_graph(path: Path, nodes: int, channels: int):
+    """A describegraph dump with LND's fields and preferential attachment between nodes"""
+    rng = random.Random(0)
+    pubkeys = [f"02{rng.getrandbits(256):064x}" for _ in range(nodes)]
+    policies = [
+        {
+            "time_lock_delta": rng.choice([18, 40, 80, 144]),
+            "min_htlc": str(rng.choice([1, 1000])),
+            "fee_base_msat": str(rng.choice([0, 1, 1000])),
+            "fee_rate_milli_msat": str(rng.choice([1, 10, 100, 500, 2500])),
+            "disabled": False,
+            "max_htlc_msat": str(rng.choice([990000000, 4950000000, 9900000000])),
+            "last_update": 1710000000,
+            "custom_records": {},
+        }
+        for _ in range(200)
+    ]
+    # Ends picked from earlier channels' ends, so a few nodes have most channels as on mainnet
+    ends = list(range(nodes))
+    with open(path, "w") as f:
+        f.write('{"nodes": [')
+        for i, pk in enumerate(pubkeys):
+            node = {
+                "last_update": 1710000000,
+                "pub_key": pk,
+                "alias": f"node-{i}",
+                "addresses": [{"network": "tcp", "addr": f"10.0.{i // 256}.{i % 256}:9735"}],
+                "color": "#3399ff",
+                "features": {},
+                "custom_records": {},
+            }
+            f.write(("," if i else "") + json.dumps(node, indent=4))
+        f.write('], "edges": [')
+        for i in range(channels):
+            a, b = rng.choice(ends), rng.choice(ends)
+            ends += [a, b]
+            edge = {
+                "channel_id": str(((700000 + i // 1000) << 40) | ((i % 1000) << 16)),
+                "chan_point": f"{rng.getrandbits(256):064x}:0",
+                "last_update": 1710000000,
+                "node1_pub": pubkeys[a],
+                "node2_pub": pubkeys[b],
+                "capacity": str(rng.choice([100000, 500000, 1000000, 5000000, 16777215])),
+                "node1_policy": rng.choice(policies),
+                "node2_policy": rng.choice(policies),
+                "custom_records": {},
+            }
+            f.write(("," if i else "") + json.dumps(edge, indent=4))
+        f.write("]}")
+
+
+def run(mode: str, graph: str, output: str):
+    start = time.perf_counter()
+    if mode == "legacy":
+        legacy_import(Path(graph), Path(output))
+    else:
+        import_network(Path(graph), Path(output))
+    seconds = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({"seconds": seconds, "peak_mib": peak}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--nodes", type=int, default=15000)
+    parser.add_argument("--channels", type=int, default=60000)
+    parser.add_argument("--graph", help="A describegraph dump to import instead of a made up one")
+    parser.add_argument("--run", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        run(*args.run)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="warnet-import-bench-") as tmp:
+        graph = args.graph
+        if not graph:
+            graph = str(Path(tmp) / "describegraph.json")
+            make_graph(Path(graph), args.nodes, args.channels)
+        print(f"{graph}: {Path(graph).stat().st_size / (1 << 20):.0f} MiB")
+        print(f"YAML emitter: {'libyaml' if hasattr(yaml, 'CSafeDumper') else 'pure Python'}")
+        outputs = {}
+        for mode in ("legacy", "streaming"):
+            output = Path(tmp) / mode
+            res = subprocess.run(
+                [sys.executable, __file__, "--run", mode, graph, str(output)],
+                check=True,
+                capture_output=True,
+                text=True,
+            )
+            result = json.loads(res.stdout.splitlines()[-1])
+            outputs[mode] = (output / "network.yaml").read_bytes()
+            print(f"{mode:<10} {result['seconds']:>7.1f}s  {result['peak_mib']:>7.0f} MiB peak")
+        same = outputs["legacy"] == outputs["streaming"]
+        print(f"network.yaml {'identical' if same else 'DIFFERS'}")
+
+
+if __name__ == "__main__":
+    main()
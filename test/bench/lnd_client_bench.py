@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+LND REST calls: the client ln_init used to have, which opened a new HTTPS connection for every
+request and read POST responses a byte at a time, compared with the keep-alive client in
+ln_framework/ln.py. Runs against a local stand-in for LND's REST server, with a self-signed
+certificate made by openssl, unless an LND is given.
+
+    ./lnd_client_bench.py [seconds] [--channels 1000] [--threads 1,8] [--host HOST [--port 8080]]
+"""
+
+import argparse
+import contextlib
+import http.client
+import json
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "resources" / "scenarios"))
+
+from ln_framework.ln import ADMIN_MACAROON_HEX, INSECURE_CONTEXT, LND  # noqa: E402
+
+PUBKEY = "02" + "ab" * 32
+
+
+class StubLND(ThreadingHTTPServer):
+    """
+    Answers the REST calls ln_init makes. /v1/graph describes `channels` channels and is sent
+    chunked, like LND sends it, and a channel open stream stays open after its first message.
+    """
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, channels: int, certdir: Path):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        cert, key = certdir / "tls.cert", certdir / "tls.key"
+        subprocess.run(
+            ["openssl", "req", "-x509", "-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:P-256"]
+            + ["-nodes", "-days", "1", "-subj", "/CN=localhost"]
+            + ["-keyout", str(key), "-out", str(cert)],
+            check=True,
+            capture_output=True,
+        )
+        self.context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self.context.load_cert_chain(cert, key)
+        self.graph = json.dumps(make_graph(channels)).encode()
+        self.connections = 0
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    def finish_request(self, request, client_address):
+        # Handshakes happen on each connection's own thread, not the one accepting them
+        self.connections += 1
+        try:
+            request = self.context.wrap_socket(request, server_side=True)
+        except (ssl.SSLError, OSError):
+            return
+        super().finish_request(request, client_address)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        if self.path == "/v1/graph":
+            self.send_chunked(self.server.graph)
+        elif self.path == "/v1/getinfo":
+            self.send_json({"identity_pubkey": PUBKEY, "uris": [f"{PUBKEY}@127.0.0.1:9735"]})
+        else:
+            self.send_json({"code": 12, "message": "Not Implemented"}, 501)
+
+    def do_POST(self):
+        json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.path != "/v1/channels/stream":
+            self.send_json({})
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers_like_lnd()
+        pending = {"result": {"chan_pending": {"txid": "q" * 43 + "=", "output_index": 0}}}
+        self.write_chunk(json.dumps(pending).encode() + b"\n")
+        # Nothing more until the channel confirms. Wait for the client to hang up.
+        self.connection.settimeout(30)
+        with contextlib.suppress(OSError):
+            self.rfile.read(1)
+        self.close_connection = True
+
+    def send_json(self, obj, status=200):
+        body = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers_like_lnd()
+        self.wfile.write(body)
+
+    def send_chunked(self, body: bytes):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers_like_lnd()
+        for i in range(0, len(body), 32 << 10):
+            self.write_chunk(body[i : i + (32 << 10)])
+        self.wfile.write(b"0\r\n\r\n")
+
+    def end_headers_like_lnd(self):
+        # Go's net/http answers a request to close the connection in kind, and clients rely on
+        # it to tell that the connection won't be reused
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+
+    def write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_graph(channels: int) -> dict:
+    """A DescribeGraph response about as large as LND's for this many channels"""
+
+    def policy(i):
+        return {
+            "time_lock_delta": 40,
+            "min_htlc": "1000",
+            "fee_base_msat": "1000",
+            "fee_rate_milli_msat": str(i % 5000),
+            "disabled": False,
+            "max_htlc_msat": "990000000",
+            "last_update": 1700000000 + i,
+            "custom_records": {},
+            "inbound_fee_base_msat": 0,
+            "inbound_fee_rate_milli_msat": 0,
+        }
+
+    nodes = [
+        {
+            "last_update": 1700000000,
+            "pub_key": f"02{i:064x}",
+            "alias": f"tank-{i:04d}-ln",
+            "addresses": [{"network": "tcp", "addr": f"10.0.{i // 256}.{i % 256}:9735"}],
+            "color": "#3399ff",
+            "features": {},
+            "custom_records": {},
+        }
+        for i in range(max(2, channels // 2))
+    ]
+    edges = [
+        {
+            "channel_id": str((300 + i) << 40),
+            "chan_point": f"{i:064x}:0",
+            "last_update": 1700000000 + i,
+            "node1_pub": nodes[i % len(nodes)]["pub_key"],
+            "node2_pub": nodes[(i + 1) % len(nodes)]["pub_key"],
+            "capacity": "1000000",
+            "node1_policy": policy(i),
+            "node2_policy": policy(i + 1),
+            "custom_records": {},
+        }
+        for i in range(channels)
+    ]
+    return {"nodes": nodes, "edges": edges}
+
+
+class LegacyLND:
+    """ln_framework.ln.LND before the keep-alive client"""
+
+    def __init__(self, pod_name, port=8080):
+        self.name = pod_name
+        self.conn = http.client.HTTPSConnection(
+            host=pod_name, port=port, timeout=5, context=INSECURE_CONTEXT
+        )
+
+    def get(self, uri):
+        while True:
+            try:
+                self.conn.request(
+                    method="GET",
+                    url=uri,
+                    headers={"Grpc-Metadata-macaroon": ADMIN_MACAROON_HEX, "Connection": "close"},
+                )
+                return self.conn.getresponse().read().decode("utf8")
+            except Exception:
+                time.sleep(1)
+
+    def post(self, uri, data):
+        body = json.dumps(data)
+        while True:
+            try:
+                self.conn.request(
+                    method="POST",
+                    url=uri,
+                    body=body,
+                    headers={
+                        "Content-Type": "application/json",
+                        "Content-Length": str(len(body)),
+                        "Grpc-Metadata-macaroon": ADMIN_MACAROON_HEX,
+                        "Connection": "close",
+                    },
+                )
+                res = self.conn.getresponse()
+                stream = ""
+                while True:
+                    try:
+                        data = res.read(1)
+                        if len(data) == 0:
+                            break
+                        else:
+                            stream += data.decode("utf8")
+                    except Exception:
+                        break
+                return stream
+            except Exception:
+                time.sleep(1)
+
+    def uri(self):
+        return json.loads(self.get("/v1/getinfo"))["uris"][0]
+
+    def channel(self, pk, capacity, push_amt, fee_rate):
+        data = {"local_funding_amount": capacity, "push_sat": push_amt, "node_pubkey": pk}
+        return json.loads(self.post("/v1/channels/stream", {**data, "sat_per_vbyte": fee_rate}))
+
+    def graph(self):
+        return json.loads(self.get("/v1/graph"))
+
+
+def measure(client, call, threads: int, seconds: float) -> int:
+    deadline = time.perf_counter() + seconds
+    counts = [0] * threads
+
+    def run(i: int):
+        while time.perf_counter() < deadline:
+            call(client)
+            counts[i] += 1
+
+    workers = [threading.Thread(target=run, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return sum(counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("seconds", nargs="?", type=float, default=5)
+    parser.add_argument("--channels", type=int, default=1000, help="Channels in the stub's graph")
+    parser.add_argument("--threads", default="1,8", help="Comma separated thread counts")
+    parser.add_argument("--host", help="An LND to benchmark instead of a local server")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="warnet-lnd-bench-") as certdir:
+        server = None if args.host else StubLND(args.channels, Path(certdir))
+        host, port = (args.host, args.port) if args.host else server.server_address
+        clients = [("new connection per call", LegacyLND), ("keep-alive", LND)]
+        if server:
+            print(f"/v1/graph is {len(server.graph) / (1 << 20):.1f} MiB, sent chunked")
+
+        for threads in [int(n) for n in args.threads.split(",")]:
+            for endpoint, call in [("getinfo", lambda c: c.uri()), ("graph", lambda c: c.graph())]:
+                for name, cls in clients:
+                    opened = server.connections if server else 0
+                    calls = measure(cls(host, port), call, threads, args.seconds)
+                    note = f"{server.connections - opened:>7} connections" if server else ""
+                    print(
+                        f"{threads:>3} threads  {endpoint:<8} {name:<24} "
+                        f"{calls / args.seconds:>8.1f} calls/s  {note}"
+                    )
+
+        if server:
+            # Only the stub can be asked to open channels that don't exist
+            for name, cls in clients:
+                client = cls(host, port)
+                start = time.perf_counter()
+                res = client.channel(PUBKEY, 1000000, 0, 1)
+                seconds = time.perf_counter() - start
+                pending = "chan_pending" in res.get("result", {})
+                print(
+                    f"channel open  {name:<24} {seconds:>6.2f}s to chan_pending "
+                    f"({'parsed' if pending else res})"
+                )
+
+
+if __name__ == "__main__":
+    main()
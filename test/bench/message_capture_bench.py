@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Benchmark parsing of bitcoind message_capture files: full decoding of every message versus
+filtering by msgtype before decoding and header-only scans, on a synthetic capture.
+
+    ./message_capture_bench.py [megabytes]
+"""
+
+import io
+import random
+import struct
+import sys
+import time
+
+from test_framework.messages import (
+    CInv,
+    COutPoint,
+    CTransaction,
+    CTxIn,
+    CTxOut,
+    msg_inv,
+    msg_ping,
+    msg_tx,
+)
+
+from warnet.bitcoin import CAPTURE_HEADER, iter_raw_messages, parse_raw_messages
+
+
+def record(t: int, msg) -> bytes:
+    payload = msg.serialize()
+    return CAPTURE_HEADER.pack(t, msg.msgtype, len(payload)) + payload
+
+
+def build_capture(megabytes: int) -> bytes:
+    rng = random.Random(0)
+    tx = CTransaction()
+    tx.vin = [CTxIn(COutPoint(rng.getrandbits(256), i), b"\x51" * 100) for i in range(2)]
+    tx.vout = [CTxOut(1000, b"\x51" * 34) for _ in range(2)]
+    samples = [
+        record(0, msg_inv([CInv(1, rng.getrandbits(256)) for _ in range(35)])),
+        record(0, msg_tx(tx)),
+        record(0, msg_ping(rng.getrandbits(64))),
+        # Unknown message types are carried through as hex
+        CAPTURE_HEADER.pack(0, b"unknownmsg", 4) + b"\x00" * 4,
+    ]
+    out = io.BytesIO()
+    t = 1_700_000_000_000_000
+    while out.tell() < megabytes * 1_000_000:
+        sample = rng.choice(samples)
+        t += rng.randint(1, 1000)
+        out.write(struct.pack("<Q", t) + sample[8:])
+    return out.getvalue()
+
+
+def measure(name: str, fn) -> float:
+    start = time.perf_counter()
+    count = fn()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<34} {count:>9} messages {elapsed:8.2f}s")
+    return elapsed
+
+
+def main():
+    megabytes = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    blob = build_capture(megabytes)
+    print(f"{len(blob) / 1e6:.1f} MB capture")
+    full = measure("full decode (parse_raw_messages)", lambda: len(parse_raw_messages(blob, True)))
+    filtered = measure(
+        "msgtype=ping, decoded",
+        lambda: sum(1 for _ in iter_raw_messages(blob, True, msgtypes=["ping"])),
+    )
+    headers = measure(
+        "headers only",
+        lambda: sum(1 for _ in iter_raw_messages(blob, True, headers_only=True)),
+    )
+    streamed = measure(
+        "headers only, from a stream",
+        lambda: sum(1 for _ in iter_raw_messages(io.BytesIO(blob), True, headers_only=True)),
+    )
+    print(
+        f"speedup vs full decode: filtered {full / filtered:.0f}x, "
+        f"headers {full / headers:.0f}x, streamed headers {full / streamed:.0f}x"
+    )
+
+
+if __name__ == "__main__":
+    main()
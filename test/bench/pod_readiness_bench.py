@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Compare polling each pod's status once a second (the old wait_for_pod pattern) with waiting
+on the shared PodInformer, while 1,000 pending pods become ready over a few seconds.
+Bytes include the initial list; the informer then only receives one event per change.
+"""
+
+import threading
+import time
+
+from fake_apiserver import FakeApiServer, make_pod
+
+from warnet import k8s
+
+NAMESPACE = "default"
+PODS = 1000
+READY_OVER_SECONDS = 3.0
+
+PENDING = {"phase": "Pending", "conditions": [{"type": "Ready", "status": "False"}]}
+READY = {"phase": "Running", "conditions": [{"type": "Ready", "status": "True"}]}
+
+
+def build_pods() -> list[dict]:
+    pods = []
+    for i in range(PODS):
+        pod = make_pod(f"tank-{i:04d}", NAMESPACE, {"mission": "tank"})
+        pod["status"] = dict(PENDING)
+        pods.append(pod)
+    return pods
+
+
+def make_ready(server: FakeApiServer, names: list[str], done: list[float]):
+    for name in names:
+        time.sleep(READY_OVER_SECONDS / len(names))
+        server.update_pod(name, NAMESPACE, dict(READY))
+    done.append(time.perf_counter())
+
+
+def poll_each_pod(names: list[str]):
+    sclient = k8s.get_static_client()
+    waiting = set(names)
+    while waiting:
+        for name in sorted(waiting):
+            pod = sclient.read_namespaced_pod_status(name=name, namespace=NAMESPACE)
+            if k8s.pod_is_ready(pod):
+                waiting.discard(name)
+        if waiting:
+            time.sleep(1)
+
+
+def informer(names: list[str]):
+    assert k8s.wait_for_pods_ready(names, NAMESPACE, timeout=60)
+
+
+def measure(name: str, fn) -> None:
+    pods = build_pods()
+    names = [p["metadata"]["name"] for p in pods]
+    with FakeApiServer(pods, [NAMESPACE]) as server:
+        k8s._session = k8s.KubeSession(server.kubeconfig())
+        k8s._informers.clear()
+        done = []
+        flipper = threading.Thread(target=make_ready, args=(server, names, done))
+        flipper.start()
+        fn(names)
+        finished = time.perf_counter()
+        flipper.join()
+        print(
+            f"{name:<24} requests={server.requests:<6} bytes={server.bytes_sent:<10} "
+            f"done {(finished - done[0]) * 1000:.0f}ms after the last pod was ready"
+        )
+
+
+def main():
+    print(f"{PODS} pods becoming ready over {READY_OVER_SECONDS:.0f}s")
+    measure("poll every pod (1s)", poll_each_pod)
+    measure("shared pod informer", informer)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+
+import os
+from pathlib import Path
+
+from test_base import TestBase
+
+from warnet.constants import BULK_MANAGED_BY, TANK_MISSION
+from warnet.k8s import get_mission
+from warnet.process import run_command
+
+
+class BulkDeployTest(TestBase):
+    def __init__(self):
+        super().__init__()
+        self.network_dir = Path(os.path.dirname(__file__)) / "data" / "ten_semi_unconnected"
+
+    def run_test(self):
+        try:
+            self.setup_network()
+            self.check_bulk_tanks()
+        finally:
+            self.cleanup()
+
+    def setup_network(self):
+        self.log.info("Setting up network with --bulk")
+        self.log.info(self.warnet(f"deploy {self.network_dir} --bulk"))
+        self.wait_for_all_tanks_status(target="running")
+        self.wait_for_all_edges()
+
+    def check_bulk_tanks(self):
+        self.log.info("Checking tanks were applied without helm releases")
+        tanks = get_mission(TANK_MISSION)
+        assert len(tanks) == 10, f"Expected 10 tanks, found {len(tanks)}"
+        for tank in tanks:
+            managed_by = tank.metadata.labels.get("app.kubernetes.io/managed-by")
+            assert managed_by == BULK_MANAGED_BY, f"{tank.metadata.name} managed by {managed_by}"
+        releases = run_command("helm list --short").split()
+        assert not [r for r in releases if r.startswith("tank-")], f"Helm releases: {releases}"
+
+
+if __name__ == "__main__":
+    test = BulkDeployTest()
+    test.run_test()
@@ -3,8 +3,11 @@
 import json
 import os
 import re
+import shutil
+import tempfile
 from pathlib import Path
 
+import yaml
 from test_base import TestBase
 
 from warnet.control import stop_scenario
@@ -21,6 +24,7 @@ class ConfTest(TestBase):
     def run_test(self):
         try:
             self.setup_network()
+            self.check_plan()
             self.check_uacomment()
             self.check_single_miner()
         finally:
@@ -31,6 +35,27 @@ class ConfTest(TestBase):
         self.log.info(self.warnet(f"deploy {self.network_dir}"))
         self.wait_for_all_tanks_status(target="running")
 
+    def check_plan(self):
+        self.log.info("Checking that an unchanged network has nothing to deploy")
+        plan = self.warnet(f"deploy {self.network_dir} --plan")
+        assert "0 to add, 0 to change, 0 to remove" in plan, plan
+
+        self.log.info("Checking that the plan finds a changed, a new and a removed tank")
+        with tempfile.TemporaryDirectory() as tmp:
+            directory = Path(tmp) / "network"
+            shutil.copytree(self.network_dir, directory)
+            network_file = directory / "network.yaml"
+            network = yaml.safe_load(network_file.read_text())
+            removed = network["nodes"].pop()["name"]
+            network["nodes"][0]["config"] = "uacomment=changed"
+            network["nodes"].append({"name": "tank-new"})
+            network_file.write_text(yaml.dump(network))
+            plan = self.warnet(f"deploy {directory} --plan")
+        assert "1 to add, 1 to change, 1 to remove" in plan, plan
+        assert f"~ {network['nodes'][0]['name']}" in plan, plan
+        assert "+ tank-new" in plan, plan
+        assert f"- {removed}" in plan, plan
+
     def check_uacomment(self):
         tanks = get_mission("tank")
 
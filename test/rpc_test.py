@@ -16,15 +16,19 @@ class RPCTest(TestBase):
         try:
             self.setup_network()
             self.test_rpc_commands()
+            self.test_rpc_all_tanks()
             self.test_transaction_propagation()
             self.test_message_exchange()
+            self.test_traffic_matrix()
             self.test_address_manager()
         finally:
             self.cleanup()
 
     def setup_network(self):
         self.log.info("Setting up network")
-        self.log.info(self.warnet(f"deploy {self.network_dir}"))
+        deploy_output = self.warnet(f"deploy {self.network_dir} --wait")
+        self.log.info(deploy_output)
+        assert "(12/12)" in deploy_output, "deploy --wait did not report every tank ready"
         self.wait_for_all_tanks_status(target="running")
         self.wait_for_all_edges()
 
@@ -35,6 +39,15 @@ class RPCTest(TestBase):
         self.warnet("bitcoin rpc tank-0001 -generate 101")
         self.wait_for_predicate(lambda: "101" in self.warnet("bitcoin rpc tank-0000 getblockcount"))
 
+    def test_rpc_all_tanks(self):
+        self.log.info("Testing RPC commands on all tanks")
+        lines = self.warnet("bitcoin rpc --all getblockcount , getnetworkinfo").splitlines()
+        records = [json.loads(line) for line in lines]
+        assert len(records) == 24, f"Expected 2 results from each of 12 tanks, got {len(records)}"
+        assert all(r["error"] is None for r in records), records
+        counts = [r["result"] for r in records if r["method"] == "getblockcount"]
+        assert counts == [101] * 12, f"Unexpected block counts: {counts}"
+
     def test_transaction_propagation(self):
         self.log.info("Testing transaction propagation")
         address = "bcrt1qthmht0k2qnh3wy7336z05lu2km7emzfpm3wg46"
@@ -53,6 +66,23 @@ class RPCTest(TestBase):
         msgs = self.warnet("bitcoin messages tank-0000 tank-0001")
         assert "verack" in msgs, "VERACK message not found in exchange"
 
+    def test_traffic_matrix(self):
+        self.log.info("Testing network-wide traffic summary")
+        summary = json.loads(self.warnet("bitcoin traffic --format json --group-by tank,msgtype"))
+        verack_tanks = {
+            tank
+            for tank, msgtype in zip(summary["tank"], summary["msgtype"])
+            if msgtype == "verack"
+        }
+        assert len(verack_tanks) == 12, f"Expected verack traffic on 12 tanks: {verack_tanks}"
+
+        # Drilling down into the cache must not need the cluster
+        inv = json.loads(
+            self.warnet("bitcoin traffic --offline --format json --tank tank-0000 --msgtype inv")
+        )
+        assert inv["msgtype"] and set(inv["msgtype"]) == {"inv"}, inv
+        assert all(tank.startswith("tank-0000.") for tank in inv["tank"]), inv
+
     def test_address_manager(self):
         self.log.info("Testing address manager")
 
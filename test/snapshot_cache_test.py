@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from time import sleep
+from urllib.error import HTTPError
+from urllib.parse import quote
+
+from test_base import TestBase
+
+SCRIPT = (
+    Path(os.path.dirname(__file__)).parent
+    / "resources"
+    / "images"
+    / "snapshot-cache"
+    / "snapshot-cache.py"
+)
+SNAPSHOT_SIZE = 8 << 20
+TANKS = 16
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def origin_key(url: str) -> str:
+    return hashlib.sha256(url.encode()).hexdigest()[:32]
+
+
+class SnapshotCacheTest(TestBase):
+    """Runs the snapshot cache server locally, in front of a `python -m http.server` origin"""
+
+    def __init__(self):
+        super().__init__()
+        self.network = False
+        self.origin_dir = self.tmpdir / "origin"
+        self.cache_dir = self.tmpdir / "cache"
+        self.origin_port = free_port()
+        self.cache_port = free_port()
+        self.origin_log = self.tmpdir / "origin.log"
+        self.processes = []
+
+    def run_test(self):
+        try:
+            self.setup_servers()
+            self.test_coalesced_fetch()
+            self.test_ranges()
+            self.test_bad_requests()
+            self.test_store()
+            self.test_stats()
+        finally:
+            for process in self.processes:
+                process.terminate()
+                process.wait()
+            self.cleanup()
+
+    def setup_servers(self):
+        self.log.info("Starting an origin and the snapshot cache")
+        self.origin_dir.mkdir()
+        self.snapshot = os.urandom(SNAPSHOT_SIZE)
+        (self.origin_dir / "snapshot.tar.gz").write_bytes(self.snapshot)
+        with self.origin_log.open("w") as log:
+            self.processes.append(
+                subprocess.Popen(
+                    [sys.executable, "-m", "http.server", str(self.origin_port)]
+                    + ["--bind", "127.0.0.1", "--directory", str(self.origin_dir)],
+                    stdout=log,
+                    stderr=log,
+                )
+            )
+        self.env = {**os.environ, "CACHE_DIR": str(self.cache_dir), "PORT": str(self.cache_port)}
+        self.processes.append(
+            subprocess.Popen(
+                [sys.executable, str(SCRIPT), "serve"],
+                env=self.env,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+        )
+        self.wait_for_predicate(lambda: self.get("/live")[0] == 200, timeout=30, interval=1)
+        origin = f"http://127.0.0.1:{self.origin_port}/"
+        self.wait_for_predicate(
+            lambda: urllib.request.urlopen(origin, timeout=5).status == 200, timeout=30, interval=1
+        )
+
+    def get(self, path: str, headers=None, method="GET") -> tuple[int, dict, bytes]:
+        url = f"http://127.0.0.1:{self.cache_port}{path}"
+        request = urllib.request.Request(url, headers=headers or {}, method=method)
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                return response.status, dict(response.headers), response.read()
+        except HTTPError as e:
+            return e.code, dict(e.headers), e.read()
+
+    def snapshot_path(self, name="snapshot.tar.gz", origin=None) -> str:
+        origin = origin or f"http://127.0.0.1:{self.origin_port}/{name}"
+        return f"/snapshots/{origin_key(origin)}/{name}?origin={quote(origin, safe='')}"
+
+    def origin_fetches(self, name: str) -> int:
+        sleep(0.5)  # http.server logs each request after responding
+        return sum(f"GET /{name} " in line for line in self.origin_log.read_text().splitlines())
+
+    def test_coalesced_fetch(self):
+        self.log.info("Testing that concurrent requests fetch from the origin once")
+        path = self.snapshot_path()
+        with ThreadPoolExecutor(TANKS) as pool:
+            results = list(pool.map(lambda _: self.get(path), range(TANKS)))
+        for status, _, body in results:
+            assert status == 200, status
+            assert body == self.snapshot, "cache served a different snapshot"
+        fetches = self.origin_fetches("snapshot.tar.gz")
+        assert fetches == 1, f"origin was fetched {fetches} times"
+
+        status, headers, body = self.get(path, method="HEAD")
+        assert status == 200 and body == b"", status
+        assert int(headers["Content-Length"]) == SNAPSHOT_SIZE, headers
+        assert self.origin_fetches("snapshot.tar.gz") == 1
+
+    def test_ranges(self):
+        self.log.info("Testing range requests")
+        path = self.snapshot_path()
+        for header, start, end in (
+            ("bytes=10-19", 10, 19),
+            ("bytes=100-", 100, SNAPSHOT_SIZE - 1),
+            ("bytes=-5", SNAPSHOT_SIZE - 5, SNAPSHOT_SIZE - 1),
+            (f"bytes=-{SNAPSHOT_SIZE + 1}", 0, SNAPSHOT_SIZE - 1),
+            (
+                f"bytes={SNAPSHOT_SIZE - 3}-{SNAPSHOT_SIZE + 100}",
+                SNAPSHOT_SIZE - 3,
+                SNAPSHOT_SIZE - 1,
+            ),
+        ):
+            status, headers, body = self.get(path, {"Range": header})
+            assert status == 206, f"{header}: {status}"
+            assert headers["Content-Range"] == f"bytes {start}-{end}/{SNAPSHOT_SIZE}", headers
+            assert body == self.snapshot[start : end + 1], f"{header}: wrong bytes"
+
+        for header in (f"bytes={SNAPSHOT_SIZE}-", "bytes=20-10"):
+            status, headers, body = self.get(path, {"Range": header})
+            assert status == 416, f"{header}: {status}"
+            assert headers["Content-Range"] == f"bytes */{SNAPSHOT_SIZE}", headers
+
+        # Multiple ranges aren't supported, so the whole snapshot is sent
+        status, _, body = self.get(path, {"Range": "bytes=0-1,5-6"})
+        assert status == 200 and body == self.snapshot, status
+
+    def test_bad_requests(self):
+        self.log.info("Testing requests the cache refuses")
+        origin = f"http://127.0.0.1:{self.origin_port}/snapshot.tar.gz"
+        other = f"http://127.0.0.1:{self.origin_port}/other.tar.gz"
+        mismatched = f"/snapshots/{origin_key(other)}/snapshot.tar.gz?origin={quote(origin)}"
+        assert self.get(mismatched)[0] == 400
+        assert self.get(f"/snapshots/{'0' * 32}/snapshot.tar.gz")[0] == 404
+        assert self.get("/snapshots/not-a-key/snapshot.tar.gz")[0] == 404
+        assert self.get("/elsewhere")[0] == 404
+        # An origin that fails is a bad gateway, and nothing is cached for it
+        missing = f"http://127.0.0.1:{self.origin_port}/missing.tar.gz"
+        status, _, _ = self.get(self.snapshot_path("missing.tar.gz", missing))
+        assert status == 502, status
+        assert not (self.cache_dir / origin_key(missing)).exists()
+        assert not list(self.cache_dir.glob(".*.part")), "a failed fetch left a partial file"
+
+    def test_store(self):
+        self.log.info("Testing snapshots uploaded with store")
+        key = "a" * 32
+        data = os.urandom(1 << 20)
+        result = subprocess.run(
+            [sys.executable, str(SCRIPT), "store", key],
+            input=data,
+            env=self.env,
+            capture_output=True,
+        )
+        assert result.returncode == 0, result.stderr
+        assert int(result.stdout) == len(data), result.stdout
+        status, _, body = self.get(f"/snapshots/{key}/local.tar")
+        assert status == 200 and body == data, status
+
+        result = subprocess.run(
+            [sys.executable, str(SCRIPT), "store", "not-a-key"], env=self.env, capture_output=True
+        )
+        assert result.returncode != 0, "store accepted a bad key"
+
+    def test_stats(self):
+        self.log.info("Testing the cache's stats")
+        result = subprocess.run(
+            [sys.executable, str(SCRIPT), "stats"], env=self.env, capture_output=True, text=True
+        )
+        assert result.returncode == 0, result.stderr
+        stats = json.loads(result.stdout)
+        self.log.info(stats)
+        key = origin_key(f"http://127.0.0.1:{self.origin_port}/snapshot.tar.gz")
+        snapshot = stats["snapshots"][key]
+        # The concurrent requests, HEAD, the ranges and the multi-range request
+        requests = TANKS + 1 + 7 + 1
+        assert snapshot["requests"] == requests, snapshot
+        assert snapshot["misses"] == 1, snapshot
+        assert snapshot["hits"] + snapshot["coalesced"] == requests - 1, snapshot
+        assert snapshot["origin_bytes"] == SNAPSHOT_SIZE, snapshot
+        assert stats["requests"] == requests + 1, stats
+        served = stats["hits"] + stats["coalesced"]
+        assert stats["hit_rate"] == served / (served + stats["misses"]), stats
+
+
+if __name__ == "__main__":
+    test = SnapshotCacheTest()
+    test.run_test()
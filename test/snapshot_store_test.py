@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import tarfile
+from pathlib import Path
+
+from test_base import TestBase
+
+from warnet.constants import TANK_MISSION
+from warnet.k8s import K8sError, get_mission
+from warnet.snapshot_store import SnapshotStore, snapshot_tanks_to_store
+
+CHUNK_SIZE = 1024
+
+
+class SnapshotStoreTest(TestBase):
+    def __init__(self):
+        super().__init__()
+        self.network_dir = Path(os.path.dirname(__file__)) / "data" / "12_node_ring"
+        self.store_dir = self.tmpdir / "snapshot-store"
+
+    def run_test(self):
+        try:
+            self.test_manifests()
+            self.test_restore_round_trip()
+            self.setup_network()
+            self.test_snapshot_into_store()
+            self.test_incremental_snapshot()
+        finally:
+            self.cleanup()
+
+    def store_files(self, store: SnapshotStore, files: dict[str, bytes]) -> list[dict]:
+        entries = []
+        for path, data in files.items():
+            chunks = [
+                [store.put_chunk(data[i : i + CHUNK_SIZE]), len(data[i : i + CHUNK_SIZE])]
+                for i in range(0, len(data), CHUNK_SIZE)
+            ]
+            entries.append({"path": path, "size": len(data), "mtime": 1, "chunks": chunks})
+        return entries
+
+    def manifest(self, tank: str, entries: list[dict], created: int = 1700000000) -> dict:
+        return {
+            "namespace": "default",
+            "tank": tank,
+            "chain": "regtest",
+            "created": created,
+            "filters": None,
+            "chunk_size": CHUNK_SIZE,
+            "dirs": sorted({str(Path(e["path"]).parent) for e in entries} - {"."}),
+            "files": entries,
+        }
+
+    def test_manifests(self):
+        self.log.info("Testing snapshot store manifests")
+        store = SnapshotStore(self.tmpdir / "local-store", CHUNK_SIZE)
+        data = os.urandom(3 * CHUNK_SIZE)
+        # The same chunks are stored once, however many files contain them
+        entries = self.store_files(store, {"a": data, "b": data, "c": data[:CHUNK_SIZE]})
+        assert store.usage() == (3, 3 * CHUNK_SIZE), store.usage()
+
+        first = store.save_manifest(self.manifest("tank-0000", entries[:1]))
+        second = store.save_manifest(self.manifest("tank-0000", entries))
+        assert second.name == f"{first.stem}-1.json", second
+        assert store.manifests("default", "tank-0000") == [first, second]
+        assert len(store.latest_manifest("default", "tank-0000")["files"]) == 3
+        later = store.save_manifest(self.manifest("tank-0000", entries[2:], 1700000001))
+        assert store.manifests("default", "tank-0000")[-1] == later
+        store.save_manifest(self.manifest("tank-0001", entries))
+        assert store.tanks() == [("default", "tank-0000"), ("default", "tank-0001")]
+        assert store.latest_manifest("default", "tank-0002") is None
+
+    def test_restore_round_trip(self):
+        self.log.info("Testing snapshot store restore")
+        store = SnapshotStore(self.tmpdir / "local-store", CHUNK_SIZE)
+        files = {
+            "blocks/blk00000.dat": os.urandom(5 * CHUNK_SIZE + 7),
+            "blocks/index/000003.ldb": os.urandom(CHUNK_SIZE),
+            "chainstate/CURRENT": b"MANIFEST-000002\n",
+            "empty": b"",
+        }
+        manifest = self.manifest("tank-0000", self.store_files(store, files))
+        for compression, mode in (("none", "r:"), ("gzip", "r:gz")):
+            out = self.tmpdir / f"restored-{compression}.tar"
+            store.restore(manifest, out, compression)
+            with tarfile.open(out, mode) as tar:
+                restored = {m.name: tar.extractfile(m).read() for m in tar if m.isfile()}
+                dirs = {m.name for m in tar if m.isdir()}
+            assert restored == files, f"{compression} restore differs"
+            assert dirs == {"blocks", "blocks/index", "chainstate"}, dirs
+
+        store.chunk_path(manifest["files"][0]["chunks"][0][0]).unlink()
+        try:
+            store.restore(manifest, self.tmpdir / "missing.tar")
+            raise AssertionError("Restoring with a missing chunk did not fail")
+        except K8sError:
+            pass
+        assert not (self.tmpdir / "missing.tar").exists()
+
+    def setup_network(self):
+        self.log.info("Setting up network")
+        self.log.info(self.warnet(f"deploy {self.network_dir}"))
+        self.wait_for_all_tanks_status(target="running")
+        self.wait_for_all_edges()
+        self.warnet("bitcoin rpc tank-0000 createwallet miner")
+        self.warnet("bitcoin rpc tank-0000 -generate 101")
+        self.wait_for_predicate(lambda: self.all_at_height(101))
+
+    def all_at_height(self, height: int) -> bool:
+        lines = self.warnet("bitcoin rpc --all getblockcount").splitlines()
+        return [json.loads(line)["result"] for line in lines] == [height] * 12
+
+    def snapshot_into_store(self) -> tuple[int, int]:
+        """Snapshot every tank's blocks into the store, returning the bytes in tanks and fetched"""
+        tanks = [
+            (tank.metadata.namespace, tank.metadata.name, tank.metadata.labels["chain"])
+            for tank in get_mission(TANK_MISSION)
+        ]
+        results = snapshot_tanks_to_store(SnapshotStore(self.store_dir), tanks, ["blocks"])
+        for result in results:
+            self.log.info(result)
+            assert result.error is None and result.manifest is not None, result
+        assert len(results) == 12, results
+        return sum(r.size for r in results), sum(r.fetched for r in results)
+
+    def test_snapshot_into_store(self):
+        self.log.info("Testing warnet snapshot --store")
+        size, fetched = self.snapshot_into_store()
+        # Every tank has the same blocks, so most are only fetched from one of them
+        assert fetched < size / 2, f"fetched {fetched} of {size} bytes"
+        _, stored = SnapshotStore(self.store_dir).usage()
+        assert stored < size / 2, f"stored {stored} of {size} bytes"
+
+        restored = self.tmpdir / "restored"
+        direct = self.tmpdir / "direct"
+        self.warnet(f"snapshot tank-0003 --store {self.store_dir} --restore -o {restored}")
+        self.warnet(f"snapshot tank-0003 --filter blocks -o {direct}")
+        blocks = {}
+        for directory in (restored, direct):
+            with tarfile.open(directory / "tank-0003_bitcoin_data.tar.gz") as tar:
+                blocks[directory] = tar.extractfile("blocks/blk00000.dat").read()
+        assert blocks[restored] == blocks[direct], "restored block file differs from the tank's"
+
+    def test_incremental_snapshot(self):
+        self.log.info("Testing an incremental snapshot into the store")
+        self.warnet("bitcoin rpc tank-0000 -generate 1")
+        self.wait_for_predicate(lambda: self.all_at_height(102))
+        size, fetched = self.snapshot_into_store()
+        assert fetched < size / 4, f"fetched {fetched} of {size} bytes"
+        store = SnapshotStore(self.store_dir)
+        for namespace, tank in store.tanks():
+            assert len(store.manifests(namespace, tank)) == 2, tank
+
+
+if __name__ == "__main__":
+    test = SnapshotStoreTest()
+    test.run_test()
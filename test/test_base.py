@@ -10,10 +10,10 @@ from tempfile import mkdtemp
 from time import sleep
 
 from warnet import SRC_DIR
-from warnet.k8s import get_pod_exit_status
+from warnet.constants import TANK_MISSION
+from warnet.k8s import get_pod_exit_status, get_pod_informer
 from warnet.network import _connected as network_connected
 from warnet.status import _get_deployed_scenarios as scenarios_deployed
-from warnet.status import _get_tank_status as network_status
 
 
 class TestBase:
@@ -46,7 +46,7 @@ class TestBase:
             self.log.info("Stopping network")
             if self.network:
                 self.warnet("down --force")
-                self.wait_for_all_tanks_status(target="stopped", timeout=60, interval=1)
+                self.wait_for_all_tanks_status(target="stopped", timeout=60)
         except Exception as e:
             self.log.error(f"Error bringing network down: {e}")
         finally:
@@ -99,25 +99,30 @@ class TestBase:
         # TODO
         return None
 
-    def wait_for_all_tanks_status(self, target="running", timeout=20 * 60, interval=5):
-        """Poll the warnet server for container status
-        Block until all tanks are running
+    def wait_for_all_tanks_status(self, target="running", timeout=20 * 60):
+        """Watch tank pods in all namespaces
+        Block until all tanks reach `target` (or are all gone)
         """
+        informer = get_pod_informer(label_selector=f"mission={TANK_MISSION}")
+        last_stats = None
 
-        def check_status():
-            tanks = network_status()
+        def check_status(tanks):
+            nonlocal last_stats
             stats = {"total": 0}
             # "Probably" means all tanks are stopped and deleted
             if len(tanks) == 0:
                 return True
             for tank in tanks:
-                status = tank["status"]
+                status = tank.status.phase.lower()
                 stats["total"] += 1
                 stats[status] = stats.get(status, 0) + 1
-            self.log.info(f"Waiting for all tanks to reach '{target}': {stats}")
+            if stats != last_stats:
+                self.log.info(f"Waiting for all tanks to reach '{target}': {stats}")
+                last_stats = stats
             return target in stats and stats[target] == stats["total"]
 
-        self.wait_for_predicate(check_status, timeout, interval)
+        if not informer.wait_for(check_status, timeout):
+            raise Exception(f"Timed out waiting for all tanks to reach '{target}': {last_stats}")
 
     def wait_for_all_edges(self, timeout=20 * 60, interval=5):
         """Ensure all tanks have all the connections they are supposed to have